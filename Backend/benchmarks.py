@@ -0,0 +1,226 @@
+# benchmarks for the hot paths in main.py, run from Backend with `python benchmarks.py <command>` (--help lists them).
+# they only use synthetic data and demo databases, never MySQL
+import gzip
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime, date, timedelta
+
+import brotli
+import click
+import pytz
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+os.environ["MATERIALISE_INTERVAL"] = "0" # no scheduled MySQL materialisation while benchmarking
+
+from main import (app, format_reports, dict_factory_with_datetime, get_time_formatter, get_demo_db_pool, dispose_demo_db_pool,
+                  JSON_PROVIDERS, COMPRESS_LEVEL, COMPRESS_BR_LEVEL, FRONTEND_URL)
+
+@click.group()
+def cli():
+    pass
+
+class RecordingJSONProvider(DefaultJSONProvider):
+    """Keep the objects a view serialises so that the json benchmark can replay real payloads"""
+    def __init__(self, app):
+        super().__init__(app)
+        self.payloads = []
+
+    def response(self, *args, **kwargs):
+        self.payloads.append(self._prepare_response_obj(args, kwargs))
+        return super().response(*args, **kwargs)
+
+@cli.command("json")
+@click.option("--repeat", default=5, show_default=True, help="How many times each payload is serialised per provider")
+def benchmark_json_command(repeat):
+    """Compare serialisation time and bytes on the wire for the largest demo responses"""
+    paths = [
+        "/demo/lessons/admin?start=2025-02-01T00:00:00.000Z&end=2026-03-01T00:00:00.000Z",
+        "/demo/reports/admin",
+        "/demo/invoices/admin"
+    ]
+    providers = {name: provider(app) for name, provider in JSON_PROVIDERS.items()}
+    original_provider = app.json
+    app.json = RecordingJSONProvider(app)
+    try:
+        for path in paths:
+            with app.test_request_context(path, headers={"X-Timezone": "Europe/London"}):
+                app.view_functions[request.endpoint](**request.view_args)
+            payload = app.json.payloads.pop()
+
+            click.echo(path)
+            for name, provider in providers.items():
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    body = provider.response(payload).get_data()
+                elapsed = (time.perf_counter() - start) / repeat
+                click.echo(f"  {name:8} {elapsed * 1000:8.1f}ms {len(body):>10,} bytes")
+
+            start = time.perf_counter()
+            gzip_size = len(gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+            gzip_elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            br_size = len(brotli.compress(body, quality=COMPRESS_BR_LEVEL))
+            br_elapsed = time.perf_counter() - start
+            click.echo(f"  gzip -{COMPRESS_LEVEL}  {gzip_elapsed * 1000:8.1f}ms {gzip_size:>10,} bytes")
+            click.echo(f"  br -{COMPRESS_BR_LEVEL}    {br_elapsed * 1000:8.1f}ms {br_size:>10,} bytes")
+    finally:
+        app.json = original_provider
+
+@cli.command("reschedule")
+@click.option("--days", default=365, show_default=True, help="Length of the daily series, all of it in the past so every occurrence is stored")
+def benchmark_reschedule_command(days):
+    """Time changing the time of a daily series through PUT /lessons/<id> and shifting it through /reschedule, on a demo database"""
+    client = app.test_client()
+    headers = {"Origin": FRONTEND_URL}
+    db_id = uuid.uuid4().hex
+    with client.session_transaction() as client_session:
+        client_session["demo_db_id"] = db_id
+
+    def fetch_one(query, parameters=()):
+        connection = get_demo_db_pool(db_id).acquire()
+        try:
+            return connection.cursor().execute(query, parameters).fetchone()
+        finally:
+            connection.close()
+
+    try:
+        lesson = fetch_one("SELECT tutor_id, student_id, subject_id, location_id FROM Lessons ORDER BY id LIMIT 1")
+        first_day = datetime.combine(date.today() - timedelta(days=days), datetime.min.time())
+        response = client.post("/demo/lessons", headers=headers, json={
+            **lesson,
+            'title': "Benchmark",
+            'description': "",
+            'start_time': (first_day + timedelta(hours=16)).strftime("%Y-%m-%dT%H:%M:%S"),
+            'end_time': (first_day + timedelta(hours=17)).strftime("%Y-%m-%dT%H:%M:%S"),
+            'recurrence_rule': f"FREQ=daily;INTERVAL=1;UNTIL={(first_day + timedelta(days=days - 1)).strftime('%Y-%m-%d %H:%M:%S')}"
+        })
+        if response.status_code != 200:
+            click.echo(f"Could not add the series: {response.get_json()}")
+            return
+        lesson_id = fetch_one("SELECT MAX(id) AS id FROM Lessons")['id']
+        occurrence = fetch_one("SELECT MIN(id) AS id, COUNT(*) AS count FROM LessonOccurrences WHERE lesson_id = ?", (lesson_id,))
+        click.echo(f"Daily series of {occurrence['count']} stored occurrences")
+
+        requests_to_time = [
+            ("time change", f"/demo/lessons/{lesson_id}", {
+                'lesson_occurrence_id': occurrence['id'],
+                'update_type': "MODIFY",
+                'start_time': (first_day + timedelta(hours=9, minutes=30)).strftime("%Y-%m-%dT%H:%M:%S"),
+                'end_time': (first_day + timedelta(hours=10, minutes=45)).strftime("%Y-%m-%dT%H:%M:%S")
+            }),
+            ("shift", f"/demo/lessons/{lesson_id}/reschedule", {'shift_minutes': 30}),
+            ("shift past midnight", f"/demo/lessons/{lesson_id}/reschedule", {'shift_minutes': 15 * 60})
+        ]
+        for name, path, body in requests_to_time:
+            start = time.perf_counter()
+            response = client.put(path, headers=headers, json=body)
+            elapsed = time.perf_counter() - start
+            click.echo(f"  {name:20} {elapsed * 1000:8.1f}ms {response.status_code} {response.get_json()}")
+    finally:
+        dispose_demo_db_pool(db_id)
+
+@cli.command("datetime-format")
+@click.option("--count", default=100000, show_default=True, help="Number of datetimes to format")
+@click.option("--timezone", default="Europe/London", show_default=True)
+def benchmark_datetime_format_command(count, timezone):
+    """Time formatting a calendar-sized column of datetimes one at a time through pytz and in one format_column batch"""
+    # one lesson every 15 minutes between 08:00 and 20:00, running across DST changes
+    times = [datetime(2025, 1, 6, 8) + timedelta(days=index // 48, minutes=index % 48 * 15) for index in range(count)]
+    formats = {'date_short': "%d/%m/%Y", 'time_short': "%H:%M"}
+
+    start = time.perf_counter()
+    per_value = []
+    for value in times:
+        local = pytz.utc.localize(value).astimezone(pytz.timezone(timezone))
+        per_value.append(tuple(local.strftime(strftime_format) for strftime_format in formats.values()))
+    per_value_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = get_time_formatter(timezone).format_column(times, *formats)
+    batched_elapsed = time.perf_counter() - start
+
+    click.echo(f"per value {count:>9,} datetimes {per_value_elapsed * 1000:9.1f}ms")
+    click.echo(f"batched   {count:>9,} datetimes {batched_elapsed * 1000:9.1f}ms")
+    click.echo(f"output {'matches' if per_value == batched else 'differs'}")
+
+@cli.command("row-factory")
+@click.option("--rows", default=25000, show_default=True, help="Number of report-like rows to fetch")
+@click.option("--repeat", default=3, show_default=True, help="How many fetches per row factory (the fastest is reported)")
+def benchmark_row_factory_command(rows, repeat):
+    """Time fetching report-like rows from SQLite as raw tuples and through the demo row factory"""
+    connection = sqlite3.connect(":memory:")
+    connection.execute("""
+        CREATE TABLE BenchmarkReports (id INTEGER, student_name TEXT, tutor_name TEXT, address TEXT, answer_text TEXT,
+            status TEXT, week TEXT, start_time TEXT, end_time TEXT, actual_start_time TEXT)""")
+    start_time = datetime(2025, 1, 6, 15)
+    connection.executemany("INSERT INTO BenchmarkReports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        (index, f"Student {index % 250}", f"Tutor {index % 20}", f"{index % 90} High Street, London",
+         "Worked through fractions and finished the practice sheet", "submitted" if index % 3 else "empty",
+         str((start_time + timedelta(weeks=index // 500)).date()),
+         str(start_time + timedelta(weeks=index // 500, minutes=index % 500)),
+         str(start_time + timedelta(weeks=index // 500, minutes=index % 500 + 60)), None)
+        for index in range(rows)])
+    try:
+        for name, row_factory in (("tuples", None), ("dicts", dict_factory_with_datetime)):
+            connection.row_factory = row_factory
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                connection.execute("SELECT * FROM BenchmarkReports").fetchall()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            click.echo(f"{name:8} {rows:>9,} rows {best * 1000:9.1f}ms")
+    finally:
+        connection.close()
+
+def make_benchmark_reports(count):
+    """Synthetic /reports/admin rows: 100 reports per student, two lessons a week, on one invoice per tutor per week"""
+    students = max(1, count // 100)
+    attendance = [("present", None), ("absent", "I"), ("disrupted", "L"), (None, None)]
+    reports = []
+    for index in range(count):
+        student_id = index % students + 1
+        lesson = index // students
+        week = lesson // 2
+        start_time = datetime(2025, 1, 6, 15) + timedelta(weeks=week, days=lesson % 2 * 2, minutes=student_id % 8 * 15)
+        attendance_status, attendance_code = attendance[index % len(attendance)]
+        reports.append({
+            'id': index + 1,
+            'invoice_id': week * 20 + student_id % 20 + 1,
+            'week': (start_time - timedelta(days=start_time.weekday())).date(),
+            'start_time': start_time,
+            'end_time': start_time + timedelta(hours=1),
+            'actual_start_time': None,
+            'actual_end_time': None,
+            'student_id': student_id,
+            'student_name': f"Student {student_id}",
+            'tutor_name': f"Tutor {student_id % 20 + 1}",
+            'status': "submitted" if index % 3 else "empty",
+            'attendance_status': attendance_status,
+            'attendance_code': attendance_code,
+            'safeguarding_concern': index % 50 == 0
+        })
+    return reports
+
+@cli.command("reports")
+@click.option("--size", "sizes", multiple=True, type=int, default=[1000, 10000, 100000], show_default=True, help="Number of reports to group (repeatable)")
+@click.option("--repeat", default=3, show_default=True, help="How many runs per size (the fastest is reported)")
+@click.option("--timezone", default="Europe/London", show_default=True)
+def benchmark_reports_command(sizes, repeat, timezone):
+    """Time format_reports on synthetic reports, to check the weekly grouping stays linear"""
+    for size in sizes:
+        reports = make_benchmark_reports(size)
+        best = None
+        for _ in range(repeat):
+            rows = [dict(report) for report in reports] # format_reports adds keys to the rows it is given
+            start = time.perf_counter()
+            formatted = format_reports(rows, timezone)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        click.echo(f"{size:>9,} reports {len(formatted['weekly']):>8,} weekly {best * 1000:9.1f}ms {best / size * 1000000:7.2f}us/report")
+
+if __name__ == "__main__":
+    cli()
@@ -1,21 +1,33 @@
-from flask import Flask, jsonify, request, send_file, session
+from flask import Flask, jsonify, request, send_file, session, make_response
+from flask.json.provider import JSONProvider, DefaultJSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
+import orjson
 import requests
 import mysql.connector
-import io, zipfile, os
+import io, zipfile, os, decimal, socket, csv
 from dotenv import load_dotenv
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 import bcrypt
+import click
 from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, verify_jwt_in_request, get_jwt_identity
 from datetime import timedelta
 import pytz
 import json
 import tempfile
 import uuid
-import shutil
 import sqlite3
-from functools import wraps
+import threading
+import time
+import queue
+import bisect
+import weakref
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from functools import wraps, lru_cache
+from pdf_layouts import PdfLayout, layout_report_pdf, layout_invoice_pdf, layout_timetable_pdf, layout_attendance_report_pdf
 
 load_dotenv()
 
@@ -29,11 +41,110 @@ JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
 FLASK_SECRET_KEY = os.getenv('FLASK_SECRET_KEY')
 DPDF_API_KEY=os.getenv('DPDF_API_KEY')
 SEED_DB_PATH = "demo_data.db"
+MATERIALISE_HORIZON_DAYS = int(os.getenv('MATERIALISE_HORIZON_DAYS', 180))  # how far ahead recurring lessons are stored. invoices, reports and timetables read stored occurrences only, so keep it past the weeks they show
+MATERIALISE_INTERVAL = int(os.getenv('MATERIALISE_INTERVAL', 3600))  # seconds between scheduled runs (0 disables the schedule)
 TEMP_DIR = tempfile.gettempdir()
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', 16))  # request threads per worker (the Dockerfile passes the same variable to gunicorn)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))  # at least GUNICORN_THREADS - EVENTS_MAX_STREAMS, as event streams hold a thread but no connection
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # seconds before a connection is replaced (Cloud SQL drops idle connections)
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DEMO_DB_PREWARM = int(os.getenv('DEMO_DB_PREWARM', 2))  # in-memory clones of the demo seed kept ready for new sessions (0 clones on demand)
+DEMO_DB_TTL = int(os.getenv('DEMO_DB_TTL', 3600))  # seconds an unused demo database is kept before it is dropped
+DEMO_DB_MAX_BYTES = int(os.getenv('DEMO_DB_MAX_BYTES', 256 * 1024 * 1024))  # total size of demo databases before the least recently used are dropped
+DEMO_DB_REAP_INTERVAL = int(os.getenv('DEMO_DB_REAP_INTERVAL', 60))  # seconds between reaper runs
+REPORT_QUESTIONS_CACHE_TTL = int(os.getenv('REPORT_QUESTIONS_CACHE_TTL', 300))  # seconds the report question set is cached for
+ETAG_TTL = float(os.getenv('ETAG_TTL', 60))  # seconds an ETag stays valid without a local write (writes made by other instances and time-based invoice statuses show up after this)
+LESSON_CHANGES_SETTLE = int(os.getenv('LESSON_CHANGES_SETTLE', 10))  # seconds before a logged change is covered by a sync cursor (newer ones are sent again, in case an earlier write is still committing)
+LESSON_CHANGES_RETENTION_DAYS = int(os.getenv('LESSON_CHANGES_RETENTION_DAYS', 30))  # clients with an older cursor are told to refetch everything
+LESSON_CHANGES_LIMIT = int(os.getenv('LESSON_CHANGES_LIMIT', 5000))  # changes in one sync beyond which a full refetch is cheaper
+CLASH_SERIES_HORIZON_DAYS = int(os.getenv('CLASH_SERIES_HORIZON_DAYS', 365))  # how far ahead an open-ended proposed series is checked for clashes
+PDF_RENDERER = os.getenv('PDF_RENDERER', 'dpdf')  # "dpdf" for the DynamicPDF API, "local" to lay PDFs out in-process, "stub" for an offline placeholder
+PDF_RENDER_TIMEOUT = float(os.getenv('PDF_RENDER_TIMEOUT', 60))  # seconds to wait for the DynamicPDF API
+PDF_RENDER_CONCURRENCY = int(os.getenv('PDF_RENDER_CONCURRENCY', 8))  # documents rendered at once when a request produces several
+PDF_STUB_DELAY = float(os.getenv('PDF_STUB_DELAY', 0))  # seconds the stub renderer sleeps per document, to imitate API latency
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(TEMP_DIR, "educatch-pdf-cache"))
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # least recently used PDFs are evicted past this size (0 disables the cache)
+PDF_JOB_WORKERS = int(os.getenv('PDF_JOB_WORKERS', 4))
+PDF_JOB_QUEUE_LIMIT = int(os.getenv('PDF_JOB_QUEUE_LIMIT', 100))  # unfinished jobs allowed before new ones are rejected
+PDF_JOB_TTL = int(os.getenv('PDF_JOB_TTL', 600))  # seconds a finished job (and its PDF) is kept for download
+PDF_JOB_MAX_WAIT = float(os.getenv('PDF_JOB_MAX_WAIT', 30))  # longest a status request may block with ?wait=
+PDF_JOB_MAX_WAITERS = int(os.getenv('PDF_JOB_MAX_WAITERS', 4))  # status requests blocking with ?wait= at once per process (each holds a gunicorn thread)
+PDF_JOB_POLL_INTERVAL = float(os.getenv('PDF_JOB_POLL_INTERVAL', 1))  # seconds between checks for jobs rendered by another instance
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', 'local')  # "local" notifies the event streams of this process, "socket" also those of sibling gunicorn workers
+EVENTS_SOCKET_DIR = os.getenv('EVENTS_SOCKET_DIR', os.path.join(TEMP_DIR, "educatch-events"))  # where each worker binds its datagram socket for the "socket" broker
+EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', 8))  # open event streams per process (each one holds a gunicorn thread, so keep it below GUNICORN_THREADS)
+EVENTS_STREAM_TTL = int(os.getenv('EVENTS_STREAM_TTL', 300))  # seconds before a stream is closed and the browser reconnects, so threads are handed back
+EVENTS_KEEPALIVE = int(os.getenv('EVENTS_KEEPALIVE', 15))  # seconds between comments on an idle stream, so proxies keep it open and closed tabs are noticed
+JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson')  # "orjson" for the fast serialiser, "flask" for Flask's own json module
+COMPRESS_ALGORITHM = os.getenv('COMPRESS_ALGORITHM', 'br,gzip')  # content codings offered, in order of preference
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))  # bytes below which responses are sent uncompressed
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))  # gzip level
+COMPRESS_BR_LEVEL = int(os.getenv('COMPRESS_BR_LEVEL', 4))  # brotli quality (higher levels cost far more CPU on multi-megabyte bodies)
 
 app = Flask(__name__)
 
-CORS(app, origins=[FRONTEND_URL, FRONTEND_URL_DEMO], supports_credentials=True, expose_headers=["Content-Disposition"])
+# every thread that isn't holding an event stream may want a connection at the same time
+if DB_POOL_SIZE < GUNICORN_THREADS - EVENTS_MAX_STREAMS:
+    app.logger.warning(f"DB_POOL_SIZE ({DB_POOL_SIZE}) is below GUNICORN_THREADS - EVENTS_MAX_STREAMS ({GUNICORN_THREADS - EVENTS_MAX_STREAMS}), so requests may wait for a connection under load")
+if EVENTS_MAX_STREAMS >= GUNICORN_THREADS:
+    app.logger.warning(f"EVENTS_MAX_STREAMS ({EVENTS_MAX_STREAMS}) leaves none of the {GUNICORN_THREADS} GUNICORN_THREADS free for other requests")
+
+CORS(app, origins=[FRONTEND_URL, FRONTEND_URL_DEMO], supports_credentials=True, expose_headers=["Content-Disposition", "ETag"])
+
+HTTP_DATE_DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+HTTP_DATE_MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+def format_http_date(value):
+    """Same output as werkzeug's http_date (naive values are taken as UTC) without going through email.utils"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(pytz.utc)
+    else:
+        value = datetime(value.year, value.month, value.day)
+    return (f"{HTTP_DATE_DAYS[value.weekday()]}, {value.day:02d} {HTTP_DATE_MONTHS[value.month - 1]} {value.year:04d} "
+            f"{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT")
+
+class OrjsonJSONProvider(JSONProvider):
+    """Serialise with orjson, writing the same documents as Flask's default provider (sorted keys, HTTP dates, decimals as strings)"""
+    option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    @staticmethod
+    def default(o):
+        # datetimes are passed through so that they keep the RFC 822 format the frontend already parses
+        if isinstance(o, date):
+            return format_http_date(o)
+        if isinstance(o, decimal.Decimal):
+            return str(o)
+        if hasattr(o, "__html__"):
+            return str(o.__html__())
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+    def encode(self, obj):
+        return orjson.dumps(obj, default=self.default, option=self.option | (orjson.OPT_INDENT_2 if self._app.debug else 0))
+
+    def dumps(self, obj, **kwargs):
+        return self.encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.encode(obj) + b"\n", mimetype="application/json")
+
+JSON_PROVIDERS = {
+    "flask": DefaultJSONProvider,
+    "orjson": OrjsonJSONProvider
+}
+
+app.json = JSON_PROVIDERS[JSON_PROVIDER](app)
+
+app.config['COMPRESS_ALGORITHM'] = [algorithm.strip() for algorithm in COMPRESS_ALGORITHM.split(",") if algorithm.strip()]
+app.config['COMPRESS_MIN_SIZE'] = COMPRESS_MIN_SIZE
+app.config['COMPRESS_LEVEL'] = COMPRESS_LEVEL
+app.config['COMPRESS_BR_LEVEL'] = COMPRESS_BR_LEVEL
+Compress(app)
 
 def jwt_required_if_not_demo(refresh=False):
     def decorator(fn):
@@ -45,6 +156,31 @@ def jwt_required_if_not_demo(refresh=False):
         return wrapper
     return decorator
 
+def get_current_user_role():
+    """Role of the user the verified JWT belongs to, or None if they no longer exist"""
+    connection = get_db_connection()
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    try:
+        cursor.execute(f"SELECT role FROM Users WHERE email = {placeholder}", (get_jwt_identity(),))
+        user = cursor.fetchone()
+    finally:
+        cursor.close()
+        connection.close()
+    return user['role'] if user else None
+
+def admin_required_if_not_demo():
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not request.path.startswith("/demo/"):
+                verify_jwt_in_request()
+                if get_current_user_role() != 'admin':
+                    return jsonify({'error': 'Only admins can access this'}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
 @app.before_request
 def allow_only_specific_url():
     origin = request.headers.get('Origin', '')
@@ -57,61 +193,646 @@ app.secret_key = FLASK_SECRET_KEY
 
 jwt = JWTManager(app)
 
-def get_demo_db_path():
-    if "demo_db_path" not in session:
-        db_copy_path = os.path.join(TEMP_DIR, f"demo_{uuid.uuid4().hex}.db")
-        shutil.copy(SEED_DB_PATH, db_copy_path)
-        session["demo_db_path"] = db_copy_path
-    return session["demo_db_path"]
+class PoolTimeoutError(Exception):
+    pass
+
+class DemoDatabaseDisposedError(Exception):
+    pass
+
+class PooledConnection:
+    """Wrap a pooled connection so that close() returns it to the pool instead of disconnecting"""
+    def __init__(self, pool, connection, created_at):
+        self.pool = pool
+        self.connection = connection
+        self.created_at = created_at
+        self.closed = False
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.pool.release(self.connection, self.created_at)
+
+class ConnectionPool:
+    def __init__(self, connect, ping, size, timeout=DB_POOL_TIMEOUT, recycle=DB_POOL_RECYCLE, pre_ping=DB_POOL_PRE_PING):
+        self.connect = connect
+        self.ping = ping
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.idle = [] # (connection, created_at) pairs, most recently returned last
+        self.open_count = 0 # idle + checked out
+        self.disposed = False
+        self.condition = threading.Condition()
+        self.counters = {"checkouts": 0, "waits": 0, "timeouts": 0, "connects": 0, "recycled": 0, "failed_pings": 0}
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            self.counters["checkouts"] += 1
+            waited = False
+            while not self.idle and self.open_count >= self.size:
+                if not waited:
+                    self.counters["waits"] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout}s (pool size {self.size})")
+                self.condition.wait(remaining)
+
+            if self.idle:
+                connection, created_at = self.idle.pop()
+            else:
+                connection, created_at = None, None
+                self.open_count += 1 # reserve the slot before connecting outside the lock
+
+        try:
+            if connection is not None and time.monotonic() - created_at > self.recycle:
+                self.close_quietly(connection)
+                connection = None
+                with self.condition:
+                    self.counters["recycled"] += 1
+            elif connection is not None and self.pre_ping and not self.is_alive(connection):
+                self.close_quietly(connection)
+                connection = None
+                with self.condition:
+                    self.counters["failed_pings"] += 1
+
+            if connection is None:
+                connection = self.connect()
+                created_at = time.monotonic()
+                with self.condition:
+                    self.counters["connects"] += 1
+        except Exception:
+            self.discard()
+            raise
+
+        return PooledConnection(self, connection, created_at)
+
+    def release(self, connection, created_at):
+        try:
+            connection.rollback() # never hand over a connection with an open transaction (or a stale read snapshot)
+        except Exception:
+            self.close_quietly(connection)
+            self.discard()
+            return
+
+        with self.condition:
+            if self.disposed:
+                self.open_count -= 1
+            else:
+                self.idle.append((connection, created_at))
+                self.condition.notify()
+                return
+        self.close_quietly(connection)
+
+    def discard(self):
+        with self.condition:
+            self.open_count -= 1
+            self.condition.notify()
+
+    def dispose(self):
+        with self.condition:
+            self.disposed = True
+            idle, self.idle = self.idle, []
+            self.open_count -= len(idle)
+        for connection, _ in idle:
+            self.close_quietly(connection)
+
+    def is_alive(self, connection):
+        try:
+            self.ping(connection)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self.condition:
+            return {
+                **self.counters,
+                "size": self.size,
+                "open": self.open_count,
+                "idle": len(self.idle),
+                "in_use": self.open_count - len(self.idle)
+            }
+
+class DemoDatabase:
+    """An in-memory demo database; its one connection is lent to a single request (or the materialiser) at a time"""
+    def __init__(self, connection, db_id, timeout=DB_POOL_TIMEOUT):
+        self.connection = connection
+        self.db_id = db_id
+        self.timeout = timeout
+        self.in_use = False
+        self.disposed = False
+        self.last_used = time.monotonic()
+        self.size = self.measure()
+        self.condition = threading.Condition()
+        self.counters = {"checkouts": 0, "waits": 0, "timeouts": 0}
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            self.counters["checkouts"] += 1
+            waited = False
+            while self.in_use and not self.disposed:
+                if not waited:
+                    self.counters["waits"] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeoutError(f"Demo database still in use after {self.timeout}s")
+                self.condition.wait(remaining)
+            if self.disposed: # reaped or reset since it was looked up, so its connection is (about to be) closed
+                raise DemoDatabaseDisposedError(f"Demo database {self.db_id} has been disposed")
+            self.in_use = True
+            self.last_used = time.monotonic()
+        return PooledConnection(self, self.connection, None)
+
+    def measure(self):
+        # bytes held by the database, refreshed each time a request hands the connection back
+        try:
+            return self.connection.execute("SELECT page_count * page_size AS size FROM pragma_page_count(), pragma_page_size()").fetchone()['size']
+        except Exception:
+            return 0
+
+    def release(self, connection, created_at):
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+        size = self.measure()
+        with self.condition:
+            self.in_use = False
+            self.size = size
+            self.last_used = time.monotonic()
+            close_now = self.disposed
+            self.condition.notify()
+        if close_now:
+            ConnectionPool.close_quietly(connection)
+
+    def dispose(self):
+        # the data only lives in the connection, so it is closed once the current request is done with it
+        with self.condition:
+            self.disposed = True
+            close_now = not self.in_use
+            self.condition.notify_all() # waiters give up rather than wait for a connection that is going away
+        if close_now:
+            ConnectionPool.close_quietly(self.connection)
+
+    def stats(self):
+        with self.condition:
+            return {
+                **self.counters,
+                "size": 1,
+                "in_use": int(self.in_use)
+            }
+
+db_pool = None
+demo_db_pools = {} # demo database id -> DemoDatabase
+db_pools_lock = threading.Lock()
+demo_db_counters = {"created": 0, "recreated": 0, "expired": 0, "evicted": 0}
+demo_db_dropped_ids = OrderedDict() # recently reaped ids, to count sessions that come back afterwards
+
+def ping_mysql(connection):
+    connection.ping(reconnect=False)
+
+def get_mysql_db_pool():
+    global db_pool
+    with db_pools_lock:
+        if db_pool is None:
+            db_pool = ConnectionPool(
+                connect=lambda: mysql.connector.connect(
+                    host=DB_HOST,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    database=DB_NAME,
+                    autocommit=False # every write route commits (or rolls back) its statements as one transaction
+                ),
+                ping=ping_mysql,
+                size=DB_POOL_SIZE
+            )
+        return db_pool
+
+demo_seed_connection = None # the seed database loaded into memory, which every demo database is cloned from
+demo_seed_lock = threading.Lock()
+demo_db_spares = queue.Queue() # pre-warmed clones waiting for new sessions
+demo_db_warmer_event = threading.Event()
+demo_db_warmer_thread = None
+
+def clone_demo_seed():
+    global demo_seed_connection
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    with demo_seed_lock:
+        if demo_seed_connection is None:
+            seed_file = sqlite3.connect(SEED_DB_PATH)
+            try:
+                demo_seed_connection = sqlite3.connect(":memory:", check_same_thread=False)
+                seed_file.backup(demo_seed_connection)
+            finally:
+                seed_file.close()
+        demo_seed_connection.backup(connection)
+    connection.row_factory = dict_factory_with_datetime
+    return connection
+
+def demo_db_warmer():
+    while True:
+        demo_db_warmer_event.clear()
+        try:
+            while demo_db_spares.qsize() < DEMO_DB_PREWARM:
+                demo_db_spares.put(clone_demo_seed())
+        except Exception as e:
+            app.logger.error(f"Pre-warming demo databases failed: {e}")
+        demo_db_warmer_event.wait()
+
+def start_demo_db_warmer():
+    global demo_db_warmer_thread
+    with demo_seed_lock:
+        if demo_db_warmer_thread is None and DEMO_DB_PREWARM > 0:
+            demo_db_warmer_thread = threading.Thread(target=demo_db_warmer, daemon=True)
+            demo_db_warmer_thread.start()
+
+def take_demo_db_clone():
+    start_demo_db_warmer()
+    try:
+        connection = demo_db_spares.get_nowait()
+    except queue.Empty:
+        connection = clone_demo_seed()
+    demo_db_warmer_event.set() # top the spares back up
+    return connection
+
+def get_demo_db_pool(db_id):
+    with db_pools_lock:
+        if db_id in demo_db_pools:
+            return demo_db_pools[db_id]
+
+    # first request for this session in this process (or after a restart or the reaper): give it a fresh copy of the seed
+    start_demo_db_reaper()
+    database = DemoDatabase(take_demo_db_clone(), db_id)
+    with db_pools_lock:
+        existing = demo_db_pools.setdefault(db_id, database)
+        if existing is database:
+            demo_db_counters["created"] += 1
+            if demo_db_dropped_ids.pop(db_id, None):
+                demo_db_counters["recreated"] += 1
+    if existing is not database:
+        database.dispose()
+        return existing
+
+    reap_demo_dbs() # keep within the memory budget when sessions arrive faster than the reaper runs
+    return database
+
+def dispose_demo_db_pool(db_id):
+    with db_pools_lock:
+        database = demo_db_pools.pop(db_id, None)
+    if database:
+        database.dispose()
+
+def reap_demo_dbs():
+    """Drop demo databases unused for DEMO_DB_TTL, then the least recently used until they fit in DEMO_DB_MAX_BYTES"""
+    now = time.monotonic()
+    with db_pools_lock:
+        databases = sorted(demo_db_pools.items(), key=lambda item: item[1].last_used)
+    total = sum(database.size for _, database in databases)
+
+    dropped = []
+    for db_id, database in databases:
+        if now - database.last_used > DEMO_DB_TTL:
+            reason = "expired"
+        elif total > DEMO_DB_MAX_BYTES:
+            reason = "evicted"
+        else:
+            break # everything after this was used more recently
+        if database.in_use:
+            continue
+        dropped.append((db_id, reason))
+        total -= database.size
+
+    for db_id, reason in dropped:
+        dispose_demo_db_pool(db_id)
+        with materialiser_lock:
+            materialised_until.pop(db_id, None)
+        with db_pools_lock:
+            demo_db_counters[reason] += 1
+            demo_db_dropped_ids[db_id] = True
+            while len(demo_db_dropped_ids) > 10000:
+                demo_db_dropped_ids.popitem(last=False)
+    return len(dropped)
+
+def demo_db_reaper():
+    while True:
+        time.sleep(DEMO_DB_REAP_INTERVAL)
+        try:
+            dropped = reap_demo_dbs()
+            if dropped:
+                app.logger.info(f"Dropped {dropped} unused demo databases")
+        except Exception as e:
+            app.logger.error(f"Reaping demo databases failed: {e}")
+
+demo_db_reaper_thread = None
+
+def start_demo_db_reaper():
+    global demo_db_reaper_thread
+    with demo_seed_lock:
+        if demo_db_reaper_thread is None and DEMO_DB_REAP_INTERVAL > 0:
+            demo_db_reaper_thread = threading.Thread(target=demo_db_reaper, daemon=True)
+            demo_db_reaper_thread.start()
+
+def get_demo_db_stats():
+    with db_pools_lock:
+        databases = list(demo_db_pools.values())
+        counters = dict(demo_db_counters)
+    return {
+        **counters,
+        "databases": len(databases),
+        "in_use": sum(1 for database in databases if database.in_use),
+        "bytes": sum(database.size for database in databases),
+        "max_bytes": DEMO_DB_MAX_BYTES,
+        "ttl": DEMO_DB_TTL,
+        "prewarmed": demo_db_spares.qsize()
+    }
+
+def get_demo_db_id():
+    if "demo_db_id" not in session:
+        session["demo_db_id"] = uuid.uuid4().hex
+    return session["demo_db_id"]
+
+def parse_sqlite_datetime(value):
+    # the two shapes SQLite stores go through fromisoformat, anything else falls back to strptime
+    if value[7:8] == "-":
+        if len(value) == 19 and value[10] == " " and value[13] == ":" and value[16] == ":":
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                pass
+        elif len(value) == 10:
+            try:
+                return date.fromisoformat(value)
+            except ValueError:
+                pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            value = datetime.strptime(value, fmt)
+            # if format is only date, convert to date object
+            if fmt == "%Y-%m-%d":
+                value = value.date()
+            break
+        except ValueError:
+            continue
+    return value
+
+sqlite_row_columns = threading.local() # column names for the last cursor description seen on this thread
 
 def dict_factory_with_datetime(cursor, row):
     """Convert SQLite row to dict and parse date/datetime strings automatically"""
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        value = row[idx]
-        if isinstance(value, str):
-            for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
-                try:
-                    value = datetime.strptime(value, fmt)
-                    # if format is only date, convert to date object
-                    if fmt == "%Y-%m-%d":
-                        value = value.date()
-                    break
-                except ValueError:
-                    continue
-        d[col[0]] = value
+    description = cursor.description
+    if getattr(sqlite_row_columns, "description", None) is not description:
+        sqlite_row_columns.description = description
+        sqlite_row_columns.names = [col[0] for col in description]
+    d = dict(zip(sqlite_row_columns.names, row))
+    for name, value in d.items():
+        # only strings starting "YYYY-" can be dates, so names, notes and report answers skip the parsing
+        if value.__class__ is str and value[4:5] == "-":
+            d[name] = parse_sqlite_datetime(value)
     return d
 
-def get_demo_db_connection():
-    db_path = get_demo_db_path()  # always get the current session path
+def connect_demo_db(db_path):
     conn = sqlite3.connect(db_path, check_same_thread=False)
     conn.row_factory = dict_factory_with_datetime
     return conn
 
+def get_demo_db_connection():
+    db_id = get_demo_db_id()
+    try:
+        return get_demo_db_pool(db_id).acquire()
+    except DemoDatabaseDisposedError: # dropped between the lookup and the checkout, so the session starts again from a fresh copy
+        return get_demo_db_pool(db_id).acquire()
+
 def get_db_connection():
     if request.path.startswith("/demo/"):
         return get_demo_db_connection()
     else:
-        return mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-            autocommit=True
-        )
+        return get_mysql_db_pool().acquire()
+
+def is_sqlite_connection(connection):
+    if isinstance(connection, PooledConnection):
+        connection = connection.connection
+    return isinstance(connection, sqlite3.Connection)
 
 def get_cursor(connection):
-    if request.path.startswith("/demo/"):
+    if is_sqlite_connection(connection):
         return connection.cursor() # SQLite cursor already has row_factory
     return connection.cursor(dictionary=True, buffered=True)  # MySQL
 
 
 def get_placeholder(connection):
-    if isinstance(connection, sqlite3.Connection):
+    if is_sqlite_connection(connection):
         return "?"
     else:
         return "%s"
 
+# each migration is applied once per database and recorded in SchemaMigrations. statements can be a single string
+# (same SQL for MySQL and SQLite) or a dict with "mysql" and "sqlite" variants. plan_checks are EXPLAINed before and
+# after the migration to confirm the hot queries switch from full scans to the new indexes. data statements (INSERT,
+# UPDATE) go after a migration's DDL, as MySQL commits whatever ran before each DDL statement
+MIGRATIONS = [
+    {
+        "version": 1,
+        "description": "Index the columns used by lesson, report and invoice joins",
+        "statements": [
+            "CREATE INDEX idx_lesson_occurrences_lesson_id ON LessonOccurrences(lesson_id)",
+            "CREATE INDEX idx_lesson_occurrences_invoice_id ON LessonOccurrences(invoice_id)",
+            "CREATE INDEX idx_reports_lesson_occurrence_id ON Reports(lesson_occurrence_id)",
+            "CREATE INDEX idx_invoices_tutor_id_week ON Invoices(tutor_id, week)",
+            "CREATE INDEX idx_lessons_extended_until ON Lessons(extended_until)",
+            "CREATE INDEX idx_lesson_exceptions_exception_invoice_id ON LessonExceptions(exception_invoice_id)",
+        ],
+        "plan_checks": [
+            {"index": "idx_lesson_occurrences_lesson_id", "query": "SELECT id FROM LessonOccurrences WHERE lesson_id = {placeholder}", "parameters": (1,)},
+            {"index": "idx_lesson_occurrences_invoice_id", "query": "SELECT id FROM LessonOccurrences WHERE invoice_id = {placeholder}", "parameters": (1,)},
+            {"index": "idx_reports_lesson_occurrence_id", "query": "SELECT id FROM Reports WHERE lesson_occurrence_id = {placeholder}", "parameters": (1,)},
+            {"index": "idx_invoices_tutor_id_week", "query": "SELECT id, week FROM Invoices WHERE tutor_id = {placeholder} AND week BETWEEN {placeholder} AND {placeholder}", "parameters": (1, '2025-01-06', '2025-03-31')},
+            {"index": "idx_lessons_extended_until", "query": "SELECT id FROM Lessons WHERE extended_until < {placeholder}", "parameters": ('2025-01-01 00:00:00',)},
+            {"index": "idx_lesson_exceptions_exception_invoice_id", "query": "SELECT id FROM LessonExceptions WHERE exception_invoice_id = {placeholder}", "parameters": (1,)},
+        ]
+    },
+    {
+        "version": 2,
+        "description": "Index report answers by report for bulk report content loading",
+        "statements": [
+            "CREATE INDEX idx_report_answers_report_id ON ReportAnswers(report_id)",
+        ],
+        "plan_checks": [
+            {"index": "idx_report_answers_report_id", "query": "SELECT question_id, answer_text FROM ReportAnswers WHERE report_id IN ({placeholder}, {placeholder})", "parameters": (1, 2)},
+        ]
+    },
+    {
+        "version": 3,
+        "description": "Track invoices whose status needs recomputing instead of rechecking every invoice on each read",
+        "statements": [
+            {
+                "mysql": "CREATE TABLE DirtyInvoices (id BIGINT AUTO_INCREMENT PRIMARY KEY, invoice_id INT NOT NULL)",
+                "sqlite": "CREATE TABLE DirtyInvoices (id INTEGER PRIMARY KEY AUTOINCREMENT, invoice_id INTEGER NOT NULL)"
+            },
+            "CREATE INDEX idx_invoices_status ON Invoices(status)",
+            "INSERT INTO DirtyInvoices (invoice_id) SELECT id FROM Invoices", # recompute every existing invoice once
+        ],
+        "plan_checks": [
+            {"index": "idx_invoices_status", "query": "SELECT id, week FROM Invoices WHERE status = {placeholder}", "parameters": ('upcoming',)},
+        ]
+    },
+    {
+        "version": 4,
+        "description": "Log lesson and occurrence writes so that calendar clients can sync deltas",
+        "statements": [
+            {
+                "mysql": "CREATE TABLE LessonChanges (id BIGINT AUTO_INCREMENT PRIMARY KEY, lesson_id INT NOT NULL, lesson_occurrence_id INT NULL, changed_at DATETIME DEFAULT CURRENT_TIMESTAMP)",
+                "sqlite": "CREATE TABLE LessonChanges (id INTEGER PRIMARY KEY AUTOINCREMENT, lesson_id INTEGER NOT NULL, lesson_occurrence_id INTEGER, changed_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+            },
+            "CREATE INDEX idx_lesson_changes_changed_at ON LessonChanges(changed_at)",
+        ]
+    },
+    {
+        "version": 5,
+        "description": "Keep the versions behind response ETags in the database so that every instance agrees on them",
+        "statements": [
+            "CREATE TABLE EntityVersions (entity VARCHAR(32) PRIMARY KEY, version BIGINT NOT NULL DEFAULT 0)",
+        ]
+    },
+    {
+        "version": 6,
+        "description": "Keep PDF jobs in the database so that any instance can report on and serve them",
+        "statements": [
+            {
+                "mysql": "CREATE TABLE PdfJobs (id CHAR(32) PRIMARY KEY, type VARCHAR(32) NOT NULL, owner VARCHAR(64) NOT NULL, status VARCHAR(16) NOT NULL, error TEXT NULL, filename VARCHAR(255) NULL, mimetype VARCHAR(64) NULL, timings TEXT NULL, content LONGBLOB NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, finished_at DATETIME NULL)",
+                "sqlite": "CREATE TABLE PdfJobs (id CHAR(32) PRIMARY KEY, type VARCHAR(32) NOT NULL, owner VARCHAR(64) NOT NULL, status VARCHAR(16) NOT NULL, error TEXT, filename VARCHAR(255), mimetype VARCHAR(64), timings TEXT, content BLOB, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, finished_at DATETIME)"
+            },
+            "CREATE INDEX idx_pdf_jobs_created_at ON PdfJobs(created_at)",
+        ]
+    },
+]
+
+def explain_query(connection, query, parameters):
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    sqlite = is_sqlite_connection(connection)
+    cursor.execute(f"{'EXPLAIN QUERY PLAN' if sqlite else 'EXPLAIN'} {query.format(placeholder=placeholder)}", parameters)
+    rows = cursor.fetchall()
+    cursor.close()
+    if sqlite:
+        return [row['detail'] for row in rows]
+    return [f"{row['table']}: type={row['type']}, key={row['key']}" for row in rows]
+
+def plan_uses_index(plan, index):
+    return any(index in step for step in plan)
+
+def schema_object_exists(connection, statement):
+    """Return True if the table or index a CREATE TABLE / CREATE INDEX statement makes is already there"""
+    words = statement.replace("(", " (").split()
+    if words[:2] == ["CREATE", "TABLE"]:
+        name, table = words[2], words[2]
+    elif words[:2] == ["CREATE", "INDEX"] and words[3] == "ON":
+        name, table = words[2], words[4]
+    else:
+        return False
+
+    cursor = get_cursor(connection)
+    if is_sqlite_connection(connection):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = ? AND name = ?", (words[1].lower(), name))
+    elif words[1] == "TABLE":
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+    else:
+        cursor.execute("SELECT index_name FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+                       (table, name))
+    exists = bool(cursor.fetchall())
+    cursor.close()
+    return exists
+
+def get_applied_migrations(connection):
+    cursor = get_cursor(connection)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS SchemaMigrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )""")
+    cursor.execute("SELECT version FROM SchemaMigrations")
+    versions = {row['version'] for row in cursor.fetchall()}
+    connection.commit()
+    cursor.close()
+    return versions
+
+def run_migrations(connection, dry_run=False):
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    dialect = "sqlite" if is_sqlite_connection(connection) else "mysql"
+    applied_versions = get_applied_migrations(connection)
+    migration_reports = []
+
+    for migration in sorted(MIGRATIONS, key=lambda m: m['version']):
+        if migration['version'] in applied_versions:
+            continue
+
+        plans_before = [explain_query(connection, check['query'], check['parameters']) for check in migration.get('plan_checks', [])]
+        if not dry_run:
+            for statement in migration['statements']:
+                statement = statement[dialect] if isinstance(statement, dict) else statement
+                # MySQL commits each DDL statement on its own, so a migration that failed partway leaves some of its tables and
+                # indexes behind without a SchemaMigrations row. those are skipped when it is run again
+                if not schema_object_exists(connection, statement):
+                    cursor.execute(statement)
+            cursor.execute(f"INSERT INTO SchemaMigrations (version, description) VALUES ({placeholder}, {placeholder})",
+                           (migration['version'], migration['description']))
+            connection.commit()
+        plans_after = [explain_query(connection, check['query'], check['parameters']) for check in migration.get('plan_checks', [])]
+
+        migration_reports.append({
+            "version": migration['version'],
+            "description": migration['description'],
+            "applied": not dry_run,
+            "plan_checks": [
+                {
+                    "index": check['index'],
+                    "before": before,
+                    "after": after,
+                    "uses_index": plan_uses_index(after, check['index'])
+                }
+                for check, before, after in zip(migration.get('plan_checks', []), plans_before, plans_after)
+            ]
+        })
+
+    cursor.close()
+    return migration_reports
+
+@app.cli.command("migrate")
+@click.option("--demo-seed", is_flag=True, help=f"Migrate the SQLite seed database ({SEED_DB_PATH}) instead of MySQL")
+@click.option("--dry-run", is_flag=True, help="Only show pending migrations and their current query plans")
+def migrate_command(demo_seed, dry_run):
+    connection = connect_demo_db(SEED_DB_PATH) if demo_seed else get_mysql_db_pool().acquire()
+    try:
+        migration_reports = run_migrations(connection, dry_run=dry_run)
+        if not migration_reports:
+            click.echo("Database schema is up to date")
+        for migration_report in migration_reports:
+            click.echo(f"{'Applied' if migration_report['applied'] else 'Pending'} migration {migration_report['version']}: {migration_report['description']}")
+            for check in migration_report['plan_checks']:
+                click.echo(f"  [{'ok' if check['uses_index'] else 'NOT USED'}] {check['index']}")
+                click.echo(f"    before: {'; '.join(check['before'])}")
+                click.echo(f"    after:  {'; '.join(check['after'])}")
+    finally:
+        connection.close()
+
 def string_to_datetime(datetime_str):
     try:
         # Python ISO format with microseconds and Z
@@ -127,31 +848,91 @@ def string_to_datetime(datetime_str):
             except ValueError:
                 raise ValueError(f"Unrecognized datetime format: {datetime_str}")
 
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+
+class TimeFormatter:
+    """Formats UTC datetimes in one timezone, remembering the UTC offset of the DST period it last looked up"""
+    def __init__(self, timezone):
+        self.zone = pytz.timezone(timezone)
+        # pytz zones with DST carry their UTC transition table; fromutc() bisects the same table
+        self.transitions = getattr(self.zone, "_utc_transition_times", None)
+        self.transition_info = getattr(self.zone, "_transition_info", None)
+        self.fixed_offset = self.zone.utcoffset(datetime(2000, 1, 1)) if self.transitions is None else None
+        self.period = (datetime.max, datetime.min, timedelta(0)) # (start, end, offset) in UTC
+
+    def to_local(self, time):
+        """Return the naive local wall time for a naive UTC (or aware) datetime"""
+        if time.tzinfo is not None:
+            time = time.astimezone(pytz.utc).replace(tzinfo=None)
+        if self.transitions is None:
+            return time + self.fixed_offset
+
+        start, end, offset = self.period
+        if not start <= time < end:
+            index = bisect.bisect_right(self.transitions, time) - 1
+            start = self.transitions[index] if index >= 0 else datetime.min
+            end = self.transitions[index + 1] if index + 1 < len(self.transitions) else datetime.max
+            offset = self.transition_info[max(index, 0)][0]
+            self.period = (start, end, offset)
+        return time + offset
+
+    @staticmethod
+    def format_local(local, format):
+        if format == 'time_short':
+            return f"{local.hour:02d}:{local.minute:02d}"
+        elif format == 'date':
+            return f"{local.day:02d} {MONTH_NAMES[local.month - 1]} {local.year}"
+        elif format == 'date_short':
+            return f"{local.day:02d}/{local.month:02d}/{local.year}"
+        elif format == 'date_tiny':
+            return f"{local.day:02d}/{local.month:02d}/{local.year % 100:02d}"
+        raise ValueError(f"Unknown datetime format '{format}'")
+
+    def format(self, time, format):
+        return self.format_local(self.to_local(time), format)
+
+    def format_column(self, times, *formats):
+        """Format a list of datetimes, returning a tuple of strings (one per format) for each of them"""
+        formatted = []
+        by_date = {} # date formats only depend on the local day, which most rows in a column share
+        for time in times:
+            local = self.to_local(time)
+            day = local.date()
+            if day not in by_date:
+                by_date[day] = {}
+            day_formats = by_date[day]
+            row = []
+            for format in formats:
+                if format == 'time_short':
+                    row.append(f"{local.hour:02d}:{local.minute:02d}")
+                else:
+                    if format not in day_formats:
+                        day_formats[format] = self.format_local(local, format)
+                    row.append(day_formats[format])
+            formatted.append(tuple(row))
+        return formatted
+
+@lru_cache(maxsize=64)
+def get_time_formatter(timezone):
+    return TimeFormatter(timezone or "UTC")
+
 def format_datetime_object(time, timezone, format=None):
     if timezone is None:
         timezone = "UTC"
+    if format in ('time_short', 'date', 'date_short', 'date_tiny'):
+        return get_time_formatter(timezone).format(time, format)
+
     if time.tzinfo is None:
         time = pytz.utc.localize(time) # If the datetime is naive (lacking timezone info), assume it's in UTC
-
-    local_timezone = pytz.timezone(timezone)
-    time = time.astimezone(local_timezone)
-
-    if format == 'time_short':
-        return time.strftime("%H:%M")
-    elif format == 'date':
-        return time.strftime("%d %B %Y")
-    elif format == 'date_short':
-        return time.strftime("%d/%m/%Y")
-    elif format == 'date_tiny':
-        return time.strftime("%d/%m/%y")
-    return time
+    return time.astimezone(pytz.timezone(timezone))
 
 def format_lesson_datetime_object(start_time, end_time, timezone, include_date=True):
-    date_short = format_datetime_object(start_time, timezone, format='date_short')
-    start_time_short = format_datetime_object(start_time, timezone, format='time_short')
-    end_time_short = format_datetime_object(end_time, timezone, format='time_short')
+    formatter = get_time_formatter(timezone or "UTC")
+    start_local = formatter.to_local(start_time)
+    start_time_short = formatter.format_local(start_local, 'time_short')
+    end_time_short = formatter.format(end_time, 'time_short')
     if include_date:
-        return f"{date_short} ({start_time_short}-{end_time_short})"
+        return f"{formatter.format_local(start_local, 'date_short')} ({start_time_short}-{end_time_short})"
     else:
         return f"{start_time_short}-{end_time_short}"
 
@@ -169,6 +950,51 @@ def format_recurrence_rule(rule_dict):
     rule = ';'.join(f'{key}={value}' for key, value in rule_dict.items())
     return rule
 
+def expand_recurrence(start_time, end_time, recurrence_rule, window_start, window_end):
+    """Yield (start_time, end_time) for each occurrence of a recurring series that starts within [window_start, window_end)"""
+    rule = parse_recurrence_rule(recurrence_rule)
+    interval = int(rule.get('INTERVAL', 1))
+    freq = rule.get('FREQ')
+    until_date = rule.get('UNTIL')
+
+    if freq == 'daily' or freq == 'weekly':
+        step = timedelta(days=interval) if freq == 'daily' else timedelta(weeks=interval)
+        if start_time < window_start: # jump straight to the first occurrence inside the window
+            skipped_steps = -((start_time - window_start) // step)
+            start_time += step * skipped_steps
+            end_time += step * skipped_steps
+    elif freq != 'monthly':
+        return
+
+    # monthly occurrences are stepped one at a time to match add_lesson_occurrences (month lengths vary)
+    while start_time < window_end and (until_date is None or start_time.date() <= until_date.date()):
+        if start_time >= window_start:
+            yield start_time, end_time
+        if freq == 'monthly':
+            start_time += relativedelta(months=interval)
+            end_time += relativedelta(months=interval)
+        else:
+            start_time += step
+            end_time += step
+
+# occurrences beyond a lesson's extended_until date are not stored. they are given an id made of the lesson id and start
+# time so they can be shown and edited, and are only written to the database (see resolve_occurrence_id) once touched
+def format_virtual_occurrence_id(lesson_id, start_time):
+    return f"{lesson_id}-{start_time.strftime('%Y%m%d%H%M')}"
+
+def is_virtual_occurrence_id(occurrence_id):
+    return isinstance(occurrence_id, str) and '-' in occurrence_id
+
+def parse_virtual_occurrence_id(occurrence_id):
+    lesson_id, start_time = occurrence_id.split('-')
+    return int(lesson_id), datetime.strptime(start_time, '%Y%m%d%H%M')
+
+def occurrence_sort_key(start_time, occurrence_id):
+    # stored occurrences are ordered by id, virtual ones after them by lesson id
+    if is_virtual_occurrence_id(occurrence_id):
+        return (start_time, 1, parse_virtual_occurrence_id(occurrence_id)[0])
+    return (start_time, 0, int(occurrence_id))
+
 def format_invoices(invoices):
     for invoice in invoices:
         invoice["key"] = invoice["id"]
@@ -223,7 +1049,380 @@ def get_complete_attendance_status(lesson, timezone):
         )
     )
 
-def get_lesson_occurrences(connection, timezone, tutor_id=None, student_id=None, current_fetched_date=None):
+def format_lesson_cursor(occurrence):
+    return f"{occurrence['start_time'].strftime('%Y-%m-%d %H:%M:%S')}|{occurrence['id']}"
+
+def parse_lesson_cursor(cursor_str):
+    start_time, occurrence_id = cursor_str.rsplit('|', 1)
+    return string_to_datetime(start_time), occurrence_id if is_virtual_occurrence_id(occurrence_id) else int(occurrence_id)
+
+def get_virtual_lesson_occurrences(connection, window_start, window_end, tutor_ids=None, student_ids=None, lesson_ids=None):
+    """Expand recurring lessons beyond their extended_until date for the window, without writing anything"""
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+
+    query = f"""
+        SELECT l.id as lesson_id, l.title, l.description, l.tutor_id, l.location_id, l.subject_id, l.student_id,
+            l.extended_until, l.recurrence_rule, l.start_time, l.end_time, su.name as subject_name,
+            loc.name as location_name, loc.address, st.name as student_name, st.color as student_color,
+            t.name as tutor_name, t.color as tutor_color
+        FROM Lessons l
+        JOIN Students st ON l.student_id = st.id
+        JOIN Locations loc ON l.location_id = loc.id
+        JOIN Subjects su ON l.subject_id = su.id
+        JOIN Tutors t ON l.tutor_id = t.id
+        WHERE l.extended_until < {placeholder}
+        AND l.recurrence_rule IS NOT NULL AND l.recurrence_rule <> ''"""
+    parameters = [window_end]
+    if tutor_ids:
+        query += f" AND l.tutor_id IN ({', '.join([placeholder] * len(tutor_ids))})"
+        parameters.extend(tutor_ids)
+    if student_ids:
+        query += f" AND l.student_id IN ({', '.join([placeholder] * len(student_ids))})"
+        parameters.extend(student_ids)
+    if lesson_ids:
+        query += f" AND l.id IN ({', '.join([placeholder] * len(lesson_ids))})"
+        parameters.extend(lesson_ids)
+    cursor.execute(query, tuple(parameters))
+    lessons = cursor.fetchall()
+    cursor.close()
+
+    virtual_occurrences = []
+    for lesson in lessons:
+        # the series continues from the first occurrence that has not been stored yet
+        start_time = lesson.pop('start_time')
+        end_time = lesson.pop('end_time')
+        if isinstance(start_time, str):
+            start_time = string_to_datetime(start_time)
+        if isinstance(end_time, str):
+            end_time = string_to_datetime(end_time)
+        extension_duration = lesson['extended_until'] - start_time
+        try:
+            until_date = parse_recurrence_rule(lesson['recurrence_rule']).get('UNTIL')
+            if until_date and until_date <= lesson['extended_until']: # recurrence rule already fully stored
+                continue
+            expanded = list(expand_recurrence(lesson['extended_until'], end_time + extension_duration, lesson['recurrence_rule'],
+                                              max(window_start, lesson['extended_until']) if window_start else lesson['extended_until'], window_end))
+        except ValueError: # malformed recurrence rule
+            continue
+
+        for occurrence_start, occurrence_end in expanded:
+            virtual_occurrences.append({
+                **lesson,
+                "id": format_virtual_occurrence_id(lesson['lesson_id'], occurrence_start),
+                "exception_id": None,
+                "start_time": occurrence_start,
+                "end_time": occurrence_end,
+                "actual_start_time": None,
+                "actual_end_time": None,
+                "attendance_status": None,
+                "attendance_code": None
+            })
+
+    return virtual_occurrences
+
+class IntervalIndex:
+    """Lesson occurrences of one tutor or student sorted by start time, so overlaps are found with a binary search"""
+    def __init__(self, occurrences, series):
+        self.occurrences = sorted(occurrences) # (start_time, end_time, occurrence_id, lesson_id)
+        self.starts = [occurrence[0] for occurrence in self.occurrences]
+        self.max_duration = max((end_time - start_time for start_time, end_time, _, _ in self.occurrences), default=timedelta(0))
+        self.series = series # (lesson_id, start_time, end_time, recurrence_rule) of recurring lessons continuing past their stored occurrences
+
+    def overlapping(self, start_time, end_time):
+        """Yield (occurrence_id, lesson_id) for every occurrence overlapping [start_time, end_time)"""
+        # anything starting max_duration or more before start_time has already ended
+        first = bisect.bisect_right(self.starts, start_time - self.max_duration)
+        last = bisect.bisect_left(self.starts, end_time)
+        for occurrence_start, occurrence_end, occurrence_id, lesson_id in self.occurrences[first:last]:
+            if occurrence_end > start_time:
+                yield occurrence_id, lesson_id
+
+        for lesson_id, series_start, series_end, recurrence_rule in self.series:
+            for occurrence_start, occurrence_end in expand_recurrence(series_start, series_end, recurrence_rule, start_time - (series_end - series_start), end_time):
+                if occurrence_end > start_time:
+                    yield format_virtual_occurrence_id(lesson_id, occurrence_start), lesson_id
+
+def build_interval_index(connection, role, role_id):
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    column = 'tutor_id' if role == 'tutor' else 'student_id'
+
+    # the COALESCE(le.exception_<column>, l.<column>) match is split so that both halves can use an index
+    cursor.execute(f"""
+        SELECT lo.id, lo.lesson_id, COALESCE(le.exception_start_time, lo.start_time) AS start_time, COALESCE(le.exception_end_time, lo.end_time) AS end_time
+        FROM LessonOccurrences lo
+        JOIN Lessons l ON lo.lesson_id = l.id
+        LEFT JOIN LessonExceptions le ON lo.id = le.lesson_occurrence_id
+        WHERE l.{column} = {placeholder} AND le.exception_{column} IS NULL
+        AND (le.exception_type IS NULL OR le.exception_type <> 'CANCEL')
+        UNION ALL
+        SELECT lo.id, lo.lesson_id, COALESCE(le.exception_start_time, lo.start_time) AS start_time, COALESCE(le.exception_end_time, lo.end_time) AS end_time
+        FROM LessonExceptions le
+        JOIN LessonOccurrences lo ON lo.id = le.lesson_occurrence_id
+        WHERE le.exception_{column} = {placeholder}
+        AND (le.exception_type IS NULL OR le.exception_type <> 'CANCEL')""", (role_id, role_id))
+    occurrences = [
+        tuple(string_to_datetime(value) if isinstance(value, str) else value for value in (row['start_time'], row['end_time'])) + (row['id'], row['lesson_id'])
+        for row in cursor.fetchall()
+    ]
+
+    cursor.execute(f"""
+        SELECT id, start_time, end_time, extended_until, recurrence_rule
+        FROM Lessons
+        WHERE {column} = {placeholder} AND extended_until IS NOT NULL
+        AND recurrence_rule IS NOT NULL AND recurrence_rule <> ''""", (role_id,))
+    series = []
+    for lesson in cursor.fetchall():
+        start_time, end_time = lesson['start_time'], lesson['end_time']
+        if isinstance(start_time, str):
+            start_time = string_to_datetime(start_time)
+        if isinstance(end_time, str):
+            end_time = string_to_datetime(end_time)
+        try:
+            until_date = parse_recurrence_rule(lesson['recurrence_rule']).get('UNTIL')
+        except ValueError: # malformed recurrence rule
+            continue
+        if until_date and until_date <= lesson['extended_until']: # recurrence rule already fully stored
+            continue
+        # the series continues from the first occurrence that has not been stored yet (see get_virtual_lesson_occurrences)
+        series.append((lesson['id'], lesson['extended_until'], end_time + (lesson['extended_until'] - start_time), lesson['recurrence_rule']))
+
+    cursor.close()
+    return IntervalIndex(occurrences, series)
+
+clash_indexes = weakref.WeakKeyDictionary() # connection pool -> {"version": clash data version, "indexes": {(role, id): index}}
+clash_indexes_lock = threading.Lock()
+
+def get_clash_data_version(connection):
+    """The newest LessonChanges id, as every write to lessons, occurrences or exceptions logs one in its transaction.
+    Being read from the database, it also moves with writes made by other workers and instances. A transaction that
+    commits after a later one doesn't move MAX(id), so the number of changes logged within LESSON_CHANGES_SETTLE (the
+    window read_lesson_changes waits for the same reason) is part of the version too."""
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    settle_before, settle_parameter = database_time_before(connection, LESSON_CHANGES_SETTLE)
+    cursor.execute("SELECT MAX(id) AS max_id FROM LessonChanges")
+    max_id = cursor.fetchone()['max_id']
+    cursor.execute(f"SELECT COUNT(*) AS recent FROM LessonChanges WHERE changed_at >= {settle_before.format(placeholder=placeholder)}", (settle_parameter,))
+    recent = cursor.fetchone()['recent']
+    cursor.close()
+    return (max_id, recent)
+
+def get_interval_index(connection, role, role_id, version=None):
+    pool = getattr(connection, 'pool', None) # indexes are cached per database, i.e. per connection pool
+    if pool is None:
+        return build_interval_index(connection, role, role_id)
+
+    key = (role, str(role_id))
+    if version is None:
+        version = get_clash_data_version(connection) # read before building, so an index is never newer than the version it is stored under
+    with clash_indexes_lock:
+        database_indexes = clash_indexes.get(pool)
+        if database_indexes is None or database_indexes["version"] != version: # a write committed since, so every index may be stale
+            database_indexes = clash_indexes[pool] = {"version": version, "indexes": {}}
+        cached = database_indexes["indexes"].get(key)
+    if cached:
+        return cached
+
+    index = build_interval_index(connection, role, role_id)
+    with clash_indexes_lock:
+        if clash_indexes.get(pool) is database_indexes:
+            database_indexes["indexes"][key] = index
+    return index
+
+EVENT_ROLE_ENTITIES = { # entities whose changes are streamed to each role (None for all of them)
+    "admin": None,
+    "tutor": {"lessons", "reports", "invoices", "students", "locations", "subjects"},
+    "student": {"lessons", "tutors", "locations", "subjects"}
+}
+
+class EventSubscriber:
+    def __init__(self, channel):
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=100)
+        self.overflowed = False # events were dropped, so the client is told to refetch everything
+
+class LocalEventBroker:
+    """Fan change notifications out to the event streams open in this process"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.counters = {"published": 0, "delivered": 0, "dropped": 0, "rejected": 0}
+
+    def subscribe(self, channel):
+        with self.lock:
+            if len(self.subscribers) >= EVENTS_MAX_STREAMS:
+                self.counters["rejected"] += 1
+                return None
+            subscriber = EventSubscriber(channel)
+            self.subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, channel, event):
+        with self.lock:
+            self.counters["published"] += 1
+        self.deliver(channel, event)
+
+    def deliver(self, channel, event):
+        with self.lock:
+            subscribers = [subscriber for subscriber in self.subscribers if subscriber.channel == channel]
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(event)
+                delivered = True
+            except queue.Full:
+                subscriber.overflowed = True
+                delivered = False
+            with self.lock:
+                self.counters["delivered" if delivered else "dropped"] += 1
+
+    def stats(self):
+        with self.lock:
+            return {"broker": EVENTS_BROKER, "streams": len(self.subscribers), **self.counters}
+
+class SocketEventBroker(LocalEventBroker):
+    """Also fan notifications out to sibling gunicorn workers, each listening on a datagram socket in EVENTS_SOCKET_DIR"""
+    def __init__(self, directory=EVENTS_SOCKET_DIR):
+        super().__init__()
+        self.directory = directory
+        self.pid = None
+        self.path = None
+        self.sender = None
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        # workers are forked after the app is imported, so each process binds its own socket on first use
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{os.getpid()}.sock")
+            if os.path.exists(path): # left behind by an earlier process with the same pid
+                os.unlink(path)
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.bind(path)
+            self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sender.setblocking(False) # a worker that stops reading must not block writes in this one
+            self.path = path
+            self.pid = os.getpid()
+            threading.Thread(target=self.receive, args=(receiver,), daemon=True).start()
+
+    def receive(self, receiver):
+        while True:
+            try:
+                message = json.loads(receiver.recv(65536))
+                self.deliver(message["channel"], message["event"])
+            except Exception as e:
+                app.logger.warning(f"Could not read event from another worker: {e}")
+
+    def subscribe(self, channel):
+        self.start()
+        return super().subscribe(channel)
+
+    def publish(self, channel, event):
+        self.start()
+        super().publish(channel, event)
+        if channel.startswith("demo:"): # demo databases only exist in the process that created them
+            return
+
+        data = json.dumps({"channel": channel, "event": event}).encode()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self.sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError): # the worker has exited
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError: # its socket buffer is full
+                with self.lock:
+                    self.counters["dropped"] += 1
+
+EVENT_BROKERS = {
+    "local": LocalEventBroker,
+    "socket": SocketEventBroker
+}
+
+event_broker = EVENT_BROKERS[EVENTS_BROKER]()
+
+def get_event_channel(pool):
+    return f"demo:{pool.db_id}" if isinstance(pool, DemoDatabase) else "mysql"
+
+# versions live in the EntityVersions table so that every instance serving a database agrees on them. demo databases
+# also get a random epoch each, as a reset one starts again from the seed's versions
+demo_db_epochs = weakref.WeakKeyDictionary() # demo database -> token
+
+def bump_entity_versions(connection, *entities):
+    """Invalidate the ETags of responses built from these entities and notify open event streams, called after writes to them commit"""
+    pool = getattr(connection, 'pool', None)
+    if pool is not None:
+        cursor = get_cursor(connection)
+        placeholder = get_placeholder(connection)
+        upsert = "ON CONFLICT (entity) DO UPDATE SET version = version + 1" if is_sqlite_connection(connection) else "ON DUPLICATE KEY UPDATE version = version + 1"
+        # the rows are always locked in the same order so that concurrent bumps cannot deadlock
+        cursor.executemany(f"INSERT INTO EntityVersions (entity, version) VALUES ({placeholder}, 1) {upsert}", [(entity,) for entity in sorted(set(entities))])
+        connection.commit()
+        cursor.close()
+        event_broker.publish(get_event_channel(pool), {"entities": list(entities)})
+
+def get_entity_versions(pool, entities):
+    connection = pool.acquire()
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    try:
+        cursor.execute(f"SELECT entity, version FROM EntityVersions WHERE entity IN ({', '.join([placeholder] * len(entities))})", tuple(entities))
+        return {row['entity']: row['version'] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+        connection.close()
+
+def get_request_etag(entities):
+    pool = get_demo_db_pool(get_demo_db_id()) if request.path.startswith("/demo/") else get_mysql_db_pool()
+    versions = get_entity_versions(pool, entities)
+    epoch = demo_db_epochs.setdefault(pool, uuid.uuid4().hex) if isinstance(pool, DemoDatabase) else None
+    state = [epoch] + [versions.get(entity, 0) for entity in entities]
+    identity = None if request.path.startswith("/demo/") else get_jwt_identity()
+    state += [int(time.time() // ETAG_TTL), request.full_path, request.headers.get('X-Timezone'), identity]
+    return hashlib.sha1(json.dumps(state, default=str).encode()).hexdigest()
+
+def etag_versioned(*entities):
+    """Answer If-None-Match with 304, after one EntityVersions lookup instead of the whole query, while none of the entities behind a GET have been written to"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            etag = get_request_etag(entities)
+            # Flask-Compress appends the content coding to the ETag of compressed responses ("<etag>:br"), which is echoed back
+            if request.if_none_match.contains_weak(etag) or any(tag.partition(":")[0] == etag for tag in request.if_none_match.as_set(include_weak=True)):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.vary.add("X-Timezone")
+            return response
+        return wrapper
+    return decorator
+
+def get_lesson_window_args():
+    start = request.args.get('start')
+    end = request.args.get('end')
+    return {
+        "start": string_to_datetime(start) if start else None,
+        "end": string_to_datetime(end) if end else None,
+        "limit": request.args.get('limit', type=int),
+        "after": request.args.get('after')
+    }
+
+def get_lesson_occurrences(connection, timezone, tutor_id=None, student_id=None, current_fetched_date=None, start=None, end=None, limit=None, after=None, lesson_ids=None, occurrence_ids=None):
     cursor = get_cursor(connection)
     placeholder = get_placeholder(connection)
 
@@ -259,58 +1458,80 @@ def get_lesson_occurrences(connection, timezone, tutor_id=None, student_id=None,
     else: # admin view
         columns.extend(location_columns+tutor_columns+student_columns)
 
-    recurrence_query = """SELECT DISTINCT l.id as lesson_id, l.start_time, l.end_time, l.tutor_id, l.extended_until, l.recurrence_rule
-                            FROM Lessons l
-                            JOIN LessonOccurrences lo ON l.id = lo.lesson_id
-                            LEFT JOIN LessonExceptions le ON lo.id = le.lesson_occurrence_id"""
-
-    recurrence_query += " WHERE "
-    if conditions:
-        recurrence_query += " AND ".join(conditions) + " AND "
-    recurrence_query += f"extended_until < {placeholder}"
-    cursor.execute(recurrence_query, tuple(parameters) + (current_fetched_date,))
-    recurrence_results = cursor.fetchall()
-
-    lesson_occurrences = []
-
-    for result in recurrence_results:
-        if result['recurrence_rule']:
-            recurrence_rule = parse_recurrence_rule(result['recurrence_rule'])
-            until_date = recurrence_rule.get('UNTIL')
-            if not until_date or until_date > result['extended_until']: # if recurrence rule not fully extended (either no end date or end date is greater than current extended date)
-                if until_date:
-                    extend_until = until_date
-                else:
-                    extend_until =  string_to_datetime(current_fetched_date) + timedelta(days=180) # extend by 180 days from current date
-                if result['extended_until']: # if lesson has already been extended, update the start and end time to start when it is currently extended until
-                    extension_duration = result['extended_until'] - result['start_time']
-                    result['start_time'] = result['extended_until']
-                    result['end_time'] += extension_duration
-
-                recurrence_rule = format_recurrence_rule(recurrence_rule)
-
-                invoice_ids = get_or_create_invoices(connection=connection, min_date=result['extended_until'], max_date=extend_until, tutor_id=result['tutor_id'])
-                add_lesson_occurrences(connection=connection, lesson_id=result['lesson_id'], start_time=result['start_time'], end_time=result['end_time'], invoice_ids=invoice_ids, recurrence_rule=recurrence_rule, lesson_occurrences=lesson_occurrences, execute_immediately=False) # execute all lesson occurrences at once by passing execute_immediately=False
-
-    cursor.executemany(f"""
-        INSERT INTO LessonOccurrences (lesson_id, start_time, end_time, invoice_id)
-        VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})""", lesson_occurrences)
-    connection.commit()
-    create_reports(connection)
+    # only the given series and stored occurrences, when syncing changes
+    filtered = lesson_ids is not None or occurrence_ids is not None
+    if filtered:
+        matches = []
+        if lesson_ids:
+            matches.append(f"lo.lesson_id IN ({', '.join([placeholder] * len(lesson_ids))})")
+            parameters.extend(lesson_ids)
+        if occurrence_ids:
+            matches.append(f"lo.id IN ({', '.join([placeholder] * len(occurrence_ids))})")
+            parameters.extend(occurrence_ids)
+        conditions.append(f"({' OR '.join(matches) or '1 = 0'})")
+
+    # recurring lessons are only stored up to the materialiser's horizon; anything after that is expanded in memory
+    request_materialisation(datetime.now() + timedelta(days=MATERIALISE_HORIZON_DAYS))
+    if end:
+        expansion_date = end
+    elif current_fetched_date:
+        expansion_date = string_to_datetime(current_fetched_date) + timedelta(days=180) # expand by 180 days from current date
+    elif start:
+        expansion_date = start + timedelta(days=180)
+    else:
+        expansion_date = None
+
+    # restrict to the requested date window and continue after the keyset cursor (start time, occurrence id)
+    if start:
+        conditions.append(f"COALESCE(le.exception_start_time, lo.start_time) >= {placeholder}")
+        parameters.append(start)
+    if end:
+        conditions.append(f"COALESCE(le.exception_start_time, lo.start_time) < {placeholder}")
+        parameters.append(end)
+    if after:
+        after_start_time, after_id = parse_lesson_cursor(after)
+        if is_virtual_occurrence_id(after_id): # stored occurrences sort before virtual ones with the same start time
+            conditions.append(f"COALESCE(le.exception_start_time, lo.start_time) > {placeholder}")
+            parameters.append(after_start_time)
+        else:
+            conditions.append(f"(COALESCE(le.exception_start_time, lo.start_time) > {placeholder} OR (COALESCE(le.exception_start_time, lo.start_time) = {placeholder} AND lo.id > {placeholder}))")
+            parameters.extend([after_start_time, after_start_time, after_id])
 
     query = ", ".join(columns) + query
     query += " WHERE "
     if conditions:
         query += " AND ".join(conditions) + " AND "
-    query += " (le.exception_type IS NULL OR le.exception_type <> 'CANCEL') ORDER BY COALESCE(le.exception_start_time, lo.start_time)"
+    query += " (le.exception_type IS NULL OR le.exception_type <> 'CANCEL') ORDER BY COALESCE(le.exception_start_time, lo.start_time), lo.id"
+    if limit:
+        query += f" LIMIT {placeholder}"
+        parameters.append(limit + 1) # fetch one extra row to know whether there is another page
     cursor.execute(query, tuple(parameters))
     occurrences = cursor.fetchall()
 
-    for occurrence in occurrences:
-        occurrence["start_time_short"] = format_datetime_object(occurrence['start_time'], timezone, format='time_short')
-        occurrence["end_time_short"] = format_datetime_object(occurrence['end_time'], timezone, format='time_short')
-        occurrence["date"] = format_datetime_object(occurrence['start_time'], timezone, format='date')
-        occurrence["date_short"] = format_datetime_object(occurrence['start_time'], timezone, format='date_short')
+    if expansion_date and (lesson_ids or not filtered):
+        virtual_occurrences = get_virtual_lesson_occurrences(connection, start, expansion_date,
+                                                             tutor_ids=[tutor_id] if tutor_id else None,
+                                                             student_ids=[student_id] if student_id else None,
+                                                             lesson_ids=lesson_ids)
+        if after:
+            after_key = occurrence_sort_key(after_start_time, after_id)
+            virtual_occurrences = [occurrence for occurrence in virtual_occurrences if occurrence_sort_key(occurrence['start_time'], occurrence['id']) > after_key]
+        if virtual_occurrences:
+            occurrences = sorted(occurrences + virtual_occurrences, key=lambda occurrence: occurrence_sort_key(occurrence['start_time'], occurrence['id']))
+
+    next_cursor = None
+    if limit and len(occurrences) > limit:
+        occurrences = occurrences[:limit]
+        next_cursor = format_lesson_cursor(occurrences[-1])
+
+    formatter = get_time_formatter(timezone or "UTC")
+    start_columns = formatter.format_column([occurrence['start_time'] for occurrence in occurrences], 'time_short', 'date', 'date_short')
+    end_columns = formatter.format_column([occurrence['end_time'] for occurrence in occurrences], 'time_short')
+    for occurrence, (start_time_short, date_long, date_short), (end_time_short,) in zip(occurrences, start_columns, end_columns):
+        occurrence["start_time_short"] = start_time_short
+        occurrence["end_time_short"] = end_time_short
+        occurrence["date"] = date_long
+        occurrence["date_short"] = date_short
 
     already_extended_until_dates = [
         occurrence['extended_until']
@@ -322,7 +1543,7 @@ def get_lesson_occurrences(connection, timezone, tutor_id=None, student_id=None,
     min_already_extended_until = min(already_extended_until_dates, default=None)
 
     cursor.close()
-    return {"lessons": occurrences, "extended_until": min_already_extended_until}
+    return {"lessons": occurrences, "extended_until": min_already_extended_until, "next_cursor": next_cursor}
 
 def create_reports(connection):
     cursor = get_cursor(connection)
@@ -344,12 +1565,12 @@ def create_reports(connection):
         INSERT INTO Reports (lesson_occurrence_id, status)
         VALUES ({placeholder}, {placeholder});
         """
-        cursor.executemany(insert_query, new_reports)
-        connection.commit()
+        cursor.executemany(insert_query, new_reports) # committed by the caller with the occurrences
 
     cursor.close()
 
 def get_or_create_invoices(connection, min_date, max_date, tutor_id, single=False):
+    # doesn't commit, so the invoices are written in the same transaction as the occurrences put in them
     cursor = get_cursor(connection)
     min_week_start = (min_date - timedelta(days=min_date.weekday())).date()
     max_week_start = (max_date - timedelta(days=max_date.weekday())).date()
@@ -382,7 +1603,6 @@ def get_or_create_invoices(connection, min_date, max_date, tutor_id, single=Fals
         """
         current_week = (datetime.now() - timedelta(days=datetime.now().weekday())).date()
         cursor.executemany(insert_query, [(week, 'upcoming' if week >= current_week else 'incomplete', tutor_id) for week in weeks_to_process]) # set status to upcoming if invoice week in future, otherwise incomplete
-        connection.commit()
 
         # re-fetch all invoices to include newly created ones
         cursor.execute(f"""
@@ -392,6 +1612,7 @@ def get_or_create_invoices(connection, min_date, max_date, tutor_id, single=Fals
         """, (tutor_id, ))
         all_invoices = cursor.fetchall()
         invoice_dict.update({invoice['week']: invoice['id'] for invoice in all_invoices})
+        mark_invoices_dirty(connection, [invoice_dict[week] for week in weeks_to_process]) # removed again if nothing ends up in them
 
     cursor.close()
 
@@ -400,87 +1621,188 @@ def get_or_create_invoices(connection, min_date, max_date, tutor_id, single=Fals
     return invoice_dict
 
 
-def update_invoice_status(connection):
+INVOICE_REFRESH_CHUNK_SIZE = 500 # invoice ids per IN (...) list when recomputing statuses
+
+def mark_invoices_dirty(connection, invoice_ids):
+    """Queue invoices for a status recompute on the next invoice read (see update_invoice_status)"""
+    invoice_ids = {invoice_id for invoice_id in invoice_ids if invoice_id is not None}
+    if invoice_ids:
+        cursor = get_cursor(connection)
+        placeholder = get_placeholder(connection)
+        cursor.executemany(f"INSERT INTO DirtyInvoices (invoice_id) VALUES ({placeholder})", [(invoice_id,) for invoice_id in invoice_ids])
+        cursor.close()
+
+def mark_occurrence_invoices_dirty(connection, condition, parameters):
+    """Queue the invoices (normal and exception) of every lesson occurrence lo matching condition"""
+    cursor = get_cursor(connection)
+    cursor.execute(f"""
+        INSERT INTO DirtyInvoices (invoice_id)
+        SELECT lo.invoice_id FROM LessonOccurrences lo
+        WHERE {condition} AND lo.invoice_id IS NOT NULL
+        UNION
+        SELECT le.exception_invoice_id FROM LessonExceptions le
+        JOIN LessonOccurrences lo ON lo.id = le.lesson_occurrence_id
+        WHERE {condition} AND le.exception_invoice_id IS NOT NULL""", tuple(parameters) * 2)
+    cursor.close()
+
+def record_lesson_changes(connection, condition, parameters):
+    """Log a change to the whole series of every lesson l matching condition, so that syncing clients replace all of its occurrences"""
     cursor = get_cursor(connection)
+    cursor.execute(f"INSERT INTO LessonChanges (lesson_id) SELECT l.id FROM Lessons l WHERE {condition}", tuple(parameters))
+    cursor.close()
 
-    cursor.execute("""
-            UPDATE LessonExceptions
-            SET exception_invoice_id = NULL
-            WHERE exception_invoice_id IN (
-                SELECT invoice_id FROM (
-                    SELECT i.id AS invoice_id
-                    FROM Invoices i
-                    WHERE NOT EXISTS (
-                        SELECT 1
-                        FROM LessonOccurrences lo
-                        JOIN Lessons l ON lo.lesson_id = l.id
-                        LEFT JOIN LessonExceptions le2 ON lo.id = le2.lesson_occurrence_id
-                        WHERE COALESCE(le2.exception_invoice_id, lo.invoice_id) = i.id
-                          AND COALESCE(le2.exception_tutor_id, l.tutor_id) = i.tutor_id
-                          AND (le2.exception_type IS NULL OR le2.exception_type != 'CANCEL')
-                    )
-                ) AS temp
-            )""")
+def record_occurrence_changes(connection, condition, parameters):
+    """Log a change to every stored lesson occurrence lo matching condition"""
+    cursor = get_cursor(connection)
+    cursor.execute(f"INSERT INTO LessonChanges (lesson_id, lesson_occurrence_id) SELECT lo.lesson_id, lo.id FROM LessonOccurrences lo WHERE {condition}", tuple(parameters))
+    cursor.close()
+
+def database_time_before(connection, seconds):
+    # timestamps set by the database's clock (LessonChanges.changed_at, PdfJobs.finished_at) are compared to a cutoff it computes too
+    if is_sqlite_connection(connection):
+        return "datetime('now', {placeholder})", f"-{seconds} seconds"
+    return "NOW() - INTERVAL {placeholder} SECOND", seconds
+
+def read_lesson_changes(connection, since):
+    """Return (changes after since, cursor, reset) where reset means since can't be served and the client must refetch"""
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    settle_before, settle_parameter = database_time_before(connection, LESSON_CHANGES_SETTLE)
+
+    cursor.execute("SELECT MIN(id) AS min_id, MAX(id) AS max_id FROM LessonChanges")
+    bounds = cursor.fetchone()
+    min_id, max_id = bounds['min_id'] or 0, bounds['max_id'] or 0
+
+    # the cursor stops before the oldest change that hasn't settled, so that it is sent again on the next sync
+    cursor.execute(f"SELECT MIN(id) AS id FROM LessonChanges WHERE changed_at >= {settle_before.format(placeholder=placeholder)}", (settle_parameter,))
+    unsettled_id = cursor.fetchone()['id']
+    change_cursor = unsettled_id - 1 if unsettled_id else max_id
+
+    # a cursor from another database (or a reset demo one), or one older than the retained log
+    if since is None or since > max_id or since < min_id - 1:
+        cursor.close()
+        return [], change_cursor, since is not None
+    change_cursor = max(since, change_cursor)
+
+    cursor.execute(f"""
+        SELECT c.lesson_id, c.lesson_occurrence_id, lo.start_time
+        FROM LessonChanges c
+        LEFT JOIN LessonOccurrences lo ON lo.id = c.lesson_occurrence_id
+        WHERE c.id > {placeholder}
+        ORDER BY c.id
+        LIMIT {placeholder}""", (since, LESSON_CHANGES_LIMIT + 1))
+    changes = cursor.fetchall()
+    cursor.close()
+    if len(changes) > LESSON_CHANGES_LIMIT:
+        return [], change_cursor, True
+    return changes, change_cursor, False
+
+def prune_lesson_changes(connection):
+    """Drop logged changes older than the retention period, always keeping the newest so that stale cursors can be recognised"""
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    retention_before, retention_parameter = database_time_before(connection, LESSON_CHANGES_RETENTION_DAYS * 24 * 3600)
+    cursor.execute("SELECT MAX(id) AS max_id FROM LessonChanges")
+    max_id = cursor.fetchone()['max_id']
+    if max_id:
+        cursor.execute(f"DELETE FROM LessonChanges WHERE id < {placeholder} AND changed_at < {retention_before.format(placeholder=placeholder)}",
+                       (max_id, retention_parameter))
+        connection.commit()
+    cursor.close()
+
+def update_invoice_status(connection):
+    """Recompute the status of invoices marked dirty by writes, and of upcoming invoices whose week has ended"""
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    sqlite = is_sqlite_connection(connection)
 
-    # delete all empty invoices
-    cursor.execute("""
-            DELETE FROM Invoices
-            WHERE id IN (
-                SELECT id FROM (
-                    SELECT i.id
-                    FROM Invoices i
-                    WHERE NOT EXISTS (
-                        SELECT 1
-                        FROM LessonOccurrences lo
-                        JOIN Lessons l ON lo.lesson_id = l.id
-                        LEFT JOIN LessonExceptions le ON lo.id = le.lesson_occurrence_id
-                        WHERE COALESCE(le.exception_invoice_id, lo.invoice_id) = i.id
-                          AND COALESCE(le.exception_tutor_id, l.tutor_id) = i.tutor_id
-                          AND (le.exception_type IS NULL OR le.exception_type != 'CANCEL')
-                    )
-                ) AS temp
-                )""")
     # update invoice status from upcoming --> incomplete when end of invoice week reached
-    demo = request.path.startswith("/demo/")
     cursor.execute(f"""
-        UPDATE Invoices
-        SET status = 'incomplete'
-        WHERE {"strftime('%W', 'now')" if demo else "WEEK(NOW())"} > {"strftime('%W', week)" if demo else "WEEK(week)"}
-        AND status = 'upcoming'
+        SELECT id FROM Invoices
+        WHERE status = 'upcoming'
+        AND {"strftime('%W', 'now')" if sqlite else "WEEK(NOW())"} > {"strftime('%W', week)" if sqlite else "WEEK(week)"}
     """)
-
-    # update invoice status from incomplete --> ready if all reports submitted and from ready --> incomplete if not all reports submitted
-    cursor.execute("""
-        UPDATE Invoices
-        SET status = CASE
-            WHEN status = 'incomplete' AND id NOT IN (
-                SELECT lo.invoice_id
-                FROM Reports r
-                JOIN LessonOccurrences lo ON r.lesson_occurrence_id = lo.id
+    ended_invoice_ids = {row['id'] for row in cursor.fetchall()}
+
+    # writes append to DirtyInvoices, so only the rows read here are cleared once they have been recomputed
+    cursor.execute("SELECT id, invoice_id FROM DirtyInvoices")
+    dirty_rows = cursor.fetchall()
+    invoice_ids = list({row['invoice_id'] for row in dirty_rows} | ended_invoice_ids)
+
+    for chunk_start in range(0, len(invoice_ids), INVOICE_REFRESH_CHUNK_SIZE):
+        chunk = invoice_ids[chunk_start:chunk_start + INVOICE_REFRESH_CHUNK_SIZE]
+        chunk_placeholders = ", ".join([placeholder] * len(chunk))
+        ended_chunk = [invoice_id for invoice_id in chunk if invoice_id in ended_invoice_ids]
+
+        # the COALESCE(exception_invoice_id, invoice_id) = i.id match is split into two NOT EXISTS checks so that each
+        # side can use the invoice_id/exception_invoice_id indexes instead of scanning every occurrence per invoice
+        empty_invoices_query = f"""
+            SELECT i.id
+            FROM Invoices i
+            WHERE i.id IN ({chunk_placeholders})
+            AND NOT EXISTS (
+                SELECT 1
+                FROM LessonOccurrences lo
                 JOIN Lessons l ON lo.lesson_id = l.id
                 LEFT JOIN LessonExceptions le ON lo.id = le.lesson_occurrence_id
-                WHERE r.status <> 'submitted'
-                  AND (le.exception_type IS NULL OR le.exception_type <> 'CANCEL')
-                  AND (le.exception_tutor_id IS NULL OR le.exception_tutor_id = l.tutor_id)
-            ) THEN 'ready'
-            WHEN status = 'ready' AND id IN (
-                SELECT lo.invoice_id
-                FROM Reports r
-                JOIN LessonOccurrences lo ON r.lesson_occurrence_id = lo.id
+                WHERE lo.invoice_id = i.id
+                  AND le.exception_invoice_id IS NULL
+                  AND COALESCE(le.exception_tutor_id, l.tutor_id) = i.tutor_id
+                  AND (le.exception_type IS NULL OR le.exception_type != 'CANCEL')
+            )
+            AND NOT EXISTS (
+                SELECT 1
+                FROM LessonExceptions le
+                JOIN LessonOccurrences lo ON lo.id = le.lesson_occurrence_id
                 JOIN Lessons l ON lo.lesson_id = l.id
-                LEFT JOIN LessonExceptions le ON lo.id = le.lesson_occurrence_id
-                WHERE r.status <> 'submitted'
-                  AND (le.exception_type IS NULL OR le.exception_type <> 'CANCEL')
-                  AND (le.exception_tutor_id IS NULL OR le.exception_tutor_id = l.tutor_id)
-            ) THEN 'incomplete'
-            ELSE status
-        END
-    """)
+                WHERE le.exception_invoice_id = i.id
+                  AND COALESCE(le.exception_tutor_id, l.tutor_id) = i.tutor_id
+                  AND (le.exception_type IS NULL OR le.exception_type != 'CANCEL')
+            )"""
+        cursor.execute(empty_invoices_query, tuple(chunk))
+        empty_invoice_ids = [row['id'] for row in cursor.fetchall()]
+
+        # delete all empty invoices
+        if empty_invoice_ids:
+            empty_placeholders = ", ".join([placeholder] * len(empty_invoice_ids))
+            cursor.execute(f"UPDATE LessonExceptions SET exception_invoice_id = NULL WHERE exception_invoice_id IN ({empty_placeholders})", tuple(empty_invoice_ids))
+            cursor.execute(f"DELETE FROM Invoices WHERE id IN ({empty_placeholders})", tuple(empty_invoice_ids))
+
+        if ended_chunk:
+            cursor.execute(f"UPDATE Invoices SET status = 'incomplete' WHERE status = 'upcoming' AND id IN ({', '.join([placeholder] * len(ended_chunk))})", tuple(ended_chunk))
+
+        # update invoice status from incomplete --> ready if all reports submitted and from ready --> incomplete if not all reports submitted
+        unsubmitted_reports_query = """
+            SELECT 1
+            FROM LessonOccurrences lo
+            JOIN Reports r ON r.lesson_occurrence_id = lo.id
+            JOIN Lessons l ON lo.lesson_id = l.id
+            LEFT JOIN LessonExceptions le ON lo.id = le.lesson_occurrence_id
+            WHERE lo.invoice_id = Invoices.id
+              AND r.status <> 'submitted'
+              AND (le.exception_type IS NULL OR le.exception_type <> 'CANCEL')
+              AND (le.exception_tutor_id IS NULL OR le.exception_tutor_id = l.tutor_id)"""
+        cursor.execute(f"""
+            UPDATE Invoices
+            SET status = CASE
+                WHEN status = 'incomplete' AND NOT EXISTS ({unsubmitted_reports_query}) THEN 'ready'
+                WHEN status = 'ready' AND EXISTS ({unsubmitted_reports_query}) THEN 'incomplete'
+                ELSE status
+            END
+            WHERE id IN ({chunk_placeholders})
+        """, tuple(chunk))
+
+    # by id rather than a range, as a transaction that committed after the SELECT may have appended a lower id
+    dirty_ids = [row['id'] for row in dirty_rows]
+    for chunk_start in range(0, len(dirty_ids), INVOICE_REFRESH_CHUNK_SIZE):
+        chunk = dirty_ids[chunk_start:chunk_start + INVOICE_REFRESH_CHUNK_SIZE]
+        cursor.execute(f"DELETE FROM DirtyInvoices WHERE id IN ({', '.join([placeholder] * len(chunk))})", tuple(chunk))
 
     connection.commit()
+    cursor.close()
 
 
-def add_lesson_occurrences(connection, lesson_id, start_time, end_time, recurrence_rule=None, invoice_ids=None, tutor_id=None, lesson_occurrences=None, reports=None, invoices=None, execute_immediately=True, ignore_first_occurrence=False):
+def add_lesson_occurrences(connection, lesson_id, start_time, end_time, recurrence_rule=None, invoice_ids=None, tutor_id=None, lesson_occurrences=None, reports=None, invoices=None, execute_immediately=True, ignore_first_occurrence=False, extend_until=None):
     cursor = get_cursor(connection)
     placeholder = get_placeholder(connection)
 
@@ -498,7 +1820,10 @@ def add_lesson_occurrences(connection, lesson_id, start_time, end_time, recurren
         rule = parse_recurrence_rule(recurrence_rule)
         interval = int(rule.get('INTERVAL', 1))
         freq = rule.get('FREQ')
-        extend_until = rule.get('UNTIL') if 'UNTIL' in rule else start_time + timedelta(days=180)
+        if extend_until is None: # only store the near future, later occurrences are expanded in memory
+            extend_until = max(start_time, datetime.now()) + timedelta(days=MATERIALISE_HORIZON_DAYS)
+            if 'UNTIL' in rule:
+                extend_until = min(rule['UNTIL'], extend_until)
 
         if not invoice_ids:
             invoice_ids = get_or_create_invoices(connection=connection, min_date=start_time, max_date=extend_until, tutor_id=tutor_id)
@@ -537,6 +1862,7 @@ def add_lesson_occurrences(connection, lesson_id, start_time, end_time, recurren
             cursor.executemany(f"""
                 INSERT INTO LessonOccurrences (lesson_id, start_time, end_time, invoice_id)
                 VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})""", lesson_occurrences)
+            mark_invoices_dirty(connection, [occurrence[3] for occurrence in lesson_occurrences])
             create_reports(connection)
 
     else:
@@ -544,6 +1870,8 @@ def add_lesson_occurrences(connection, lesson_id, start_time, end_time, recurren
                                             tutor_id=tutor_id, single=True)
         cursor.execute(f"UPDATE Invoices SET status = 'ready' WHERE status = 'submitted' AND id = {placeholder}",
                        (invoice_id,))  # set invoice status to ready if previously submitted as it is now modified
+        mark_occurrence_invoices_dirty(connection, f"lo.lesson_id = {placeholder}", [lesson_id]) # the invoices it is moved out of
+        mark_invoices_dirty(connection, [invoice_id])
         if ignore_first_occurrence:
             cursor.execute(f"""
                 UPDATE LessonOccurrences
@@ -582,23 +1910,28 @@ def add_lesson_occurrences(connection, lesson_id, start_time, end_time, recurren
 
 def format_reports(reports, timezone):
     formatted_reports = {"lesson-based": [], "weekly": []}
-    seen_weekly_combinations = set()
+    weekly_reports = {} # (invoice_id, student_id) -> weekly report, so each report is grouped in a single pass
+    weekly_statuses = {} # (invoice_id, student_id) -> statuses of the reports in that week
+
+    formatter = get_time_formatter(timezone or "UTC")
+    week_columns = formatter.format_column([datetime.combine(report['week'], datetime.min.time()) for report in reports], 'date_short')
+    start_columns = formatter.format_column([report['start_time'] for report in reports], 'date_short', 'time_short')
+    end_columns = formatter.format_column([report['end_time'] for report in reports], 'time_short')
 
-    for report in reports:
+    for report, (week_short,), (date_short, start_time_short), (end_time_short,) in zip(reports, week_columns, start_columns, end_columns):
         report["key"] = report["id"]
         report["id_ext"] = str(report['id']).zfill(5)
         report["title"] = f"Report No. {str(report['id']).zfill(5)}"
-        report['week_short'] = format_datetime_object(datetime.combine(report['week'], datetime.min.time()), timezone, format='date_short')
+        report['week_short'] = week_short
         report["invoice_title"] = f"INV-{str(report['invoice_id']).zfill(5)}"
-        report['lesson_time_short'] = format_lesson_datetime_object(report['start_time'], report['end_time'], timezone)
+        report['lesson_time_short'] = f"{date_short} ({start_time_short}-{end_time_short})"
         report["status_text"] = get_report_status_text(report['status'])
         report['attendance_status_complete'] = get_complete_attendance_status(report, timezone)
         formatted_reports['lesson-based'].append(report)
 
-        weekly_key = (report['invoice_id'], report['student_name'])
-        if weekly_key not in seen_weekly_combinations:
-            seen_weekly_combinations.add(weekly_key)
-            weekly_report = {
+        weekly_key = (report['invoice_id'], report['student_id'])
+        if weekly_key not in weekly_reports:
+            weekly_reports[weekly_key] = {
                 'key': f"{report['invoice_id']}-{report['student_id']}",
                 'week': report['week'],
                 'week_short': report['week_short'],
@@ -606,31 +1939,22 @@ def format_reports(reports, timezone):
                 'student_name': report['student_name'],
                 'tutor_name': report['tutor_name'],
                 'invoice_id': report['invoice_id'],
-                'invoice_title': f"INV-{str(report['invoice_id']).zfill(5)}",
-                'report_ids': [report['id']],
+                'invoice_title': report['invoice_title'],
+                'report_ids': [],
                 'safeguarding_concern': report['safeguarding_concern']
             }
-            formatted_reports['weekly'].append(weekly_report)
-        else:
-            for weekly_report in formatted_reports['weekly']:
-                if weekly_report['invoice_id'] == report['invoice_id'] and weekly_report['student_id'] == report['student_id']:
-                    weekly_report['report_ids'].append(report['id'])
-
-    for weekly_report in formatted_reports['weekly']:
-        invoice_id = weekly_report['invoice_id']
-        student_id = weekly_report['student_id']
+            weekly_statuses[weekly_key] = set()
+            formatted_reports['weekly'].append(weekly_reports[weekly_key])
+        weekly_reports[weekly_key]['report_ids'].append(report['id'])
+        weekly_statuses[weekly_key].add(report['status'])
 
-        # Find all reports with the same invoice_id and student_name
-        related_reports = [report for report in formatted_reports['lesson-based'] if
-                           report['invoice_id'] == invoice_id and report['student_id'] == student_id]
-
-        # Check the statuses of the related reports
-        statuses = {report['status'] for report in related_reports}
+    for weekly_key, weekly_report in weekly_reports.items():
+        statuses = weekly_statuses[weekly_key]
 
         # Set the weekly report status
-        if all(status == "empty" for status in statuses):  # All reports are empty
+        if statuses == {"empty"}:  # All reports are empty
             weekly_report['status'] = "empty"
-        elif all(status == "submitted" for status in statuses):  # All reports are submitted
+        elif statuses == {"submitted"}:  # All reports are submitted
             weekly_report['status'] = "submitted"
         else:
             weekly_report['status'] = "incomplete"
@@ -639,26 +1963,342 @@ def format_reports(reports, timezone):
 
     return formatted_reports
 
+report_questions_cache = {} # dialect -> (loaded_at, questions). questions are not edited through the API, so a short TTL is enough
+report_questions_lock = threading.Lock()
+
+def get_report_questions(connection):
+    dialect = "sqlite" if is_sqlite_connection(connection) else "mysql"
+    with report_questions_lock:
+        cached = report_questions_cache.get(dialect)
+    if cached and time.monotonic() - cached[0] < REPORT_QUESTIONS_CACHE_TTL:
+        return cached[1]
+
+    cursor = get_cursor(connection)
+    order_column = 'rq."order"' if dialect == "sqlite" else 'rq.order'
+    cursor.execute(f"SELECT rq.id, rq.title, rq.type, rq.options, rq.hidden, {order_column} FROM ReportQuestions rq")
+    questions = cursor.fetchall()
+    cursor.close()
+    with report_questions_lock:
+        report_questions_cache[dialect] = (time.monotonic(), questions)
+    return questions
+
+def get_report_contents(connection, report_ids):
+    """Return {report_id: [question with answer, ...]} for many reports using one query for the answers"""
+    questions = get_report_questions(connection)
+    report_ids = list(dict.fromkeys(report_ids))
+    stored_report_ids = [report_id for report_id in report_ids if report_id is not None] # lessons without a report get unanswered questions
+    answers = {}
+
+    if stored_report_ids:
+        cursor = get_cursor(connection)
+        placeholder = get_placeholder(connection)
+        cursor.execute(f"""
+            SELECT report_id, question_id, answer_text, answer_boolean, answer_number, answer_option
+            FROM ReportAnswers
+            WHERE report_id IN ({', '.join([placeholder] * len(stored_report_ids))})""", tuple(stored_report_ids))
+        for answer in cursor.fetchall():
+            answers[(answer.pop('report_id'), answer.pop('question_id'))] = answer
+        cursor.close()
+
+    empty_answer = {"answer_text": None, "answer_boolean": None, "answer_number": None, "answer_option": None}
+    return {
+        report_id: [{**answers.get((report_id, question['id']), empty_answer), **question} for question in questions]
+        for report_id in report_ids
+    }
+
+def materialise_recurring_lessons(connection, extend_to, lesson_id=None, commit=True):
+    """Expand every recurring lesson (or just lesson_id) up to extend_to (or its UNTIL date if sooner) and move extended_until forward.
+    With commit=False the rows are left in the caller's transaction, for the caller to commit and bump the versions of"""
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+
+    query = f"""
+        SELECT id as lesson_id, start_time, end_time, tutor_id, extended_until, recurrence_rule
+        FROM Lessons
+        WHERE extended_until < {placeholder}
+        AND recurrence_rule IS NOT NULL AND recurrence_rule <> ''"""
+    parameters = [extend_to]
+    if lesson_id:
+        query += f" AND id = {placeholder}"
+        parameters.append(lesson_id)
+    cursor.execute(query, tuple(parameters))
+    recurrence_results = cursor.fetchall()
+
+    lesson_occurrences = []
+    summary = {"lessons_extended": 0, "occurrences_created": 0, "failed_lesson_ids": []}
+
+    for result in recurrence_results:
+        try:
+            recurrence_rule = parse_recurrence_rule(result['recurrence_rule'])
+            until_date = recurrence_rule.get('UNTIL')
+            if until_date and until_date <= result['extended_until']: # recurrence rule already fully extended
+                continue
+            extend_until = min(until_date, extend_to) if until_date else extend_to
+
+            # continue the series from where it is currently extended until
+            extension_duration = result['extended_until'] - result['start_time']
+            start_time = result['extended_until']
+            end_time = result['end_time'] + extension_duration
+
+            invoice_ids = get_or_create_invoices(connection=connection, min_date=start_time, max_date=extend_until, tutor_id=result['tutor_id'])
+            new_occurrences = [] # collected per lesson so that a failing lesson doesn't leave half a series behind
+            add_lesson_occurrences(connection=connection, lesson_id=result['lesson_id'], start_time=start_time, end_time=end_time, invoice_ids=invoice_ids,
+                                   recurrence_rule=format_recurrence_rule(recurrence_rule), lesson_occurrences=new_occurrences, execute_immediately=False, extend_until=extend_until)
+        except Exception as e:
+            app.logger.warning(f"Could not materialise lesson {result['lesson_id']}: {e}")
+            summary["failed_lesson_ids"].append(result['lesson_id'])
+            continue
+
+        lesson_occurrences.extend(new_occurrences)
+        summary["lessons_extended"] += 1
+        summary["occurrences_created"] += len(new_occurrences)
+
+    if not lesson_occurrences: # the series were already expanded, so nothing built from them has changed
+        cursor.close()
+        return summary
+
+    cursor.execute("SELECT MAX(id) AS max_id FROM LessonOccurrences")
+    max_occurrence_id = cursor.fetchone()['max_id'] or 0
+    cursor.executemany(f"""
+        INSERT INTO LessonOccurrences (lesson_id, start_time, end_time, invoice_id)
+        VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})""", lesson_occurrences)
+    mark_invoices_dirty(connection, [occurrence[3] for occurrence in lesson_occurrences])
+    create_reports(connection)
+    # logged last, so that the change rows are timestamped as close to the commit as possible (see LESSON_CHANGES_SETTLE)
+    record_occurrence_changes(connection, f"lo.id > {placeholder}", [max_occurrence_id]) # syncing clients swap the virtual occurrences they hold for the stored ones
+    if commit:
+        connection.commit() # the batch's invoices, occurrences, reports and change rows together, or none of them
+        bump_entity_versions(connection, "lessons", "invoices", "reports")
+
+    cursor.close()
+    return summary
+
+def find_stored_occurrence_id(connection, occurrence_id):
+    """Return the stored id for an occurrence id, or None for a virtual occurrence that hasn't been stored yet"""
+    if not is_virtual_occurrence_id(occurrence_id):
+        return int(occurrence_id)
+
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    lesson_id, start_time = parse_virtual_occurrence_id(occurrence_id)
+    cursor.execute(f"""
+        SELECT id FROM LessonOccurrences
+        WHERE lesson_id = {placeholder} AND start_time >= {placeholder} AND start_time < {placeholder}""",
+                   (lesson_id, start_time, start_time + timedelta(minutes=1)))
+    result = cursor.fetchone()
+    cursor.close()
+    return result['id'] if result else None
+
+def resolve_occurrence_id(connection, occurrence_id):
+    """Return the stored id for an occurrence id, storing the lesson's series up to it first if it is virtual. Only for write
+    routes: the new rows are left in the route's transaction, so they are committed (and versions bumped) with its own writes"""
+    stored_id = find_stored_occurrence_id(connection, occurrence_id)
+    if stored_id is not None:
+        return stored_id
+
+    lesson_id, start_time = parse_virtual_occurrence_id(occurrence_id)
+    materialise_recurring_lessons(connection, start_time + timedelta(minutes=1), lesson_id=lesson_id, commit=False)
+    stored_id = find_stored_occurrence_id(connection, occurrence_id)
+    if stored_id is None:
+        raise ValueError(f"Lesson occurrence {occurrence_id} does not exist")
+    return stored_id
+
+def run_materialisation(db_id, extend_to):
+    # db_id is the demo database to expand, or None for the MySQL database
+    if db_id:
+        with db_pools_lock:
+            database = demo_db_pools.get(db_id)
+        if database is None: # the session's database was reset in the meantime
+            return None
+        try:
+            connection = database.acquire()
+        except DemoDatabaseDisposedError:
+            return None
+    else:
+        connection = get_mysql_db_pool().acquire()
+    cursor = get_cursor(connection)
+    try:
+        if not db_id: # only one worker/instance may expand the MySQL schedule at a time
+            cursor.execute("SELECT GET_LOCK('educatch_materialise', 0) AS acquired")
+            if not cursor.fetchone()['acquired']:
+                return None
+        try:
+            summary = materialise_recurring_lessons(connection, extend_to)
+            prune_lesson_changes(connection)
+            return summary
+        except Exception:
+            connection.rollback() # a batch that fails leaves none of its invoices behind
+            raise
+        finally:
+            if not db_id:
+                cursor.execute("SELECT RELEASE_LOCK('educatch_materialise')")
+    finally:
+        cursor.close()
+        connection.close()
+
+materialise_queue = queue.Queue() # (db_id, extend_to) jobs
+materialised_until = {} # furthest date queued per database, so repeated calendar reads don't flood the queue
+materialiser_lock = threading.Lock()
+materialiser_thread = None
+
+def materialiser_worker():
+    while True:
+        db_id, extend_to = materialise_queue.get()
+        try:
+            summary = run_materialisation(db_id, extend_to)
+            if summary and summary["lessons_extended"]:
+                app.logger.info(f"Materialised {summary['occurrences_created']} lesson occurrences for {summary['lessons_extended']} lessons up to {extend_to}")
+        except Exception as e:
+            app.logger.error(f"Materialising lessons up to {extend_to} failed: {e}")
+            with materialiser_lock:
+                materialised_until.pop(db_id, None) # allow the next request to retry
+        finally:
+            materialise_queue.task_done()
+
+def materialiser_scheduler():
+    while True:
+        enqueue_materialisation(None, datetime.now() + timedelta(days=MATERIALISE_HORIZON_DAYS))
+        time.sleep(MATERIALISE_INTERVAL)
+
+def start_materialiser():
+    global materialiser_thread
+    with materialiser_lock:
+        if materialiser_thread is None:
+            materialiser_thread = threading.Thread(target=materialiser_worker, daemon=True)
+            materialiser_thread.start()
+            if MATERIALISE_INTERVAL > 0 and DB_HOST:
+                threading.Thread(target=materialiser_scheduler, daemon=True).start()
+
+def enqueue_materialisation(db_id, extend_to):
+    # rounded up to the next midnight, otherwise every calendar read asks for a few seconds more than the last and queues another run
+    extend_to = datetime.combine(extend_to.date() + timedelta(days=1), datetime.min.time())
+    with materialiser_lock:
+        if db_id in materialised_until and extend_to <= materialised_until[db_id]:
+            return False
+        materialised_until[db_id] = extend_to
+    materialise_queue.put((db_id, extend_to))
+    return True
+
+# scheduled runs start with the app rather than waiting for its first request. flask commands (migrate, materialise)
+# load the app inside a click context and don't start them, so they never run against a schema mid-migration
+if click.get_current_context(silent=True) is None:
+    start_materialiser()
+
+def request_materialisation(extend_to):
+    start_materialiser()
+    db_id = get_demo_db_id() if request.path.startswith("/demo/") else None
+    return enqueue_materialisation(db_id, extend_to)
+
+@app.cli.command("materialise")
+@click.option("--demo-seed", is_flag=True, help=f"Expand lessons in the SQLite seed database ({SEED_DB_PATH}) instead of MySQL")
+@click.option("--days", default=MATERIALISE_HORIZON_DAYS, show_default=True, help="How many days ahead to expand recurring lessons")
+def materialise_command(demo_seed, days):
+    extend_to = datetime.now() + timedelta(days=days)
+    if demo_seed:
+        connection = connect_demo_db(SEED_DB_PATH)
+        try:
+            summary = materialise_recurring_lessons(connection, extend_to)
+        finally:
+            connection.close()
+    else:
+        summary = run_materialisation(None, extend_to)
+    if summary is None:
+        click.echo("Another worker is already materialising lessons")
+        return
+    click.echo(f"Extended {summary['lessons_extended']} lessons with {summary['occurrences_created']} new occurrences")
+    if summary["failed_lesson_ids"]:
+        click.echo(f"Failed lessons: {', '.join(str(lesson_id) for lesson_id in summary['failed_lesson_ids'])}")
+
 @app.route('/', methods=['GET'])
 def home():
     return "Educatch Charity API is running", 200
 
 @app.route("/demo/reset-db", methods=["POST"])
 def reset_demo_db():
-    # Delete old DB file if it exists
-    old_db_path = session.get("demo_db_path")
-    if old_db_path and os.path.exists(old_db_path):
-        os.remove(old_db_path)
+    # Drop the old in-memory DB if there is one
+    old_db_id = session.get("demo_db_id")
+    if old_db_id:
+        dispose_demo_db_pool(old_db_id)
+        with materialiser_lock:
+            materialised_until.pop(old_db_id, None)
 
     session.clear()
     # Create a fresh DB and associate it with this session
-    get_demo_db_path()
+    get_demo_db_pool(get_demo_db_id())
 
     return jsonify({"message": "Demo database has been reset."}), 200
 
+@app.route('/demo/db-pool-stats', methods=['GET'])
+@app.route('/db-pool-stats', methods=['GET'])
+@admin_required_if_not_demo()
+def get_db_pool_stats():
+    if request.path.startswith("/demo/"):
+        return jsonify({**get_demo_db_pool(get_demo_db_id()).stats(), "demo_databases": get_demo_db_stats()}), 200
+    return jsonify(get_mysql_db_pool().stats()), 200
+
+@app.route('/demo/pdf-cache-stats', methods=['GET'])
+@app.route('/pdf-cache-stats', methods=['GET'])
+@admin_required_if_not_demo()
+def get_pdf_cache_stats():
+    if pdf_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **pdf_cache.stats()}), 200
+
+def stream_events(subscriber, entities):
+    yield "retry: 3000\n\n"
+    deadline = time.monotonic() + EVENTS_STREAM_TTL
+    while (remaining := deadline - time.monotonic()) > 0:
+        try:
+            events = [subscriber.queue.get(timeout=min(EVENTS_KEEPALIVE, remaining))]
+        except queue.Empty:
+            yield ": keepalive\n\n"
+            continue
+        while not subscriber.queue.empty(): # writes that land together are sent as one notification
+            events.append(subscriber.queue.get_nowait())
+
+        if subscriber.overflowed:
+            subscriber.overflowed = False
+            yield "event: resync\ndata: {}\n\n"
+            continue
+        changed = sorted({entity for event in events for entity in event["entities"] if entities is None or entity in entities})
+        if changed:
+            yield f"event: change\ndata: {json.dumps({'entities': changed})}\n\n"
+
+@app.route('/demo/events', methods=['GET'])
+@app.route('/events', methods=['GET'])
+def get_events():
+    """Server-sent change notifications naming the entities that were written to, so open tabs refetch only those lists.
+    Notifications sent while a tab is reconnecting are lost, so clients refetch what they show when the stream (re)opens."""
+    if request.path.startswith("/demo/"):
+        channel = f"demo:{get_demo_db_id()}"
+        role = request.args.get('role', 'admin')
+    else:
+        verify_jwt_in_request(locations=["headers", "query_string"]) # EventSource can't send headers, so the token may come as ?jwt=
+        channel = "mysql"
+        role = get_current_user_role() # its connection is returned before the stream starts
+
+    if role not in EVENT_ROLE_ENTITIES:
+        return jsonify({'error': 'Unknown role'}), 403
+    subscriber = event_broker.subscribe(channel)
+    if subscriber is None:
+        return jsonify({'error': 'Too many open event streams, please try again later'}), 503
+
+    response = app.response_class(stream_events(subscriber, EVENT_ROLE_ENTITIES[role]), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no" # don't let a proxy hold events back
+    response.call_on_close(lambda: event_broker.unsubscribe(subscriber)) # also when the stream is dropped before it starts
+    return response
+
+@app.route('/demo/event-stats', methods=['GET'])
+@app.route('/event-stats', methods=['GET'])
+@admin_required_if_not_demo()
+def get_event_stats():
+    return jsonify(event_broker.stats()), 200
+
 @app.route('/demo/lessons/admin', methods=['GET'])
 @app.route('/lessons/admin', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("lessons", "tutors", "students", "subjects", "locations", "reports")
 def get_lessons_admin():
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -667,7 +2307,7 @@ def get_lessons_admin():
         current_fetched_date = request.args.get('current_fetched_date')
         timezone = request.headers.get('X-Timezone')
 
-        occurrences = get_lesson_occurrences(connection, timezone, current_fetched_date=current_fetched_date)
+        occurrences = get_lesson_occurrences(connection, timezone, current_fetched_date=current_fetched_date, **get_lesson_window_args())
 
         connection.commit()
         return occurrences, 200
@@ -683,6 +2323,7 @@ def get_lessons_admin():
 @app.route('/demo/lessons/tutor/<int:tutor_id>', methods=['GET'])
 @app.route('/lessons/tutor/<int:tutor_id>', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("lessons", "tutors", "students", "subjects", "locations", "reports")
 def get_lessons_tutor(tutor_id):
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -691,7 +2332,7 @@ def get_lessons_tutor(tutor_id):
         current_fetched_date = request.args.get('current_fetched_date')
         timezone = request.headers.get('X-Timezone')
 
-        occurrences = get_lesson_occurrences(connection, timezone, tutor_id=tutor_id, current_fetched_date=current_fetched_date)
+        occurrences = get_lesson_occurrences(connection, timezone, tutor_id=tutor_id, current_fetched_date=current_fetched_date, **get_lesson_window_args())
 
         return occurrences, 200
     except Exception as e:
@@ -705,6 +2346,7 @@ def get_lessons_tutor(tutor_id):
 @app.route('/demo/lessons/student/<int:student_id>', methods=['GET'])
 @app.route('/lessons/student/<int:student_id>', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("lessons", "tutors", "students", "subjects", "locations", "reports")
 def get_lessons_student(student_id):
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -713,7 +2355,7 @@ def get_lessons_student(student_id):
         current_fetched_date = request.args.get('current_fetched_date')
         timezone = request.headers.get('X-Timezone')
 
-        occurrences = get_lesson_occurrences(connection, timezone, student_id=student_id, current_fetched_date=current_fetched_date)
+        occurrences = get_lesson_occurrences(connection, timezone, student_id=student_id, current_fetched_date=current_fetched_date, **get_lesson_window_args())
 
         return occurrences, 200
     except Exception as e:
@@ -724,40 +2366,107 @@ def get_lessons_student(student_id):
         if connection:
             connection.close()
 
+@app.route('/demo/lessons/changes', methods=['GET'])
+@app.route('/lessons/changes', methods=['GET'])
+@jwt_required_if_not_demo()
+def get_lesson_changes():
+    """Occurrences inserted, updated or removed since a cursor, for clients that keep a local copy of their calendar.
+    Without since only the current cursor is returned: take it before the full fetch, then sync from it."""
+    connection = get_db_connection()
+    cursor = get_cursor(connection)
+
+    try:
+        since = request.args.get('since', type=int)
+        tutor_id = request.args.get('tutor_id', type=int)
+        student_id = request.args.get('student_id', type=int)
+        current_fetched_date = request.args.get('current_fetched_date')
+        timezone = request.headers.get('X-Timezone')
+
+        changes, change_cursor, reset = read_lesson_changes(connection, since)
+
+        # a series-wide change replaces every occurrence of the lesson, otherwise only the changed occurrences are sent
+        lesson_ids = sorted({change['lesson_id'] for change in changes if change['lesson_occurrence_id'] is None})
+        occurrence_changes = [change for change in changes if change['lesson_occurrence_id'] is not None and change['lesson_id'] not in lesson_ids]
+        occurrence_ids = sorted({change['lesson_occurrence_id'] for change in occurrence_changes})
+
+        occurrences = []
+        if lesson_ids or occurrence_ids:
+            window_args = get_lesson_window_args()
+            occurrences = get_lesson_occurrences(connection, timezone, tutor_id=tutor_id, student_id=student_id, current_fetched_date=current_fetched_date,
+                                                 start=window_args['start'], end=window_args['end'], lesson_ids=lesson_ids, occurrence_ids=occurrence_ids)['lessons']
+
+        # changed occurrences that are cancelled, deleted or now outside the scope or window are removed, along with the virtual
+        # occurrence a client may still hold for the slot of a newly stored one
+        returned_ids = {occurrence['id'] for occurrence in occurrences}
+        removed_ids = set()
+        for change in occurrence_changes:
+            if change['lesson_occurrence_id'] not in returned_ids:
+                removed_ids.add(change['lesson_occurrence_id'])
+            if change['start_time']:
+                removed_ids.add(format_virtual_occurrence_id(change['lesson_id'], change['start_time']))
+
+        return jsonify({
+            "cursor": change_cursor,
+            "reset": reset,
+            "lesson_ids": lesson_ids,
+            "lessons": occurrences,
+            "removed": sorted(removed_ids, key=str)
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
 @app.route('/demo/lessons/clash', methods=["GET"])
 @app.route('/lessons/clash', methods=["GET"])
 @jwt_required_if_not_demo()
 def get_lesson_clash():
     connection = get_db_connection()
     cursor = get_cursor(connection)
-    placeholder = get_placeholder(connection)
 
     try:
         lesson_occurrence_id = request.args.get('lesson_occurrence_id')
+        lesson_id = request.args.get('lesson_id', type=int) # when checking a change to a whole series, its own occurrences don't clash
         tutor_id = request.args.get('tutor_id')
         student_id = request.args.get('student_id')
         start_time = request.args.get('start_time')
         end_time = request.args.get('end_time')
+        recurrence_rule = request.args.get('recurrence_rule')
+        timezone = request.headers.get('X-Timezone')
         start_time_formatted = string_to_datetime(start_time)
         end_time_formatted = string_to_datetime(end_time)
-        # COALESCE is used to account for any lesson exceptions (such as changing student_id or tutor_id or cancelling the lesson)
-        query = f"""
-            SELECT COUNT(lo.id) as clash_count
-            FROM LessonOccurrences lo
-            JOIN Lessons l ON lo.lesson_id = l.id
-            LEFT JOIN LessonExceptions le ON lo.id = le.lesson_occurrence_id
-            WHERE {placeholder} < COALESCE(le.exception_end_time, lo.end_time)
-            AND {placeholder} > COALESCE(le.exception_start_time, lo.start_time)
-            AND (COALESCE(le.exception_tutor_id, l.tutor_id) = {placeholder} OR COALESCE(le.exception_student_id, l.student_id) = {placeholder})
-            AND (le.exception_type IS NULL OR le.exception_type <> 'CANCEL')"""
-        parameters = [start_time_formatted, end_time_formatted, tutor_id, student_id]
 
-        if lesson_occurrence_id: # if editing existing lesson
-            query+=f" AND lo.id <> {placeholder}"
-            parameters.append(lesson_occurrence_id)
-
-        cursor.execute(query, tuple(parameters))
-        clash_count = cursor.fetchone()['clash_count']
+        # lesson exceptions (such as changing student_id or tutor_id or cancelling the lesson) are applied when the indexes are built
+        indexes = []
+        version = get_clash_data_version(connection)
+        if tutor_id:
+            indexes.append(get_interval_index(connection, 'tutor', tutor_id, version))
+        if student_id:
+            indexes.append(get_interval_index(connection, 'student', student_id, version))
+
+        def get_clashes(start, end):
+            clashes = set()
+            for index in indexes:
+                for occurrence_id, occurrence_lesson_id in index.overlapping(start, end):
+                    if str(occurrence_id) != lesson_occurrence_id and occurrence_lesson_id != lesson_id: # if editing existing lesson
+                        clashes.add(occurrence_id)
+            return clashes
+
+        if recurrence_rule: # check every occurrence of a proposed recurring lesson
+            clash_count = 0
+            clash_dates = []
+            for occurrence_start, occurrence_end in expand_recurrence(start_time_formatted, end_time_formatted, recurrence_rule, start_time_formatted,
+                                                                      start_time_formatted + timedelta(days=CLASH_SERIES_HORIZON_DAYS)):
+                clashes = get_clashes(occurrence_start, occurrence_end)
+                if clashes:
+                    clash_count += len(clashes)
+                    clash_dates.append(format_datetime_object(occurrence_start, timezone, format='date_short'))
+            return jsonify({'clash': clash_count > 0, 'clash_count': clash_count, 'clash_dates': clash_dates}), 200
+
+        clash_count = len(get_clashes(start_time_formatted, end_time_formatted))
         if clash_count > 0:
             return jsonify({'clash': True, 'clash_count': clash_count}), 200
         return jsonify({'clash': False}), 200
@@ -798,11 +2507,12 @@ def add_lesson():
         end_time = string_to_datetime(end_time)
 
         lesson_id = cursor.lastrowid
-        connection.commit()
 
         add_lesson_occurrences(connection=connection, lesson_id=lesson_id, start_time=start_time, end_time=end_time, tutor_id=tutor_id, recurrence_rule=recurrence_rule)
+        record_lesson_changes(connection, f"l.id = {placeholder}", [lesson_id])
 
         connection.commit()
+        bump_entity_versions(connection, "lessons", "invoices", "reports")
         return jsonify({'message': 'Lesson added successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e), 'message': "Error adding lesson. Please try again later"}), 500
@@ -813,6 +2523,228 @@ def add_lesson():
             connection.close()
 
 
+LESSON_IMPORT_ID_COLUMNS = {"tutor_id": "Tutors", "student_id": "Students", "subject_id": "Subjects", "location_id": "Locations"}
+
+def read_lesson_import_rows():
+    """Rows from a CSV upload (a "file" field or a text/csv body, with a header row) or a JSON list (optionally under "lessons")"""
+    if "file" in request.files:
+        return list(csv.DictReader(io.StringIO(request.files["file"].read().decode("utf-8-sig"))))
+    if request.mimetype == "text/csv":
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+    data = request.get_json()
+    rows = data.get("lessons") if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        raise ValueError("Expected a list of lessons")
+    return rows
+
+def validate_lesson_import_row(row, known_ids):
+    """Return (lesson, errors) for one imported row"""
+    errors = []
+    lesson = {"title": row.get("title") or None, "description": row.get("description") or "", "recurrence_rule": row.get("recurrence_rule") or None}
+    if not lesson["title"]:
+        errors.append("title is required")
+
+    for column, table in LESSON_IMPORT_ID_COLUMNS.items():
+        try:
+            lesson[column] = int(row.get(column))
+        except (TypeError, ValueError):
+            errors.append(f"{column} must be a number")
+            continue
+        if lesson[column] not in known_ids[column]:
+            errors.append(f"{column} {lesson[column]} does not exist")
+
+    for column in ("start_time", "end_time"):
+        try:
+            lesson[column] = string_to_datetime(str(row.get(column) or ""))
+        except ValueError:
+            errors.append(f"{column} is missing or not a recognised datetime")
+    if "start_time" in lesson and "end_time" in lesson and lesson["end_time"] <= lesson["start_time"]:
+        errors.append("end_time must be after start_time")
+
+    if lesson["recurrence_rule"]:
+        try:
+            rule = parse_recurrence_rule(lesson["recurrence_rule"])
+            if rule.get("FREQ") not in ("daily", "weekly", "monthly") or int(rule.get("INTERVAL", 1)) < 1:
+                raise ValueError()
+        except ValueError:
+            errors.append("recurrence_rule is not a valid daily, weekly or monthly rule")
+    return lesson, errors
+
+def find_lesson_import_clashes(connection, lessons):
+    """Return {row index: [clash descriptions]} against stored lessons and between the imported rows themselves"""
+    horizon = timedelta(days=CLASH_SERIES_HORIZON_DAYS)
+    intervals = {} # row index -> [(start_time, end_time)] as checked by /lessons/clash
+    batch_occurrences = {} # (role, id) -> [(start_time, end_time, row index, None)]
+    for index, lesson in lessons.items():
+        if lesson["recurrence_rule"]:
+            intervals[index] = list(expand_recurrence(lesson["start_time"], lesson["end_time"], lesson["recurrence_rule"], lesson["start_time"], lesson["start_time"] + horizon))
+        else:
+            intervals[index] = [(lesson["start_time"], lesson["end_time"])]
+        for role in ("tutor", "student"):
+            batch_occurrences.setdefault((role, lesson[f"{role}_id"]), []).extend((start, end, index, None) for start, end in intervals[index])
+
+    batch_indexes = {key: IntervalIndex(occurrences, []) for key, occurrences in batch_occurrences.items()}
+    clashes = {}
+    version = get_clash_data_version(connection)
+    for index, lesson in lessons.items():
+        for role in ("tutor", "student"):
+            stored_index = get_interval_index(connection, role, lesson[f"{role}_id"], version)
+            for start, end in intervals[index]:
+                if next(stored_index.overlapping(start, end), None):
+                    clashes.setdefault(index, []).append(f"{role} {lesson[f'{role}_id']} already has a lesson at {start.strftime('%Y-%m-%d %H:%M')}")
+                    break
+            for start, end in intervals[index]:
+                other_rows = sorted(other for other, _ in batch_indexes[(role, lesson[f"{role}_id"])].overlapping(start, end) if other != index)
+                if other_rows:
+                    clashes.setdefault(index, []).append(f"{role} {lesson[f'{role}_id']} clashes with row {other_rows[0] + 1} at {start.strftime('%Y-%m-%d %H:%M')}")
+                    break
+    return clashes
+
+def import_lessons(connection, lessons):
+    """Store validated lessons with their occurrences, invoices and reports in one transaction (committed by the caller)"""
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+
+    # the stored part of each series, as add_lesson_occurrences would expand it
+    for lesson in lessons:
+        extend_until = lesson["start_time"]
+        if lesson["recurrence_rule"]:
+            rule = parse_recurrence_rule(lesson["recurrence_rule"])
+            extend_until = max(lesson["start_time"], datetime.now()) + timedelta(days=MATERIALISE_HORIZON_DAYS)
+            if 'UNTIL' in rule:
+                extend_until = min(rule['UNTIL'], extend_until)
+        lesson["extend_until"] = extend_until
+
+    # every tutor-week the lessons fall in gets its invoice from one lookup and one batched insert
+    tutor_ids = sorted({lesson["tutor_id"] for lesson in lessons})
+    needed_weeks = set()
+    for lesson in lessons:
+        week = (lesson["start_time"] - timedelta(days=lesson["start_time"].weekday())).date()
+        last_week = (lesson["extend_until"] - timedelta(days=lesson["extend_until"].weekday())).date()
+        while week <= last_week:
+            needed_weeks.add((lesson["tutor_id"], week))
+            week += timedelta(weeks=1)
+    min_week = min(week for _, week in needed_weeks)
+    max_week = max(week for _, week in needed_weeks)
+
+    def fetch_invoices():
+        cursor.execute(f"""
+            SELECT id, tutor_id, week FROM Invoices
+            WHERE tutor_id IN ({', '.join([placeholder] * len(tutor_ids))}) AND week BETWEEN {placeholder} AND {placeholder}""",
+                       (*tutor_ids, min_week, max_week))
+        return {(row['tutor_id'], row['week']): row['id'] for row in cursor.fetchall()}
+
+    invoice_ids = fetch_invoices()
+    existing_invoice_ids = [invoice_ids[key] for key in needed_weeks if key in invoice_ids]
+    new_weeks = sorted(key for key in needed_weeks if key not in invoice_ids)
+    if new_weeks:
+        current_week = (datetime.now() - timedelta(days=datetime.now().weekday())).date()
+        cursor.executemany(f"INSERT INTO Invoices (week, status, tutor_id) VALUES ({placeholder}, {placeholder}, {placeholder})",
+                           [(week, 'upcoming' if week >= current_week else 'incomplete', tutor_id) for tutor_id, week in new_weeks])
+        invoice_ids = fetch_invoices()
+    if existing_invoice_ids: # set invoice status to ready if previously submitted as it is now modified
+        cursor.execute(f"UPDATE Invoices SET status = 'ready' WHERE status = 'submitted' AND id IN ({', '.join([placeholder] * len(existing_invoice_ids))})",
+                       tuple(existing_invoice_ids))
+
+    lesson_ids = []
+    lesson_occurrences = []
+    for lesson in lessons:
+        # one insert per lesson, as the ids of a multi-row insert aren't guaranteed to be consecutive
+        cursor.execute(f"""
+            INSERT INTO Lessons (title, description, start_time, end_time, tutor_id, student_id, subject_id, location_id, recurrence_rule, extended_until)
+            VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+        """, (lesson["title"], lesson["description"], lesson["start_time"].strftime('%Y-%m-%d %H:%M:%S'), lesson["end_time"].strftime('%Y-%m-%d %H:%M:%S'),
+              lesson["tutor_id"], lesson["student_id"], lesson["subject_id"], lesson["location_id"], lesson["recurrence_rule"],
+              lesson["start_time"].strftime('%Y-%m-%d %H:%M:%S')))
+        lesson_id = cursor.lastrowid
+        lesson_ids.append(lesson_id)
+
+        if lesson["recurrence_rule"]:
+            tutor_invoice_ids = {week: invoice_id for (tutor_id, week), invoice_id in invoice_ids.items() if tutor_id == lesson["tutor_id"]}
+            add_lesson_occurrences(connection=connection, lesson_id=lesson_id, start_time=lesson["start_time"], end_time=lesson["end_time"],
+                                   recurrence_rule=lesson["recurrence_rule"], invoice_ids=tutor_invoice_ids, lesson_occurrences=lesson_occurrences,
+                                   execute_immediately=False, extend_until=lesson["extend_until"])
+        else:
+            week = (lesson["start_time"] - timedelta(days=lesson["start_time"].weekday())).date()
+            lesson_occurrences.append((lesson_id, lesson["start_time"].strftime('%Y-%m-%d %H:%M:%S'), lesson["end_time"].strftime('%Y-%m-%d %H:%M:%S'),
+                                       invoice_ids[(lesson["tutor_id"], week)]))
+
+    cursor.executemany(f"""
+        INSERT INTO LessonOccurrences (lesson_id, start_time, end_time, invoice_id)
+        VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})""", lesson_occurrences)
+    lesson_placeholders = ", ".join([placeholder] * len(lesson_ids))
+    # only the new occurrences need reports, rather than the full scan create_reports does
+    cursor.execute(f"""
+        INSERT INTO Reports (lesson_occurrence_id, status)
+        SELECT lo.id, 'empty' FROM LessonOccurrences lo
+        LEFT JOIN Reports r ON lo.id = r.lesson_occurrence_id
+        WHERE lo.lesson_id IN ({lesson_placeholders}) AND r.lesson_occurrence_id IS NULL""", tuple(lesson_ids))
+    mark_invoices_dirty(connection, [occurrence[3] for occurrence in lesson_occurrences] + [invoice_ids[key] for key in new_weeks]) # empty new invoices are removed again
+    record_lesson_changes(connection, f"l.id IN ({lesson_placeholders})", lesson_ids)
+
+    cursor.close()
+    return {"lesson_ids": lesson_ids, "occurrences_created": len(lesson_occurrences), "invoices_created": len(new_weeks)}
+
+@app.route('/demo/lessons/import', methods=['POST'])
+@app.route('/lessons/import', methods=['POST'])
+@jwt_required_if_not_demo()
+def import_lessons_route():
+    """Create many lessons at once. Every row is validated and checked for clashes before anything is written, and either all
+    rows are stored in one transaction or none are. Pass allow_clashes=true to store clashing rows anyway, dry_run=true to only validate."""
+    connection = get_db_connection()
+    cursor = get_cursor(connection)
+
+    try:
+        try:
+            rows = read_lesson_import_rows()
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return jsonify({'error': str(e), 'message': 'Could not read the lessons to import'}), 400
+        if not rows:
+            return jsonify({'message': 'No lessons to import'}), 400
+        options = request.get_json(silent=True) if request.is_json else None
+        options = options if isinstance(options, dict) else {}
+        allow_clashes = str(request.args.get('allow_clashes', options.get('allow_clashes', False))).lower() == 'true'
+        dry_run = str(request.args.get('dry_run', options.get('dry_run', False))).lower() == 'true'
+
+        known_ids = {}
+        for column, table in LESSON_IMPORT_ID_COLUMNS.items():
+            cursor.execute(f"SELECT id FROM {table}")
+            known_ids[column] = {row['id'] for row in cursor.fetchall()}
+
+        lessons = {}
+        row_errors = {}
+        for index, row in enumerate(rows):
+            lesson, errors = validate_lesson_import_row(row if isinstance(row, dict) else {}, known_ids)
+            if errors:
+                row_errors[index] = errors
+            else:
+                lessons[index] = lesson
+        if not allow_clashes:
+            for index, clashes in find_lesson_import_clashes(connection, lessons).items():
+                row_errors.setdefault(index, []).extend(clashes)
+
+        if row_errors:
+            return jsonify({
+                'message': f"{len(row_errors)} of {len(rows)} lessons could not be imported, nothing was saved",
+                'errors': [{'row': index + 1, 'errors': errors} for index, errors in sorted(row_errors.items())]
+            }), 400
+        if dry_run:
+            return jsonify({'message': f"{len(rows)} lessons are ready to import"}), 200
+
+        summary = import_lessons(connection, [lessons[index] for index in range(len(rows))])
+        connection.commit()
+        bump_entity_versions(connection, "lessons", "invoices", "reports")
+        return jsonify({'message': f"{len(rows)} lessons imported successfully", **summary}), 200
+    except Exception as e:
+        connection.rollback()
+        return jsonify({'error': str(e), 'message': "Error importing lessons. Please try again later"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+
 @app.route('/demo/lesson_exceptions', methods=['POST'])
 @app.route('/lesson_exceptions', methods=['POST'])
 @jwt_required_if_not_demo()
@@ -823,7 +2755,7 @@ def add_lesson_exception():
 
     try:
         data = request.json
-        lesson_occurrence_id = data['lesson_occurrence_id']
+        lesson_occurrence_id = resolve_occurrence_id(connection, data['lesson_occurrence_id'])
         fields_to_update = {
             'exception_type': data.get('exception_type', False),
             'exception_title': data.get('title', False),
@@ -862,6 +2794,10 @@ def add_lesson_exception():
             cursor.execute(f"UPDATE Invoices SET status = 'ready' WHERE status = 'submitted' AND id = {placeholder}", (invoice_id,)) # set invoice status to ready if previously submitted as it is now modified
             fields_to_update['exception_invoice_id'] = invoice_id
 
+        # the occurrence's current invoices and the one it is moved into need their status recomputed
+        mark_occurrence_invoices_dirty(connection, f"lo.id = {placeholder}", [lesson_occurrence_id])
+        record_occurrence_changes(connection, f"lo.id = {placeholder}", [lesson_occurrence_id])
+        mark_invoices_dirty(connection, [fields_to_update.get('exception_invoice_id')])
 
         columns = ", ".join(fields_to_update.keys())
         placeholders = ", ".join([placeholder] * len(fields_to_update))
@@ -883,6 +2819,7 @@ def add_lesson_exception():
 
         cursor.execute(query, tuple(parameters))
         connection.commit()
+        bump_entity_versions(connection, "lessons", "invoices", "reports")
 
         return jsonify({'message': "Lesson deleted successfully" if data.get('exception_type') == "CANCEL" else "Lesson updated successfully"}), 200
     except Exception as e:
@@ -893,6 +2830,45 @@ def add_lesson_exception():
         if connection:
             connection.close()
 
+def add_interval_sql(connection, expression, amount, unit):
+    """SQL for the datetime expression plus amount (an SQL expression) units, where unit is second or day"""
+    if is_sqlite_connection(connection):
+        return f"DATETIME({expression}, ({amount}) || ' {unit}s')"
+    return f"({expression} + INTERVAL ({amount}) {unit.upper()})"
+
+def weekday_sql(connection, expression):
+    """SQL for the weekday of a datetime expression, Monday being 0 as with datetime.weekday()"""
+    if is_sqlite_connection(connection):
+        return f"((CAST(STRFTIME('%w', {expression}) AS INTEGER) + 6) % 7)"
+    return f"WEEKDAY({expression})"
+
+def seconds_since_midnight(time_of_day):
+    return time_of_day.hour * 3600 + time_of_day.minute * 60 + time_of_day.second
+
+def reassign_occurrence_invoices(connection, lesson_id, tutor_id):
+    """Point occurrences of a lesson that were moved into another week at that week's invoice"""
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    cursor.execute(f"""
+        SELECT lo.id, lo.start_time, lo.invoice_id, i.week
+        FROM LessonOccurrences lo
+        LEFT JOIN Invoices i ON i.id = lo.invoice_id
+        WHERE lo.lesson_id = {placeholder}""", (lesson_id,))
+    moved = []
+    for occurrence in cursor.fetchall():
+        start_time = string_to_datetime(occurrence['start_time']) if isinstance(occurrence['start_time'], str) else occurrence['start_time']
+        if occurrence['week'] != (start_time - timedelta(days=start_time.weekday())).date():
+            moved.append((occurrence['id'], start_time, occurrence['invoice_id']))
+
+    if moved:
+        invoice_ids = get_or_create_invoices(connection, min(start for _, start, _ in moved), max(start for _, start, _ in moved), tutor_id)
+        new_invoice_ids = [invoice_ids[(start - timedelta(days=start.weekday())).date()] for _, start, _ in moved]
+        cursor.executemany(f"UPDATE LessonOccurrences SET invoice_id = {placeholder} WHERE id = {placeholder}",
+                           [(invoice_id, occurrence_id) for (occurrence_id, _, _), invoice_id in zip(moved, new_invoice_ids)])
+        mark_invoices_dirty(connection, new_invoice_ids + [invoice_id for _, _, invoice_id in moved])
+    cursor.close()
+    return len(moved)
+
 @app.route('/demo/lessons/<int:lesson_id>', methods=['PUT'])
 @app.route('/lessons/<int:lesson_id>', methods=['PUT'])
 @jwt_required_if_not_demo()
@@ -904,12 +2880,15 @@ def update_lesson(lesson_id):
     try:
         new_lesson_data = request.json
 
-        lesson_occurrence_id = new_lesson_data.pop('lesson_occurrence_id')
+        lesson_occurrence_id = resolve_occurrence_id(connection, new_lesson_data.pop('lesson_occurrence_id'))
         update_type = new_lesson_data.pop('update_type')
 
         if not new_lesson_data:
             return jsonify({"message": "No lesson data provided"}), 400
 
+        mark_occurrence_invoices_dirty(connection, f"lo.lesson_id = {placeholder}", [lesson_id]) # before any occurrences are moved or deleted
+        record_lesson_changes(connection, f"l.id = {placeholder}", [lesson_id])
+
         # get original lesson details
         cursor.execute(f"SELECT * FROM Lessons WHERE id = {placeholder}", (lesson_id,))
         original_lesson_data = cursor.fetchone()
@@ -1013,6 +2992,7 @@ def update_lesson(lesson_id):
                     cursor.execute(insert_query, parameters)
 
                     new_lesson_id = cursor.lastrowid
+                    record_lesson_changes(connection, f"l.id = {placeholder}", [new_lesson_id])
 
                     # manually insert first lesson occurrence so that the report_id can be set correctly
                     cursor.execute(f"""
@@ -1020,6 +3000,7 @@ def update_lesson(lesson_id):
                         VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})""", (new_lesson_id, start_time, end_time, new_invoice_id))
 
                     new_lesson_occurrence_id = cursor.lastrowid
+                    mark_invoices_dirty(connection, [new_invoice_id])
 
                     # transfer the report to the new lesson occurrence
                     cursor.execute(f"""
@@ -1070,27 +3051,26 @@ def update_lesson(lesson_id):
 
         # updating lesson time (not date) of recurring lesson
         elif original_lesson_data.get('recurrence_rule') and new_lesson_data.get('start_time'):
-            cursor.execute(f"SELECT id, start_time FROM LessonOccurrences WHERE lesson_id = {placeholder} AND start_time >= {placeholder}", (lesson_id, current_occurrence_date))
-            lesson_occurrences = cursor.fetchall()
-
-            for lesson_occurrence in lesson_occurrences:
-                occurrence_id = lesson_occurrence['id']
-                existing_start_time = lesson_occurrence['start_time']
-
-                # extract the date from the current occurrence's start_time
-                existing_date = existing_start_time.date()
+            new_start_time = string_to_datetime(new_lesson_data.get('start_time')).time()
+            new_end_time = string_to_datetime(new_lesson_data.get('end_time')).time()
 
-                # get the time part from the new lesson data
-                new_start_time = string_to_datetime(new_lesson_data.get('start_time')).time()
-                new_end_time = string_to_datetime(new_lesson_data.get('end_time')).time()
-
-                # combine the original date with the new times
-                updated_start_time = datetime.combine(existing_date, new_start_time)
-                updated_end_time = datetime.combine(existing_date, new_end_time)
-
-                # update the specific occurrence by its id
-                cursor.execute(f"UPDATE LessonOccurrences SET start_time = {placeholder}, end_time = {placeholder} WHERE id = {placeholder}",
-                            (updated_start_time, updated_end_time, occurrence_id))
+            # every following occurrence keeps its date and takes the new times, in one statement
+            # (start_time is assigned last as MySQL evaluates later assignments against the values already updated)
+            cursor.execute(f"""
+                UPDATE LessonOccurrences
+                SET end_time = {add_interval_sql(connection, "DATE(start_time)", placeholder, "second")},
+                    start_time = {add_interval_sql(connection, "DATE(start_time)", placeholder, "second")}
+                WHERE lesson_id = {placeholder} AND start_time >= {placeholder}""",
+                           (seconds_since_midnight(new_end_time), seconds_since_midnight(new_start_time), lesson_id, current_occurrence_date))
+
+            # occurrences after extended_until are expanded from the lesson itself, so it needs the new times as well
+            lesson_times = {key: string_to_datetime(original_lesson_data[key]) if isinstance(original_lesson_data[key], str) else original_lesson_data[key]
+                            for key in ('start_time', 'end_time', 'extended_until')}
+            cursor.execute(f"UPDATE Lessons SET start_time = {placeholder}, end_time = {placeholder}, extended_until = {placeholder} WHERE id = {placeholder}", (
+                datetime.combine(lesson_times['start_time'].date(), new_start_time),
+                datetime.combine(lesson_times['end_time'].date(), new_end_time),
+                datetime.combine(lesson_times['extended_until'].date(), new_start_time) if lesson_times['extended_until'] else None,
+                lesson_id))
 
         # if modifying recurring lesson but not changing recurrence rule
         elif original_lesson_data.get('recurrence_rule'):
@@ -1115,6 +3095,7 @@ def update_lesson(lesson_id):
             add_lesson_occurrences(connection=connection, lesson_id=lesson_id, start_time=start_time, end_time=end_time, tutor_id=original_lesson_data['tutor_id'], recurrence_rule=recurrence_rule, ignore_first_occurrence=True)
 
         connection.commit()
+        bump_entity_versions(connection, "lessons", "invoices", "reports")
 
         return jsonify({'message': f'Lesson {"updated" if update_type == "MODIFY" else "deleted"} successfully'}), 200
     except Exception as e:
@@ -1126,38 +3107,249 @@ def update_lesson(lesson_id):
             connection.close()
 
 
-@app.route('/demo/lesson_occurrences/<int:lesson_occurrence_id>', methods=['PUT'])
-@app.route('/lesson_occurrences/<int:lesson_occurrence_id>', methods=['PUT'])
+@app.route('/demo/lessons/<int:lesson_id>/reschedule', methods=['PUT'])
+@app.route('/lessons/<int:lesson_id>/reschedule', methods=['PUT'])
+@jwt_required_if_not_demo()
+def reschedule_lesson(lesson_id):
+    """Move a recurring lesson, from lesson_occurrence_id onwards or the whole series if it is left out, either by
+    shift_minutes or to another weekday (0 being Monday) of the same week. Lesson exceptions keep their own times."""
+    connection = get_db_connection()
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+
+    try:
+        data = request.json
+        shift_minutes = data.get('shift_minutes')
+        weekday = data.get('weekday')
+        if (shift_minutes is None) == (weekday is None):
+            return jsonify({'message': 'Provide either shift_minutes or weekday'}), 400
+        if shift_minutes is not None and (not isinstance(shift_minutes, int) or isinstance(shift_minutes, bool) or shift_minutes == 0):
+            return jsonify({'message': 'shift_minutes must be a whole number of minutes other than 0'}), 400
+        if weekday is not None and (not isinstance(weekday, int) or isinstance(weekday, bool) or not 0 <= weekday <= 6):
+            return jsonify({'message': 'weekday must be between 0 (Monday) and 6 (Sunday)'}), 400
+
+        cursor.execute(f"SELECT tutor_id, recurrence_rule FROM Lessons WHERE id = {placeholder}", (lesson_id,))
+        lesson = cursor.fetchone()
+        if not lesson:
+            return jsonify({'message': 'Lesson not found'}), 404
+        if not lesson['recurrence_rule']:
+            return jsonify({'message': 'Only recurring lessons can be rescheduled'}), 400
+        if weekday is not None and parse_recurrence_rule(lesson['recurrence_rule']).get('FREQ') != 'weekly':
+            return jsonify({'message': 'Only weekly lessons can be moved to another weekday'}), 400
+
+        condition = f"lo.lesson_id = {placeholder}"
+        parameters = [lesson_id]
+        if data.get('lesson_occurrence_id') is not None:
+            try: # a virtual occurrence is stored first, in this transaction
+                lesson_occurrence_id = resolve_occurrence_id(connection, data['lesson_occurrence_id'])
+            except ValueError:
+                return jsonify({'message': 'Lesson occurrence not found'}), 404
+            cursor.execute(f"SELECT start_time FROM LessonOccurrences WHERE id = {placeholder} AND lesson_id = {placeholder}",
+                           (lesson_occurrence_id, lesson_id))
+            occurrence = cursor.fetchone()
+            if not occurrence:
+                return jsonify({'message': 'Lesson occurrence not found'}), 404
+            condition += f" AND lo.start_time >= {placeholder}"
+            parameters.append(occurrence['start_time'])
+
+        if shift_minutes is not None:
+            amount, amount_parameter, unit = placeholder, shift_minutes * 60, "second"
+        else: # the same number of days for every occurrence, as they all fall on the lesson's weekday
+            amount, amount_parameter, unit = f"{placeholder} - {weekday_sql(connection, 'start_time')}", weekday, "day"
+
+        mark_occurrence_invoices_dirty(connection, condition, parameters) # before the occurrences are moved
+        record_lesson_changes(connection, f"l.id = {placeholder}", [lesson_id])
+
+        # one statement for the whole series, with start_time assigned last as MySQL evaluates later assignments against the values already updated
+        cursor.execute(f"""
+            UPDATE LessonOccurrences AS lo
+            SET end_time = {add_interval_sql(connection, "end_time", amount, unit)},
+                start_time = {add_interval_sql(connection, "start_time", amount, unit)}
+            WHERE {condition}""", (amount_parameter, amount_parameter, *parameters))
+        occurrences_moved = cursor.rowcount
+
+        # occurrences after extended_until are expanded from the lesson itself, so it moves with them
+        cursor.execute(f"""
+            UPDATE Lessons
+            SET end_time = {add_interval_sql(connection, "end_time", amount, unit)},
+                extended_until = {add_interval_sql(connection, "extended_until", amount, unit)},
+                start_time = {add_interval_sql(connection, "start_time", amount, unit)}
+            WHERE id = {placeholder}""", (amount_parameter, amount_parameter, amount_parameter, lesson_id))
+
+        # moving to a weekday stays within the week, but a shift can cross into the next or previous one
+        invoices_reassigned = reassign_occurrence_invoices(connection, lesson_id, lesson['tutor_id']) if shift_minutes is not None else 0
+
+        connection.commit()
+        bump_entity_versions(connection, "lessons", "invoices", "reports")
+
+        return jsonify({'message': 'Lesson rescheduled successfully', 'occurrences_moved': occurrences_moved, 'invoices_reassigned': invoices_reassigned}), 200
+    except Exception as e:
+        connection.rollback()
+        return jsonify({'error': str(e), 'message': "Error rescheduling lesson. Please try again later"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+@app.route('/demo/lesson_occurrences/<lesson_occurrence_id>', methods=['PUT'])
+@app.route('/lesson_occurrences/<lesson_occurrence_id>', methods=['PUT'])
+@jwt_required_if_not_demo()
+def update_lesson_occurrence(lesson_occurrence_id):
+    connection = get_db_connection()
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+
+    try:
+        data = request.json
+        fields_to_update = {
+            'actual_start_time': data.get('actual_start_time', False),
+            'actual_end_time': data.get('actual_end_time', False),
+            'attendance_status': data.get('attendance_status', False),
+            'attendance_code': data.get('attendance_code', False),
+        } # differentiate between missing keys and None values
+
+        fields_to_update = {k: v for k, v in fields_to_update.items() if v is not False} # filter out False values (missing keys)
+        if not fields_to_update:
+            return jsonify({'message': 'No valid fields to update'}), 400
+
+        set_clause = ", ".join(f"{field} = {placeholder}" for field in fields_to_update.keys())
+        query = f"UPDATE LessonOccurrences SET {set_clause} WHERE id = {placeholder}"
+        parameters = list(fields_to_update.values())
+        parameters.append(resolve_occurrence_id(connection, lesson_occurrence_id))
+
+        cursor.execute(query, tuple(parameters))
+        record_occurrence_changes(connection, f"lo.id = {placeholder}", [parameters[-1]])
+        connection.commit()
+        bump_entity_versions(connection, "lessons", "invoices", "reports")
+
+        return jsonify({'message': 'Lesson updated successfully'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e), 'message': "Error updating lesson. Please try again later"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+ATTENDANCE_FIELDS = ("attendance_status", "attendance_code", "actual_start_time", "actual_end_time")
+ATTENDANCE_STATUSES = ("present", "absent", "disrupted")
+ATTENDANCE_BATCH_CHUNK_SIZE = 200 # occurrences per UPDATE, each adding up to 9 parameters
+
+def validate_attendance_entry(entry):
+    """Return (fields to update, errors) for one entry of a batch attendance update"""
+    if not isinstance(entry, dict):
+        return {}, ["entry must be an object"]
+    errors = []
+    fields = {field: entry[field] for field in ATTENDANCE_FIELDS if field in entry} # a missing key leaves the column as it is, None clears it
+    if not fields:
+        errors.append("no attendance fields to update")
+    if fields.get("attendance_status") not in (None, *ATTENDANCE_STATUSES):
+        errors.append(f"attendance_status must be one of {', '.join(ATTENDANCE_STATUSES)}")
+    if fields.get("attendance_code") is not None and fields["attendance_code"] not in get_attendance_code_text(get_map=True):
+        errors.append(f"attendance_code {fields['attendance_code']} is not a known attendance code")
+    for field in ("actual_start_time", "actual_end_time"):
+        if fields.get(field) is not None:
+            try:
+                fields[field] = string_to_datetime(str(fields[field])).strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                errors.append(f"{field} is not a recognised datetime")
+    return fields, errors
+
+@app.route('/demo/lesson_occurrences/attendance', methods=['PUT'])
+@app.route('/lesson_occurrences/attendance', methods=['PUT'])
 @jwt_required_if_not_demo()
-def update_lesson_occurrence(lesson_occurrence_id):
+def update_attendance_batch():
+    """Record attendance for many lesson occurrences at once. Takes a list (optionally under "occurrences") of
+    {occurrence_id, attendance_status, attendance_code, actual_start_time, actual_end_time} and returns a result per entry;
+    invalid entries are skipped and the valid ones are written in one transaction."""
     connection = get_db_connection()
     cursor = get_cursor(connection)
     placeholder = get_placeholder(connection)
 
     try:
         data = request.json
-        fields_to_update = {
-            'actual_start_time': data.get('actual_start_time', False),
-            'actual_end_time': data.get('actual_end_time', False),
-            'attendance_status': data.get('attendance_status', False),
-            'attendance_code': data.get('attendance_code', False),
-        } # differentiate between missing keys and None values
-
-        fields_to_update = {k: v for k, v in fields_to_update.items() if v is not False} # filter out False values (missing keys)
-        if not fields_to_update:
-            return jsonify({'message': 'No valid fields to update'}), 400
+        entries = data.get("occurrences") if isinstance(data, dict) else data
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'message': 'No attendance to update'}), 400
+
+        results = []
+        valid_entries = [] # (result, fields) of the entries that passed validation
+        for entry in entries:
+            occurrence_id = entry.get("occurrence_id") if isinstance(entry, dict) else None
+            result = {"occurrence_id": occurrence_id}
+            results.append(result)
+            fields, errors = validate_attendance_entry(entry)
+            if occurrence_id is None and isinstance(entry, dict):
+                errors.insert(0, "occurrence_id is required")
+            if errors:
+                result.update(status="error", errors=errors)
+            else:
+                valid_entries.append((result, fields))
 
-        set_clause = ", ".join(f"{field} = {placeholder}" for field in fields_to_update.keys())
-        query = f"UPDATE LessonOccurrences SET {set_clause} WHERE id = {placeholder}"
-        parameters = list(fields_to_update.values())
-        parameters.append(lesson_occurrence_id)
+        # virtual occurrences are stored before any attendance is written, each lesson's series once up to the latest of them.
+        # the rows are left in this transaction, so they are committed with the attendance or not at all
+        store_until = {} # lesson id -> start time of its latest virtual occurrence in the batch
+        for result, _ in valid_entries:
+            if is_virtual_occurrence_id(result["occurrence_id"]):
+                try:
+                    lesson_id, start_time = parse_virtual_occurrence_id(result["occurrence_id"])
+                except ValueError:
+                    continue # reported as not existing below
+                store_until[lesson_id] = max(start_time, store_until.get(lesson_id, start_time))
+        for lesson_id, start_time in store_until.items():
+            materialise_recurring_lessons(connection, start_time + timedelta(minutes=1), lesson_id=lesson_id, commit=False)
 
-        cursor.execute(query, tuple(parameters))
+        updates = {} # stored occurrence id -> fields
+        for result, fields in valid_entries:
+            try:
+                stored_id = find_stored_occurrence_id(connection, result["occurrence_id"])
+            except (ValueError, TypeError):
+                stored_id = None
+            if stored_id is None:
+                result.update(status="error", errors=[f"lesson occurrence {result['occurrence_id']} does not exist"])
+            elif stored_id in updates:
+                result.update(status="error", errors=["lesson occurrence appears more than once"])
+            else:
+                result.update(id=stored_id, status="updated")
+                updates[stored_id] = fields
+
+        occurrence_ids = list(updates)
+        existing_ids = set()
+        for chunk_start in range(0, len(occurrence_ids), ATTENDANCE_BATCH_CHUNK_SIZE):
+            chunk = occurrence_ids[chunk_start:chunk_start + ATTENDANCE_BATCH_CHUNK_SIZE]
+            cursor.execute(f"SELECT id FROM LessonOccurrences WHERE id IN ({', '.join([placeholder] * len(chunk))})", tuple(chunk))
+            existing_ids.update(row['id'] for row in cursor.fetchall())
+        for result in results:
+            if result["status"] == "updated" and result["id"] not in existing_ids:
+                del updates[result.pop("id")]
+                result.update(status="error", errors=[f"lesson occurrence {result['occurrence_id']} does not exist"])
+
+        # one UPDATE per chunk, each column picking its new value per id and keeping the old one for ids that don't set it
+        occurrence_ids = list(updates)
+        for chunk_start in range(0, len(occurrence_ids), ATTENDANCE_BATCH_CHUNK_SIZE):
+            chunk = occurrence_ids[chunk_start:chunk_start + ATTENDANCE_BATCH_CHUNK_SIZE]
+            set_clauses = []
+            parameters = []
+            for field in ATTENDANCE_FIELDS:
+                setting_ids = [occurrence_id for occurrence_id in chunk if field in updates[occurrence_id]]
+                if setting_ids:
+                    set_clauses.append(f"{field} = CASE id {' '.join([f'WHEN {placeholder} THEN {placeholder}'] * len(setting_ids))} ELSE {field} END")
+                    for occurrence_id in setting_ids:
+                        parameters.extend((occurrence_id, updates[occurrence_id][field]))
+            chunk_placeholders = ", ".join([placeholder] * len(chunk))
+            cursor.execute(f"UPDATE LessonOccurrences SET {', '.join(set_clauses)} WHERE id IN ({chunk_placeholders})", (*parameters, *chunk))
+            record_occurrence_changes(connection, f"lo.id IN ({chunk_placeholders})", chunk)
+
+        if not updates:
+            return jsonify({'message': 'No attendance was updated', 'results': results}), 400
         connection.commit()
+        bump_entity_versions(connection, "lessons", "invoices", "reports")
 
-        return jsonify({'message': 'Lesson updated successfully'}), 200
+        return jsonify({'message': f"Attendance updated for {len(updates)} of {len(entries)} lessons", 'results': results}), 200
     except Exception as e:
-        return jsonify({'error': str(e), 'message': "Error updating lesson. Please try again later"}), 500
+        connection.rollback()
+        return jsonify({'error': str(e), 'message': "Error updating attendance. Please try again later"}), 500
     finally:
         if cursor:
             cursor.close()
@@ -1167,6 +3359,7 @@ def update_lesson_occurrence(lesson_occurrence_id):
 @app.route('/demo/invoices/tutor/<int:tutor_id>', methods=['GET'])
 @app.route('/invoices/tutor/<int:tutor_id>', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("invoices", "lessons", "reports", "tutors", "students")
 def get_invoices_tutor(tutor_id):
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -1194,6 +3387,7 @@ def get_invoices_tutor(tutor_id):
 @app.route('/demo/invoices/admin', methods=['GET'])
 @app.route('/invoices/admin', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("invoices", "lessons", "reports", "tutors", "students")
 def get_invoices_admin():
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -1370,13 +3564,14 @@ def get_invoice_student_report(invoice_id, student_id, timezone=None):
             """, (invoice_id, student_id))
 
         results = cursor.fetchall()
+        report_contents = get_report_contents(connection, [result['id'] for result in results])
         for result in results:
             result["title"] = f"Report No. {str(result['id']).zfill(5)}"
             result["date"] = result['start_time'].strftime("%d/%m/%Y")
             result["lesson_time_short"] = format_lesson_datetime_object(result['start_time'], result['end_time'], timezone)
             result['attendance_status_complete'] = get_complete_attendance_status(result, timezone)
             result["status_text"] = get_report_status_text(result['status'])
-            result["content"] = get_report(result['id'])[0]
+            result["content"] = report_contents[result['id']]
             result['safeguarding_concern'] = result['safeguarding_concern']
         overall_status = 'empty'
         if all(result['status'] == 'submitted' for result in results):
@@ -1447,7 +3642,9 @@ def update_invoice(invoice_id=None):
             """
             parameters.append(invoice_id)
         cursor.execute(query, tuple(parameters))
+        mark_invoices_dirty(connection, invoice_ids if invoice_ids and isinstance(invoice_ids, list) else [invoice_id])
         connection.commit()
+        bump_entity_versions(connection, "invoices")
 
         return jsonify({"message": "Invoice(s) updated successfully"}), 200
     except Exception as e:
@@ -1461,6 +3658,7 @@ def update_invoice(invoice_id=None):
 @app.route('/demo/reports/tutor/<int:tutor_id>', methods=['GET'])
 @app.route('/reports/tutor/<int:tutor_id>', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("reports", "lessons", "invoices", "tutors", "students", "subjects", "locations")
 def get_reports_tutor(tutor_id):
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -1513,6 +3711,7 @@ def get_reports_tutor(tutor_id):
 @app.route('/demo/reports/admin', methods=['GET'])
 @app.route('/reports/admin', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("reports", "lessons", "invoices", "tutors", "students", "subjects", "locations")
 def get_reports_admin():
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -1565,17 +3764,8 @@ def get_reports_admin():
 def get_report(report_id):
     connection = get_db_connection()
     cursor = get_cursor(connection)
-    placeholder = get_placeholder(connection)
     try:
-        demo = request.path.startswith("/demo/")
-        query = f"""
-            SELECT ra.answer_text, ra.answer_boolean, ra.answer_number, ra.answer_option, rq.id, rq.title, rq.type, rq.options, rq.hidden, {'rq."order"' if demo else 'rq.order'} FROM ReportQuestions rq
-            LEFT JOIN ReportAnswers ra ON rq.id = ra.question_id AND ra.report_id = {placeholder}
-        """
-        cursor.execute(query, (report_id,))
-        results = cursor.fetchall()
-
-        return results, 200
+        return get_report_contents(connection, [report_id])[report_id], 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1586,6 +3776,74 @@ def get_report(report_id):
             connection.close()
 
 
+def apply_report_update(connection, data, report_id=None):
+    """Write a report's status and answers, or the status of every report in data['report_ids'], leaving the commit to the caller"""
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    status = data.get('status')
+    report_ids = data.get('report_ids')
+
+    # If a list of report IDs is passed, update them all
+    if report_ids and isinstance(report_ids, list):
+        format_strings = ','.join([placeholder] * len(report_ids))
+        query = f"""
+            UPDATE Reports
+            SET status = {placeholder}
+            WHERE id IN ({format_strings})
+        """
+        cursor.execute(query, [status] + report_ids)
+    else:
+        # Otherwise, use the single report_id from the URL
+        cursor.execute(f"""
+            UPDATE Reports
+            SET status = {placeholder}
+            WHERE id = {placeholder}
+        """, (status, report_id))
+
+    updated_report_ids = report_ids if report_ids and isinstance(report_ids, list) else [report_id]
+    mark_occurrence_invoices_dirty(connection, f"lo.id IN (SELECT lesson_occurrence_id FROM Reports WHERE id IN ({', '.join([placeholder] * len(updated_report_ids))}))", updated_report_ids)
+    record_occurrence_changes(connection, f"lo.id IN (SELECT lesson_occurrence_id FROM Reports WHERE id IN ({', '.join([placeholder] * len(updated_report_ids))}))", updated_report_ids)
+
+    content = data.get('content')
+    if content:
+        if not isinstance(content, list):
+            content = [content]
+
+        queries_and_data = []
+
+        for item in content:
+            answer_col = f"answer_{item['type']}"  # e.g. answer_boolean, answer_text
+
+            if request.path.startswith("/demo/"):  # SQLite
+                query = f"""
+                    INSERT INTO ReportAnswers (question_id, report_id, {answer_col})
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(question_id, report_id) DO UPDATE SET {answer_col} = excluded.{answer_col}
+                """
+            else:  # MySQL
+                query = f"""
+                    INSERT INTO ReportAnswers (question_id, report_id, {answer_col})
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE {answer_col} = VALUES({answer_col})
+                """
+
+            data = (item.get('id'), report_id, item.get(answer_col))
+            queries_and_data.append((query, data))
+
+            if item.get('id') == 6 and item.get('answer_boolean') is not None:
+                update_query = f"""
+                           UPDATE Reports
+                           SET safeguarding_concern = {placeholder}
+                           WHERE id = {placeholder}
+                """
+                cursor.execute(update_query, (item.get('answer_boolean'), report_id))
+
+        # Now execute each query with its data
+        for query, data in queries_and_data:
+            cursor.execute(query, data)
+
+    cursor.close()
+
 @app.route('/demo/reports', methods=['PUT'])
 @app.route('/demo/reports/<int:report_id>', methods=['PUT'])
 @app.route('/reports', methods=['PUT'])
@@ -1593,73 +3851,45 @@ def get_report(report_id):
 @jwt_required_if_not_demo()
 def update_report(report_id=None):
     connection = get_db_connection()
-    cursor = get_cursor(connection)
-    placeholder = get_placeholder(connection)
     try:
-        data = request.json
-        status = data.get('status')
-        report_ids = data.get('report_ids')
-
-        # If a list of report IDs is passed, update them all
-        if report_ids and isinstance(report_ids, list):
-            format_strings = ','.join([placeholder] * len(report_ids))
-            query = f"""
-                UPDATE Reports
-                SET status = {placeholder}
-                WHERE id IN ({format_strings})
-            """
-            cursor.execute(query, [status] + report_ids)
-        else:
-            # Otherwise, use the single report_id from the URL
-            cursor.execute(f"""
-                UPDATE Reports
-                SET status = {placeholder}
-                WHERE id = {placeholder}
-            """, (status, report_id))
-
-        content = data.get('content')
-        if content:
-            if not isinstance(content, list):
-                content = [content]
-
-            queries_and_data = []
-
-            for item in content:
-                answer_col = f"answer_{item['type']}"  # e.g. answer_boolean, answer_text
-
-                if request.path.startswith("/demo/"):  # SQLite
-                    query = f"""
-                        INSERT INTO ReportAnswers (question_id, report_id, {answer_col})
-                        VALUES (?, ?, ?)
-                        ON CONFLICT(question_id, report_id) DO UPDATE SET {answer_col} = excluded.{answer_col}
-                    """
-                else:  # MySQL
-                    query = f"""
-                        INSERT INTO ReportAnswers (question_id, report_id, {answer_col})
-                        VALUES (%s, %s, %s)
-                        ON DUPLICATE KEY UPDATE {answer_col} = VALUES({answer_col})
-                    """
+        apply_report_update(connection, request.json, report_id)
+        connection.commit()
+        bump_entity_versions(connection, "reports", "invoices")
 
-                data = (item.get('id'), report_id, item.get(answer_col))
-                queries_and_data.append((query, data))
+        return jsonify({'message': "Report updated successfully"}), 200
 
-                if item.get('id') == 6 and item.get('answer_boolean') is not None:
-                    update_query = f"""
-                               UPDATE Reports
-                               SET safeguarding_concern = {placeholder}
-                               WHERE id = {placeholder}
-                    """
-                    cursor.execute(update_query, (item.get('answer_boolean'), report_id))
+    except Exception as e:
+        return jsonify({'error': str(e), 'message': 'Error processing report. Please try again later'}), 500
+    finally:
+        if connection:
+            connection.close()
 
-            # Now execute each query with its data
-            for query, data in queries_and_data:
-                cursor.execute(query, data)
+@app.route('/demo/lessons/<lesson_occurrence_id>/report', methods=['PUT'])
+@app.route('/lessons/<lesson_occurrence_id>/report', methods=['PUT'])
+@jwt_required_if_not_demo()
+def update_lesson_report(lesson_occurrence_id):
+    """Save the report of a lesson occurrence. A virtual occurrence is stored first, in the same transaction as the report"""
+    connection = get_db_connection()
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    try:
+        try:
+            lesson_occurrence_id = resolve_occurrence_id(connection, lesson_occurrence_id)
+        except ValueError:
+            return jsonify({'message': 'Lesson report does not exist'}), 404
+        cursor.execute(f"SELECT id FROM Reports WHERE lesson_occurrence_id = {placeholder}", (lesson_occurrence_id,))
+        report = cursor.fetchone()
+        if not report:
+            return jsonify({'message': 'Lesson report does not exist'}), 404
 
+        apply_report_update(connection, request.json, report['id'])
         connection.commit()
+        bump_entity_versions(connection, "lessons", "reports", "invoices")
 
-        return jsonify({'message': "Report updated successfully"}), 200
+        return jsonify({'message': "Report updated successfully", 'id': report['id']}), 200
 
     except Exception as e:
+        connection.rollback()
         return jsonify({'error': str(e), 'message': 'Error processing report. Please try again later'}), 500
     finally:
         if cursor:
@@ -1667,8 +3897,32 @@ def update_report(report_id=None):
         if connection:
             connection.close()
 
-@app.route('/demo/lessons/<int:lesson_occurrence_id>/report', methods=['GET'])
-@app.route('/lessons/<int:lesson_occurrence_id>/report', methods=['GET'])
+def get_virtual_lesson_report(connection, occurrence_id):
+    """The blank report of a virtual occurrence, with the same fields as a stored one"""
+    lesson_id, start_time = parse_virtual_occurrence_id(occurrence_id)
+    occurrence = next((occurrence for occurrence in get_virtual_lesson_occurrences(connection, start_time, start_time + timedelta(minutes=1), lesson_ids=[lesson_id])
+                       if occurrence['id'] == occurrence_id), None)
+    if occurrence is None:
+        return None
+    return {
+        "id": None,
+        "safeguarding_concern": None,
+        "actual_start_time": None,
+        "actual_end_time": None,
+        "attendance_code": None,
+        "attendance_status": None,
+        "lesson_occurrence_id": occurrence_id,
+        "invoice_id": None,
+        "week": (occurrence['start_time'] - timedelta(days=occurrence['start_time'].weekday())).date(),
+        "start_time": occurrence['start_time'],
+        "end_time": occurrence['end_time'],
+        "student_name": occurrence['student_name'],
+        "tutor_name": occurrence['tutor_name'],
+        "status": "empty"
+    }
+
+@app.route('/demo/lessons/<lesson_occurrence_id>/report', methods=['GET'])
+@app.route('/lessons/<lesson_occurrence_id>/report', methods=['GET'])
 @jwt_required_if_not_demo()
 def get_lesson_report(lesson_occurrence_id):
     connection = get_db_connection()
@@ -1704,18 +3958,25 @@ def get_lesson_report(lesson_occurrence_id):
             LEFT JOIN Invoices i_e ON le.exception_invoice_id = i_e.id
             WHERE r.lesson_occurrence_id = {placeholder}
         """
-        cursor.execute(query, (lesson_occurrence_id,))
-        result = cursor.fetchone()
+        try:
+            stored_occurrence_id = find_stored_occurrence_id(connection, lesson_occurrence_id)
+        except ValueError:
+            return jsonify({'message': 'Lesson report does not exist'}), 404
+        if stored_occurrence_id is None: # not stored yet, so its report is shown blank and only created when it is saved
+            result = get_virtual_lesson_report(connection, lesson_occurrence_id)
+        else:
+            cursor.execute(query, (stored_occurrence_id,))
+            result = cursor.fetchone()
 
         if result:
             report_id = result['id']
-            result["title"] = f"Report No. {str(report_id).zfill(5)}"
+            result["title"] = f"Report No. {str(report_id).zfill(5)}" if report_id else "New Report"
             result['lesson_time_short'] = format_lesson_datetime_object(result['start_time'], result['end_time'], timezone)
             result['attendance_status_complete'] = get_complete_attendance_status(result, timezone)
             result["student_name"] = result['student_name']
             result["week_short"] = result['week'].strftime("%d/%m/%Y")
             result["status_text"] = get_report_status_text(result['status'])
-            result["content"] = get_report(report_id)[0]
+            result["content"] = get_report_contents(connection, [report_id])[report_id]
 
             return result, 200
 
@@ -1757,6 +4018,7 @@ def get_tutor_rate(tutor_id):
 @app.route('/demo/tutors', methods=['GET'])
 @app.route('/tutors', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("tutors")
 def get_all_tutors():
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -1808,6 +4070,7 @@ def add_tutor():
 
         cursor.execute(f"INSERT INTO Tutors (name, email, phone, sort_code, account_number, rate, color) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})", (name, email, phone, sort_code, account_number, rate, color))
         connection.commit()
+        bump_entity_versions(connection, "tutors")
 
         return jsonify({'message': 'Tutor added successfully', 'id': cursor.lastrowid}), 200
     except Exception as e:
@@ -1836,6 +4099,7 @@ def update_tutor(tutor_id):
         cursor.execute(query, tuple(parameters))
 
         connection.commit()
+        bump_entity_versions(connection, "tutors")
         return jsonify({'message': 'Tutor updated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1863,6 +4127,9 @@ def delete_tutor(tutor_id):
         result = cursor.fetchone()
 
         if result['lesson_count'] == 0:
+
+            mark_occurrence_invoices_dirty(connection, f"lo.lesson_id IN (SELECT id FROM Lessons WHERE tutor_id = {placeholder})", [tutor_id])
+            record_lesson_changes(connection, f"l.tutor_id = {placeholder}", [tutor_id])
             cursor.execute(f"""
                 DELETE FROM LessonOccurrences
                 WHERE id IN (
@@ -1877,6 +4144,7 @@ def delete_tutor(tutor_id):
             return jsonify({'message': 'Error deleting tutor as they are still assigned to existing lessons or invoices. Please remove associated lessons/invoices first.'}), 400
 
         connection.commit()
+        bump_entity_versions(connection, "tutors", "users", "lessons", "invoices", "reports")
         return jsonify({'message': 'Tutor deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e), 'message': 'Error deleting tutor. Please try again later'}), 500
@@ -1889,6 +4157,7 @@ def delete_tutor(tutor_id):
 @app.route('/demo/students', methods=['GET'])
 @app.route('/students', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("students")
 def get_all_students():
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -1937,6 +4206,7 @@ def add_student():
 
         cursor.execute(f"INSERT INTO Students (name, email, phone, color) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})", (name, email, phone, color))
         connection.commit()
+        bump_entity_versions(connection, "students")
 
         return jsonify({'message': 'Student added successfully', 'id': cursor.lastrowid}), 200
     except Exception as e:
@@ -1965,6 +4235,7 @@ def update_student(student_id):
         cursor.execute(query, tuple(parameters))
 
         connection.commit()
+        bump_entity_versions(connection, "students")
         return jsonify({'message': 'Student updated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e), 'message': 'Error deleting student as they are still assigned to existing lessons or invoices. Please remove associated lessons/invoices first.'}), 400
@@ -1992,6 +4263,9 @@ def delete_student(student_id):
         result = cursor.fetchone()
 
         if result['lesson_count'] == 0:
+
+            mark_occurrence_invoices_dirty(connection, f"lo.lesson_id IN (SELECT id FROM Lessons WHERE student_id = {placeholder})", [student_id])
+            record_lesson_changes(connection, f"l.student_id = {placeholder}", [student_id])
             cursor.execute(f"""
             DELETE FROM LessonOccurrences
             WHERE id IN (
@@ -2005,6 +4279,7 @@ def delete_student(student_id):
             return jsonify({'message': 'Error deleting student as they are still assigned to existing lessons or invoices. Please remove associated lessons/invoices first.'}), 400
 
         connection.commit()
+        bump_entity_versions(connection, "students", "lessons", "invoices", "reports")
         return jsonify({'message': 'Student deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e), 'message': 'Error deleting student. Please try again later'}), 500
@@ -2018,6 +4293,7 @@ def delete_student(student_id):
 @app.route('/demo/locations', methods=['GET'])
 @app.route('/locations', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("locations")
 def get_all_locations():
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -2064,6 +4340,7 @@ def add_location():
 
         cursor.execute(f"INSERT INTO Locations (name, address) VALUES ({placeholder}, {placeholder})", (name, address))
         connection.commit()
+        bump_entity_versions(connection, "locations")
 
         return jsonify({'message': 'Location added successfully', 'id': cursor.lastrowid}), 200
     except Exception as e:
@@ -2092,6 +4369,7 @@ def update_location(location_id):
         cursor.execute(query, tuple(parameters))
 
         connection.commit()
+        bump_entity_versions(connection, "locations")
         return jsonify({'message': 'Location updated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2119,6 +4397,9 @@ def delete_location(location_id):
         result = cursor.fetchone()
 
         if result['lesson_count'] == 0:
+
+            mark_occurrence_invoices_dirty(connection, f"lo.lesson_id IN (SELECT id FROM Lessons WHERE location_id = {placeholder})", [location_id])
+            record_lesson_changes(connection, f"l.location_id = {placeholder}", [location_id])
             cursor.execute(f"""
                 DELETE FROM LessonOccurrences
                 WHERE id IN (
@@ -2132,6 +4413,7 @@ def delete_location(location_id):
             return jsonify({'message': 'Error deleting location as they are still assigned to existing lessons or invoices. Please remove associated lessons/invoices first.'}), 400
 
         connection.commit()
+        bump_entity_versions(connection, "locations", "lessons", "invoices", "reports")
         return jsonify({'message': 'Location deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e), 'message': 'Error deleting location. Please try again later'}), 500
@@ -2144,6 +4426,7 @@ def delete_location(location_id):
 @app.route('/demo/subjects', methods=['GET'])
 @app.route('/subjects', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("subjects")
 def get_all_subjects():
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -2190,6 +4473,7 @@ def add_subject():
 
         cursor.execute(f"INSERT INTO Subjects (name, description) VALUES ({placeholder}, {placeholder})", (name, description))
         connection.commit()
+        bump_entity_versions(connection, "subjects")
 
         return jsonify({'message': 'Subject added successfully', 'id': cursor.lastrowid}), 200
     except Exception as e:
@@ -2218,6 +4502,7 @@ def update_subject(subject_id):
         cursor.execute(query, tuple(parameters))
 
         connection.commit()
+        bump_entity_versions(connection, "subjects")
         return jsonify({'message': 'Subject updated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2245,6 +4530,9 @@ def delete_subject(subject_id):
         result = cursor.fetchone()
 
         if result['lesson_count'] == 0:
+
+            mark_occurrence_invoices_dirty(connection, f"lo.lesson_id IN (SELECT id FROM Lessons WHERE subject_id = {placeholder})", [subject_id])
+            record_lesson_changes(connection, f"l.subject_id = {placeholder}", [subject_id])
             cursor.execute(f"""
                 DELETE FROM LessonOccurrences
                 WHERE id IN (
@@ -2258,6 +4546,7 @@ def delete_subject(subject_id):
             return jsonify({'message': 'Error deleting subject as they are still assigned to existing lessons or invoices. Please remove associated lessons/invoices first.'}), 400
 
         connection.commit()
+        bump_entity_versions(connection, "subjects", "lessons", "invoices", "reports")
         return jsonify({'message': 'Subject deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e), 'message': 'Error deleting location. Please try again later'}), 500
@@ -2294,6 +4583,7 @@ def add_user():
         cursor.execute(f'INSERT INTO Users (email, password_hash, role, role_id, name) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})',
                        (email, hashed_password.decode('utf-8'), role, role_id, name))
         connection.commit()
+        bump_entity_versions(connection, "users")
 
         return jsonify({'message': 'Account created successfully. Please contact Educatch to activate your account.'}), 200
     except Exception as e:
@@ -2308,6 +4598,7 @@ def add_user():
 @app.route('/demo/users', methods=['GET'])
 @app.route('/users', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("users")
 def get_users():
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -2346,6 +4637,7 @@ def update_user(user_id):
         cursor.execute(query, tuple(parameters))
 
         connection.commit()
+        bump_entity_versions(connection, "users")
         return jsonify({'message': 'User updated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2415,6 +4707,7 @@ def login():
 @app.route('/demo/roles', methods=['GET'])
 @app.route('/roles', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("tutors", "students")
 def get_roles():
     connection = get_db_connection()
     cursor = get_cursor(connection)
@@ -2449,112 +4742,333 @@ def get_roles():
 @app.route('/demo/attendance-codes', methods=['GET'])
 @app.route('/attendance-codes', methods=['GET'])
 @jwt_required_if_not_demo()
+@etag_versioned("attendance_codes")
 def get_attendance_codes():
     return jsonify(get_attendance_code_text(get_map=True)), 200
 
 
-@app.route('/demo/report-pdf', methods=['POST'])
-@app.route('/report-pdf', methods=['POST'])
-@jwt_required_if_not_demo()
-def report_pdf():
-    try:
-        data = request.json
-        invoice_id = data.get('invoice_id')
-        student_id = data.get('student_id')
-        timezone = request.headers.get('X-Timezone')
+class PdfRenderError(Exception):
+    pass
+
+dpdf_session = None
+pdf_render_executor = None
+pdf_render_lock = threading.Lock()
+
+def get_dpdf_session():
+    # one keep-alive session shared by every render thread, so documents reuse TLS connections to the API
+    global dpdf_session
+    with pdf_render_lock:
+        if dpdf_session is None:
+            dpdf_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=PDF_RENDER_CONCURRENCY)
+            dpdf_session.mount("https://", adapter)
+        return dpdf_session
+
+def get_pdf_render_executor():
+    global pdf_render_executor
+    with pdf_render_lock:
+        if pdf_render_executor is None:
+            pdf_render_executor = ThreadPoolExecutor(max_workers=PDF_RENDER_CONCURRENCY, thread_name_prefix="pdf-render")
+        return pdf_render_executor
+
+def render_pdf_dpdf(dlex_path, layout_data):
+    layout_data_file = io.BytesIO(json.dumps(layout_data).encode("utf-8"))
+    layout_data_file.name = "layout.json"
+
+    files = {
+        "DlexPath": (None, dlex_path),
+        "LayoutData": ("layout.json", layout_data_file, "application/json")
+    }
 
-        response = get_invoice_student_report(invoice_id, student_id, timezone)
-        report_data = response[0]
-        formatted_report_data = {
-            "StudentName": report_data['student_name'],
-            "TutorName": report_data['tutor_name'],
-            "CurrentDate": date.today().strftime("%d/%m/%Y")
-        }
-        total_hours = sum(
-            (lesson['end_time'] - lesson['start_time']).total_seconds() / 3600
-            for lesson in  report_data["content"]
-        )
-        total_hours = int(total_hours) if total_hours.is_integer() else round(total_hours, 1)
-        formatted_report_data["TotalHours"] = total_hours
+    headers = {
+        "Authorization": f"Bearer {DPDF_API_KEY}",
+    }
 
-        formatted_report_data["Lessons"] = [
-            {
-                "DateTime": lesson["lesson_time_short"],
-                "AttendanceStatus": lesson["attendance_status_complete"]
+    response = get_dpdf_session().post("https://api.dpdf.io/v1.0/dlex-layout", headers=headers, files=files, timeout=PDF_RENDER_TIMEOUT)
+    if response.status_code != 200:
+        raise PdfRenderError(response.text)
+    return response.content
+
+LOCAL_PDF_LAYOUTS = {
+    'educatch-report.dlex': layout_report_pdf,
+    'educatch-invoice.dlex': layout_invoice_pdf,
+    'educatch-timetable.dlex': layout_timetable_pdf,
+    'educatch-attendance-report.dlex': lambda data: layout_attendance_report_pdf(data, get_attendance_code_text(get_map=True)),
+}
+
+def render_pdf_local(dlex_path, layout_data):
+    layout = LOCAL_PDF_LAYOUTS.get(dlex_path)
+    if layout is None:
+        raise PdfRenderError(f"No local layout for template '{dlex_path}'")
+    return layout(layout_data)
+
+def render_pdf_stub(dlex_path, layout_data):
+    """Build a one page PDF listing the template and layout data, for running without the DynamicPDF API"""
+    if PDF_STUB_DELAY > 0:
+        time.sleep(PDF_STUB_DELAY)
+
+    pdf = PdfLayout()
+    pdf.paragraph(f"Template: {dlex_path}", size=9, bold=True)
+    for line in json.dumps(layout_data, default=str, indent=1).splitlines()[:60]:
+        pdf.paragraph(line[:100], size=9)
+    return pdf.to_bytes()
+
+PDF_RENDERERS = {
+    "dpdf": render_pdf_dpdf,
+    "local": render_pdf_local,
+    "stub": render_pdf_stub,
+}
+
+class PdfCache:
+    """Rendered PDFs on local disk, keyed by a hash of the renderer, template and layout data"""
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = None # key -> size, least recently used first (loaded from disk on first use)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(renderer_name, dlex_path, layout_data):
+        layout_json = json.dumps(layout_data, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(f"{renderer_name}\0{dlex_path}\0{layout_json}".encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def load_entries(self):
+        # must be called with the lock held; files left by earlier processes are picked up oldest first
+        if self.entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".pdf"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        self.entries = OrderedDict((key, size) for _, key, size in sorted(files))
+        self.total_bytes = sum(self.entries.values())
+
+    def get(self, key):
+        with self.lock:
+            self.load_entries()
+            if key not in self.entries:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+        try:
+            with open(self.path(key), "rb") as f:
+                content = f.read()
+            os.utime(self.path(key)) # keep the on-disk order in step for the next process
+        except OSError:
+            with self.lock:
+                self.counters["errors"] += 1
+                self.counters["misses"] += 1
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+        with self.lock:
+            self.counters["hits"] += 1
+        return content
+
+    def put(self, key, content):
+        if len(content) > self.max_bytes:
+            return
+        temp_path = f"{self.path(key)}.{uuid.uuid4().hex}.tmp"
+        try:
+            with self.lock:
+                self.load_entries()
+            with open(temp_path, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, self.path(key))
+        except OSError as e:
+            app.logger.warning(f"Could not cache PDF {key}: {e}")
+            with self.lock:
+                self.counters["errors"] += 1
+            return
+
+        with self.lock:
+            self.total_bytes += len(content) - self.entries.pop(key, 0)
+            self.entries[key] = len(content)
+            self.counters["stores"] += 1
+            evicted = []
+            while self.total_bytes > self.max_bytes and self.entries:
+                old_key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                self.counters["evictions"] += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "entries": len(self.entries or {}),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes
             }
-            for lesson in report_data["content"]
-        ]
 
-        risk_notification_times = [
-            lesson.get("lesson_time_short")
-            for lesson in report_data.get("content", [])
-            if lesson.get("safeguarding_concern") == 1
-        ]
-        formatted_report_data["RiskNotification"] = "No"
-        if len(risk_notification_times) > 0:
-            formatted_report_data["RiskNotification"] = f"Yes - {len(risk_notification_times)} reports\n\n{', '.join(risk_notification_times)}"
-        formatted_report_data["AbsenceNotification"] = ", ".join(
-            f'{answer["answer_text"]} on {lesson.get("lesson_time_short")}'
-            for lesson in report_data["content"]
-                for answer in lesson.get("content", [])
-                    if answer.get("id") == 7)
-
-        for key, qid in [
-            ("Curriculum", 1),
-            ("Aims", 2),
-            ("Overview", 3),
-            ("Planning", 4),
-            ("Feedback", 5)
-        ]:
-            formatted_report_data[key] = [
-                {
-                    "Date": lesson["lesson_time_short"],
-                    "Details": item["answer_text"]
-                }
-                for lesson in report_data["content"]
-                for item in lesson.get("content", [])
-                if item.get("id") == qid
-                   and item.get("answer_text")
-                   and item["answer_text"].strip().lower() != ""
-            ]
-        report_data_file = io.BytesIO(json.dumps(formatted_report_data).encode("utf-8"))
+pdf_cache = PdfCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES) if PDF_CACHE_MAX_BYTES > 0 else None
 
-        report_data_file.name = "layout.json"
+def render_pdf(dlex_path, layout_data):
+    renderer = PDF_RENDERERS.get(PDF_RENDERER)
+    if renderer is None:
+        raise PdfRenderError(f"Unknown PDF renderer '{PDF_RENDERER}'")
+    if pdf_cache is None:
+        return renderer(dlex_path, layout_data)
 
-        files = {
-            "DlexPath": (None, 'educatch-report.dlex'),
-            "LayoutData":  ("layout.json", report_data_file, "application/json")
-        }
+    key = PdfCache.make_key(PDF_RENDERER, dlex_path, layout_data)
+    content = pdf_cache.get(key)
+    if content is None:
+        content = renderer(dlex_path, layout_data)
+        pdf_cache.put(key, content)
+    return content
+
+def render_timed(dlex_path, layout_data):
+    started = time.perf_counter()
+    content = render_pdf(dlex_path, layout_data)
+    return content, round((time.perf_counter() - started) * 1000, 1)
+
+def render_pdfs(documents):
+    """Render (filename, dlex_path, layout_data) documents concurrently.
+
+    Returns ([(filename, content)], [{"filename", "ms"}]) in the same order as documents. The first failure
+    cancels the documents that have not started yet and is raised straight away.
+    """
+    if len(documents) == 1:
+        filename, dlex_path, layout_data = documents[0]
+        content, ms = render_timed(dlex_path, layout_data)
+        return [(filename, content)], [{"filename": filename, "ms": ms}]
+
+    executor = get_pdf_render_executor()
+    futures = [executor.submit(render_timed, dlex_path, layout_data) for _, dlex_path, layout_data in documents]
+    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+    for future in futures:
+        if future in done and future.exception() is not None:
+            for other in pending:
+                other.cancel()
+            raise future.exception()
+
+    output_files = []
+    timings = []
+    for (filename, _, _), future in zip(documents, futures):
+        content, ms = future.result()
+        output_files.append((filename, content))
+        timings.append({"filename": filename, "ms": ms})
+    return output_files, timings
+
+def format_server_timing(timings, total_ms):
+    # per-file render times for the browser's network panel (file names are left out as they aren't header safe)
+    entries = [f"pdf{index};dur={timing['ms']}" for index, timing in enumerate(timings, start=1)]
+    return ", ".join(entries + [f"render;dur={total_ms}"])
+
+def package_pdf_files(output_files, archive_name):
+    """Return (content, download_name, mimetype): the PDF itself if there is only one, otherwise a zip of all of them"""
+    if len(output_files) == 1:
+        name, content = output_files[0]
+        return content, name, "application/pdf"
+
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w") as zipf:
+        for name, content in output_files:
+            zipf.writestr(name, content)
+    return zip_buffer.getvalue(), archive_name, "application/zip"
+
+def send_pdf(content, download_name, mimetype="application/pdf"):
+    # served straight from memory, so concurrent requests never share a file on disk
+    response = send_file(
+        io.BytesIO(content),
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=mimetype
+    )
+    response.content_length = len(content)
+    return response
 
-        headers = {
-            "Authorization": f"Bearer {DPDF_API_KEY}",
+
+def build_report_pdf_documents(data, timezone):
+    invoice_id = data.get('invoice_id')
+    student_id = data.get('student_id')
+
+    response = get_invoice_student_report(invoice_id, student_id, timezone)
+    report_data = response[0]
+    formatted_report_data = {
+        "StudentName": report_data['student_name'],
+        "TutorName": report_data['tutor_name'],
+        "CurrentDate": date.today().strftime("%d/%m/%Y")
+    }
+    total_hours = sum(
+        (lesson['end_time'] - lesson['start_time']).total_seconds() / 3600
+        for lesson in  report_data["content"]
+    )
+    total_hours = int(total_hours) if total_hours.is_integer() else round(total_hours, 1)
+    formatted_report_data["TotalHours"] = total_hours
+
+    formatted_report_data["Lessons"] = [
+        {
+            "DateTime": lesson["lesson_time_short"],
+            "AttendanceStatus": lesson["attendance_status_complete"]
         }
+        for lesson in report_data["content"]
+    ]
+
+    risk_notification_times = [
+        lesson.get("lesson_time_short")
+        for lesson in report_data.get("content", [])
+        if lesson.get("safeguarding_concern") == 1
+    ]
+    formatted_report_data["RiskNotification"] = "No"
+    if len(risk_notification_times) > 0:
+        formatted_report_data["RiskNotification"] = f"Yes - {len(risk_notification_times)} reports\n\n{', '.join(risk_notification_times)}"
+    formatted_report_data["AbsenceNotification"] = ", ".join(
+        f'{answer["answer_text"]} on {lesson.get("lesson_time_short")}'
+        for lesson in report_data["content"]
+            for answer in lesson.get("content", [])
+                if answer.get("id") == 7)
+
+    for key, qid in [
+        ("Curriculum", 1),
+        ("Aims", 2),
+        ("Overview", 3),
+        ("Planning", 4),
+        ("Feedback", 5)
+    ]:
+        formatted_report_data[key] = [
+            {
+                "Date": lesson["lesson_time_short"],
+                "Details": item["answer_text"]
+            }
+            for lesson in report_data["content"]
+            for item in lesson.get("content", [])
+            if item.get("id") == qid
+               and item.get("answer_text")
+               and item["answer_text"].strip().lower() != ""
+        ]
 
-        response = requests.post("https://api.dpdf.io/v1.0/dlex-layout", headers=headers, files=files)
+    return [("report.pdf", 'educatch-report.dlex', formatted_report_data)]
 
-        if response.status_code == 200:
-            output_path = "report.pdf"
-            with open(output_path, "wb") as f:
-                f.write(response.content)
-            return send_file(output_path, as_attachment=True)
-        else:
-            return jsonify({"error": response.text, "message": "Error downloading report. Please try again later."}), 500
+@app.route('/demo/report-pdf', methods=['POST'])
+@app.route('/report-pdf', methods=['POST'])
+@jwt_required_if_not_demo()
+def report_pdf():
+    try:
+        filename, dlex_path, layout_data = build_report_pdf_documents(request.json, request.headers.get('X-Timezone'))[0]
+        return send_pdf(render_pdf(dlex_path, layout_data), filename)
     except Exception as e:
         return jsonify({"error": str(e), "message": "Error downloading report. Please try again later."}), 500
 
 
-@app.route('/demo/invoice-pdf', methods=['POST'])
-@app.route('/invoice-pdf', methods=['POST'])
-@jwt_required_if_not_demo()
-def invoice_pdf():
+def build_invoice_pdf_documents(data, timezone):
     connection = get_db_connection()
     cursor = get_cursor(connection)
     placeholder = get_placeholder(connection)
 
     try:
-        data = request.json
         invoice_id = data.get('invoice_id')
-        timezone = request.headers.get('X-Timezone')
 
         # get all lesson occurrences (accounting for lesson exceptions) belonging to the invoice id
         cursor.execute(f"""
@@ -2626,50 +5140,32 @@ def invoice_pdf():
             "Lessons": structured_lessons
         }
 
-        invoice_data_file = io.BytesIO(json.dumps(invoice_data).encode("utf-8"))
-
-        invoice_data_file.name = "layout.json"
-
-        files = {
-            "DlexPath": (None, 'educatch-invoice.dlex'),
-            "LayoutData": ("layout.json", invoice_data_file, "application/json")
-        }
-
-        headers = {
-            "Authorization": f"Bearer {DPDF_API_KEY}",
-        }
-
-        response = requests.post("https://api.dpdf.io/v1.0/dlex-layout", headers=headers, files=files)
-
-        if response.status_code == 200:
-            output_path = "invoice.pdf"
-            with open(output_path, "wb") as f:
-                f.write(response.content)
-            return send_file(output_path, as_attachment=True)
-        else:
-            return jsonify(
-                {"error": response.text, "message": "Error downloading invoice. Please try again later."}), 500
-    except Exception as e:
-        return jsonify({"error": str(e), "message": "Error downloading invoice. Please try again later."}), 500
+        return [("invoice.pdf", 'educatch-invoice.dlex', invoice_data)]
     finally:
         if cursor:
             cursor.close()
         if connection:
             connection.close()
 
-
-@app.route('/demo/timetable-pdf', methods=['POST'])
-@app.route('/timetable-pdf', methods=['POST'])
+@app.route('/demo/invoice-pdf', methods=['POST'])
+@app.route('/invoice-pdf', methods=['POST'])
 @jwt_required_if_not_demo()
-def timetable_pdf():
+def invoice_pdf():
+    try:
+        filename, dlex_path, layout_data = build_invoice_pdf_documents(request.json, request.headers.get('X-Timezone'))[0]
+        return send_pdf(render_pdf(dlex_path, layout_data), filename)
+    except Exception as e:
+        return jsonify({"error": str(e), "message": "Error downloading invoice. Please try again later."}), 500
+
+
+def build_timetable_pdf_documents(data, timezone):
+    """Return one document per tutor/student and week, or an empty list if no lessons are scheduled"""
     connection = get_db_connection()
     cursor = get_cursor(connection)
     placeholder = get_placeholder(connection)
     try:
-        data = request.json
         role = data.get('role')
         role_ids = data.get('role_ids')
-        timezone = request.headers.get('X-Timezone')
         start_raw = data.get('start_date')
         end_raw = data.get('end_date')
 
@@ -2728,10 +5224,26 @@ def timetable_pdf():
         cursor.execute(query, (*role_ids, start_date, end_date))
         lessons = cursor.fetchall()
 
+        # add recurring lessons that are not stored yet
+        window_start = datetime.combine(start_date.date(), datetime.min.time())
+        window_end = datetime.combine(end_date.date(), datetime.min.time()) + timedelta(days=1)
+        if role == 'tutor':
+            virtual_occurrences = get_virtual_lesson_occurrences(connection, window_start, window_end, tutor_ids=role_ids)
+        else:
+            virtual_occurrences = get_virtual_lesson_occurrences(connection, window_start, window_end, student_ids=role_ids)
+        for occurrence in virtual_occurrences:
+            if occurrence['end_time'].date() <= end_date.date():
+                lessons.append({
+                    "start_time": occurrence['start_time'],
+                    "end_time": occurrence['end_time'],
+                    "role_name": occurrence['student_name'] if role == 'tutor' else occurrence['tutor_name'],
+                    "location_name": occurrence['location_name'],
+                    "role_id": occurrence['tutor_id'] if role == 'tutor' else occurrence['student_id']
+                })
+        lessons.sort(key=lambda lesson: lesson['start_time'])
+
         if len(lessons) == 0:
-            return jsonify({
-                "message": f"No classes are scheduled for the selected {role}(s) within the chosen time period."
-            }), 404
+            return []
 
         roles_data = {id: {} for id in role_ids} # dictionary with all the weeks for each tutor/student id
 
@@ -2771,72 +5283,52 @@ def timetable_pdf():
                     "Name": name
                 })
 
-        headers = {
-            "Authorization": f"Bearer {DPDF_API_KEY}",
-        }
-
-        output_files = []
-        for timetable in timetable_data:
-            invoice_data_file = io.BytesIO(json.dumps(timetable).encode("utf-8"))
-            invoice_data_file.name = "layout.json"
-
-            files = {
-                "DlexPath": (None, 'educatch-timetable.dlex'),
-                "LayoutData": ("layout.json", invoice_data_file, "application/json")
-            }
-
-            response = requests.post("https://api.dpdf.io/v1.0/dlex-layout", headers=headers, files=files)
-            if response.status_code != 200:
-                return jsonify({
-                    "error": str(response.text),
-                    "message": f"Error generating timetable(s)."
-                }), 500
-
-            filename = f"{timetable['Name']}'s Timetable - {timetable['Week'].replace('/', '.')}.pdf"
-            output_files.append((filename, response.content))
-
-        # Send single PDF if only one
-        if len(output_files) == 1:
-            name, content = output_files[0]
-            return send_file(
-                io.BytesIO(content),
-                as_attachment=True,
-                download_name=name,
-                mimetype="application/pdf"
-            )
-
-        # Otherwise, zip multiple files
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zipf:
-            for name, content in output_files:
-                zipf.writestr(name, content)
-
-        zip_buffer.seek(0)
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name="timetables.zip",
-            mimetype="application/zip"
-        )
-    except Exception as e:
-        return jsonify({"error": str(e), "message": "Error downloading timetable. Please try again later."}), 500
+        return [
+            (f"{timetable['Name']}'s Timetable - {timetable['Week'].replace('/', '.')}.pdf", 'educatch-timetable.dlex', timetable)
+            for timetable in timetable_data
+        ]
     finally:
         if cursor:
             cursor.close()
         if connection:
             connection.close()
 
-@app.route('/demo/attendance-report-pdf', methods=['POST'])
-@app.route('/attendance-report-pdf', methods=['POST'])
+@app.route('/demo/timetable-pdf', methods=['POST'])
+@app.route('/timetable-pdf', methods=['POST'])
 @jwt_required_if_not_demo()
-def attendance_report_pdf():
+def timetable_pdf():
+    try:
+        data = request.json
+        documents = build_timetable_pdf_documents(data, request.headers.get('X-Timezone'))
+        if not documents:
+            return jsonify({
+                "message": f"No classes are scheduled for the selected {data.get('role')}(s) within the chosen time period."
+            }), 404
+
+        started = time.perf_counter()
+        try:
+            output_files, timings = render_pdfs(documents)
+        except PdfRenderError as e:
+            return jsonify({
+                "error": str(e),
+                "message": f"Error generating timetable(s)."
+            }), 500
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        app.logger.info(f"Rendered {len(timings)} timetable(s) in {total_ms}ms: " + ", ".join(f"{timing['filename']} {timing['ms']}ms" for timing in timings))
+
+        content, download_name, mimetype = package_pdf_files(output_files, "timetables.zip")
+        response = send_pdf(content, download_name, mimetype)
+        response.headers["Server-Timing"] = format_server_timing(timings, total_ms)
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e), "message": "Error downloading timetable. Please try again later."}), 500
+
+def build_attendance_report_pdf_documents(data, timezone):
     connection = get_db_connection()
     cursor = get_cursor(connection)
     placeholder = get_placeholder(connection)
 
     try:
-        data = request.json
-        timezone = request.headers.get('X-Timezone')
         student_id = data.get('student_id')
         student_name = data.get('student_name')
         include_incomplete_attendance = data.get('include_incomplete_attendance')
@@ -2863,7 +5355,7 @@ def attendance_report_pdf():
         """, (student_id, start_date, end_date))
         total_lessons = cursor.fetchone()['TotalLessons']
 
-        if request.path.startswith("/demo/"):
+        if is_sqlite_connection(connection):
             duration_scheduled = "(strftime('%s', lo.end_time) - strftime('%s', lo.start_time))/60.0"
             duration_actual = "(strftime('%s', lo.actual_end_time) - strftime('%s', lo.actual_start_time))/60.0"
             duration_absent_disrupted = (
@@ -2950,37 +5442,211 @@ def attendance_report_pdf():
             attendance_data[
                 'FooterMessage'] = f"This report only includes the lessons for which attendance was recorded ({result['LessonsScheduled']}). In total, there were {total_lessons} scheduled lessons during the selected time period."
 
-        attendance_data_file = io.BytesIO(json.dumps(attendance_data).encode("utf-8"))
+        download_name = f"{student_name}'s Attendance Report - {start_date_string.replace('/', '.')} - {end_date_string.replace('/', '.')}.pdf"
+        return [(download_name, 'educatch-attendance-report.dlex', attendance_data)]
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
 
-        attendance_data_file.name = "layout.json"
+@app.route('/demo/attendance-report-pdf', methods=['POST'])
+@app.route('/attendance-report-pdf', methods=['POST'])
+@jwt_required_if_not_demo()
+def attendance_report_pdf():
+    try:
+        filename, dlex_path, layout_data = build_attendance_report_pdf_documents(request.json, request.headers.get('X-Timezone'))[0]
+        return send_pdf(render_pdf(dlex_path, layout_data), filename)
+    except Exception as e:
+        return jsonify({"error": str(e), "message": "Error downloading attendance report. Please try again later."}), 500
 
-        files = {
-            "DlexPath": (None, 'educatch-attendance-report.dlex'),
-            "LayoutData": ("layout.json", attendance_data_file, "application/json")
-        }
 
-        headers = {
-            "Authorization": f"Bearer {DPDF_API_KEY}",
-        }
+PDF_JOB_TYPES = {
+    # type: (document builder, zip name when there is more than one document)
+    "report": (build_report_pdf_documents, "reports.zip"),
+    "invoice": (build_invoice_pdf_documents, "invoices.zip"),
+    "timetable": (build_timetable_pdf_documents, "timetables.zip"),
+    "attendance-report": (build_attendance_report_pdf_documents, "attendance-reports.zip"),
+}
+
+# jobs are kept in the PdfJobs table so that any instance sharing the database can answer their status and download
+# requests. only rendering is local: the instance that accepted a job renders it, and the jobs of an instance that
+# stops first are left unfinished until they are pruned with the rest after PDF_JOB_TTL
+pdf_jobs_condition = threading.Condition() # notified whenever a job rendered by this process finishes
+pdf_jobs_unfinished = 0 # jobs queued or running in this process
+pdf_job_waiters = threading.BoundedSemaphore(PDF_JOB_MAX_WAITERS)
+pdf_job_executor = None
+
+def get_pdf_job_executor():
+    global pdf_job_executor
+    with pdf_jobs_condition:
+        if pdf_job_executor is None:
+            pdf_job_executor = ThreadPoolExecutor(max_workers=PDF_JOB_WORKERS, thread_name_prefix="pdf-job")
+        return pdf_job_executor
+
+def get_pdf_job_owner():
+    # jobs are only visible to the demo session or user that created them
+    if request.path.startswith("/demo/"):
+        return get_demo_db_id()
+    return str(get_jwt_identity())
 
-        response = requests.post("https://api.dpdf.io/v1.0/dlex-layout", headers=headers, files=files)
+def prune_pdf_jobs(connection):
+    cursor = get_cursor(connection)
+    expired_before, parameter = database_time_before(connection, PDF_JOB_TTL)
+    expired_before = expired_before.format(placeholder=get_placeholder(connection))
+    cursor.execute(f"DELETE FROM PdfJobs WHERE finished_at < {expired_before} OR (finished_at IS NULL AND created_at < {expired_before})",
+                   (parameter, parameter))
+    connection.commit()
+    cursor.close()
 
-        if response.status_code == 200:
-            output_path = "attendance-report.pdf"
-            with open(output_path, "wb") as f:
-                f.write(response.content)
-            return send_file(output_path, as_attachment=True,
-                             download_name=f"{student_name}'s Attendance Report - {start_date_string.replace('/', '.')} - {end_date_string.replace('/', '.')}.pdf")
-        else:
-            return jsonify(
-                {"error": response.text, "message": "Error downloading attendance report. Please try again later."}), 500
+def update_pdf_job(pool, job_id, **fields):
+    connection = pool.acquire()
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    try:
+        assignments = [f"{column} = {placeholder}" for column in fields]
+        if fields.get("status") in ("done", "failed"):
+            assignments.append("finished_at = CURRENT_TIMESTAMP")
+        cursor.execute(f"UPDATE PdfJobs SET {', '.join(assignments)} WHERE id = {placeholder}", (*fields.values(), job_id))
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+
+def run_pdf_job(pool, job_id, documents, archive_name):
+    global pdf_jobs_unfinished
+    try:
+        # the connection is only held while the job row is written, never while the PDFs render
+        update_pdf_job(pool, job_id, status="running")
+        try:
+            output_files, timings = render_pdfs(documents)
+            content, filename, mimetype = package_pdf_files(output_files, archive_name)
+            result = {"status": "done", "content": content, "filename": filename, "mimetype": mimetype, "timings": json.dumps(timings)}
+        except Exception as e:
+            app.logger.error(f"PDF job {job_id} failed: {e}")
+            result = {"status": "failed", "error": str(e)}
+        update_pdf_job(pool, job_id, **result)
+    except DemoDatabaseDisposedError: # the demo session was reset or reaped along with its jobs
+        pass
     except Exception as e:
-        return jsonify({"error": str(e), "message": "Error downloading attendance report. Please try again later."}), 500
+        app.logger.error(f"PDF job {job_id} could not be stored: {e}")
     finally:
-        if cursor:
+        with pdf_jobs_condition:
+            pdf_jobs_unfinished -= 1
+            pdf_jobs_condition.notify_all()
+
+def format_pdf_job(job):
+    return {
+        "job_id": job["id"],
+        "type": job["type"],
+        "status": job["status"],
+        "error": job["error"],
+        "filename": job["filename"],
+        "timings": json.loads(job["timings"]) if job["timings"] else None,
+    }
+
+def get_owned_pdf_job(job_id, content=False):
+    connection = get_db_connection()
+    cursor = get_cursor(connection)
+    placeholder = get_placeholder(connection)
+    try:
+        cursor.execute(f"SELECT id, type, owner, status, error, filename, mimetype, timings{', content' if content else ''} FROM PdfJobs WHERE id = {placeholder}",
+                       (job_id,))
+        job = cursor.fetchone()
+    finally:
+        cursor.close()
+        connection.close()
+    if job is None or job["owner"] != get_pdf_job_owner():
+        return None
+    return job
+
+@app.route('/demo/pdf-jobs', methods=['POST'])
+@app.route('/pdf-jobs', methods=['POST'])
+@jwt_required_if_not_demo()
+def create_pdf_job():
+    global pdf_jobs_unfinished
+    try:
+        data = request.json
+        job_type = data.get('type')
+        if job_type not in PDF_JOB_TYPES:
+            return jsonify({"error": f"Unknown PDF type '{job_type}'"}), 400
+        build_documents, archive_name = PDF_JOB_TYPES[job_type]
+
+        with pdf_jobs_condition:
+            if pdf_jobs_unfinished >= PDF_JOB_QUEUE_LIMIT:
+                return jsonify({"message": "Too many PDFs are being generated. Please try again shortly."}), 503
+
+        # layout data is gathered here, while the request's database connection is available; only rendering is queued
+        documents = build_documents(data, request.headers.get('X-Timezone'))
+        if not documents:
+            return jsonify({"message": "There is nothing to include in the selected PDF."}), 404
+
+        job_id = uuid.uuid4().hex
+        connection = get_db_connection()
+        cursor = get_cursor(connection)
+        placeholder = get_placeholder(connection)
+        try:
+            prune_pdf_jobs(connection)
+            cursor.execute(f"INSERT INTO PdfJobs (id, type, owner, status) VALUES ({placeholder}, {placeholder}, {placeholder}, 'queued')",
+                           (job_id, job_type, get_pdf_job_owner()))
+            connection.commit()
+            pool = connection.pool
+        finally:
             cursor.close()
-        if connection:
             connection.close()
 
+        with pdf_jobs_condition:
+            pdf_jobs_unfinished += 1
+        get_pdf_job_executor().submit(run_pdf_job, pool, job_id, documents, archive_name)
+
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+    except Exception as e:
+        return jsonify({"error": str(e), "message": "Error generating PDF. Please try again later."}), 500
+
+@app.route('/demo/pdf-jobs/<job_id>', methods=['GET'])
+@app.route('/pdf-jobs/<job_id>', methods=['GET'])
+@jwt_required_if_not_demo()
+def get_pdf_job(job_id):
+    # ?wait=N blocks for up to N seconds until the job has finished. each waiter holds a gunicorn thread, so past
+    # PDF_JOB_MAX_WAITERS of them the current status is returned straight away and the client polls again
+    wait = min(max(request.args.get('wait', default=0, type=float), 0), PDF_JOB_MAX_WAIT)
+    waiting = wait > 0 and pdf_job_waiters.acquire(blocking=False)
+    try:
+        deadline = time.monotonic() + (wait if waiting else 0)
+        job = get_owned_pdf_job(job_id)
+        while job is not None and job["status"] in ("queued", "running"):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # jobs rendered here wake the waiter as soon as they finish; those of other instances are seen on the next poll
+            with pdf_jobs_condition:
+                pdf_jobs_condition.wait(min(remaining, PDF_JOB_POLL_INTERVAL))
+            job = get_owned_pdf_job(job_id)
+        if job is None:
+            return jsonify({"error": "PDF job not found"}), 404
+        return jsonify(format_pdf_job(job)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if waiting:
+            pdf_job_waiters.release()
+
+@app.route('/demo/pdf-jobs/<job_id>/download', methods=['GET'])
+@app.route('/pdf-jobs/<job_id>/download', methods=['GET'])
+@jwt_required_if_not_demo()
+def download_pdf_job(job_id):
+    try:
+        job = get_owned_pdf_job(job_id, content=True)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if job is None:
+        return jsonify({"error": "PDF job not found"}), 404
+
+    if job["status"] == "failed":
+        return jsonify({"error": job["error"], "message": "Error generating PDF. Please try again later."}), 500
+    if job["status"] != "done":
+        return jsonify({"message": "PDF is not ready yet.", "status": job["status"]}), 409
+    return send_pdf(bytes(job["content"]), job["filename"], job["mimetype"])
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 5001)))
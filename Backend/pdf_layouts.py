@@ -0,0 +1,325 @@
+# lays out the report, invoice, timetable and attendance report PDFs in-process, for PDF_RENDERER=local. each layout
+# takes the same layout data that is sent to the DynamicPDF templates and returns the PDF's bytes
+
+# widths of the characters 32-126 in 1/1000 of the font size, from the standard Helvetica font metrics
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584
+]
+HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584
+]
+
+class PdfLayout:
+    """Minimal PDF writer that flows headings, text and tables down A4 pages"""
+    def __init__(self, width=595, height=842, margin=40):
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self.pages = [] # drawing commands per page
+        self.y = 0
+        self.new_page()
+
+    def new_page(self):
+        self.pages.append([])
+        self.y = self.height - self.margin
+
+    def ensure_space(self, height):
+        # start a new page if the next block doesn't fit, returning True if it did
+        if self.y - height < self.margin:
+            self.new_page()
+            return True
+        return False
+
+    @staticmethod
+    def text_width(text, size, bold=False):
+        widths = HELVETICA_BOLD_WIDTHS if bold else HELVETICA_WIDTHS
+        return sum(widths[ord(char) - 32] if 32 <= ord(char) <= 126 else 556 for char in text) * size / 1000
+
+    def wrap(self, text, width, size, bold=False):
+        """Split text into lines no wider than width, breaking at spaces and inside words longer than a line"""
+        space = self.text_width(" ", size, bold)
+        lines = []
+        for paragraph in ("" if text is None else str(text)).split("\n"):
+            line, line_width = "", 0
+            for word in paragraph.split(" "):
+                word_width = self.text_width(word, size, bold)
+                while word_width > width and len(word) > 1:
+                    if line:
+                        lines.append(line)
+                        line, line_width = "", 0
+                    cut = len(word) - 1
+                    while cut > 1 and self.text_width(word[:cut], size, bold) > width:
+                        cut -= 1
+                    lines.append(word[:cut])
+                    word = word[cut:]
+                    word_width = self.text_width(word, size, bold)
+                if line and line_width + space + word_width > width:
+                    lines.append(line)
+                    line, line_width = word, word_width
+                elif line:
+                    line += " " + word
+                    line_width += space + word_width
+                else:
+                    line, line_width = word, word_width
+            lines.append(line)
+        return lines
+
+    def draw_text(self, x, y, text, size=10, bold=False):
+        # the fonts use WinAnsiEncoding, so text is written as cp1252 bytes (one latin-1 character per byte)
+        encoded = text.encode("cp1252", "replace").decode("latin-1")
+        escaped = encoded.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        self.pages[-1].append(f"BT /{'F2' if bold else 'F1'} {size} Tf {x:.2f} {y:.2f} Td ({escaped}) Tj ET")
+
+    def draw_line(self, x1, y1, x2, y2, line_width=0.5):
+        self.pages[-1].append(f"{line_width} w {x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l S")
+
+    def fill_rect(self, x, y, width, height, gray=0.9):
+        self.pages[-1].append(f"{gray} g {x:.2f} {y:.2f} {width:.2f} {height:.2f} re f 0 g")
+
+    def heading(self, text, size=18):
+        self.ensure_space(size * 2)
+        self.y -= size
+        self.draw_text(self.margin, self.y, text, size, bold=True)
+        self.y -= size * 0.6
+
+    def section(self, text):
+        self.y -= 8
+        self.heading(text, size=12)
+
+    def paragraph(self, text, size=10, bold=False):
+        leading = size * 1.35
+        for line in self.wrap(text, self.width - 2 * self.margin, size, bold):
+            self.ensure_space(leading)
+            self.y -= leading
+            self.draw_text(self.margin, self.y, line, size, bold)
+
+    def fields(self, items, size=10):
+        # "Label  value" lines with the values lined up
+        leading = size * 1.35
+        label_width = max(self.text_width(label, size, bold=True) for label, _ in items) + 12
+        for label, value in items:
+            for index, line in enumerate(self.wrap(value, self.width - 2 * self.margin - label_width, size)):
+                self.ensure_space(leading)
+                self.y -= leading
+                if index == 0:
+                    self.draw_text(self.margin, self.y, label, size, bold=True)
+                self.draw_text(self.margin + label_width, self.y, line, size)
+
+    def table(self, columns, rows, size=9):
+        """Draw rows under a shaded header, repeating the header on each page.
+
+        columns are (title, fraction of the page width, "left"/"right") and rows are lists of cell values.
+        """
+        if not rows:
+            self.paragraph("None", size)
+            return
+
+        total_width = self.width - 2 * self.margin
+        widths = [fraction * total_width for _, fraction, _ in columns]
+        leading = size * 1.35
+        padding = 4
+
+        def draw_row_line(values, bold):
+            x = self.margin
+            for value, width, (_, _, align) in zip(values, widths, columns):
+                offset = width - padding - self.text_width(value, size, bold) if align == "right" else padding
+                self.draw_text(x + offset, self.y + padding / 2, value, size, bold)
+                x += width
+
+        def draw_header():
+            if not any(title for title, _, _ in columns):
+                return
+            self.y -= leading + padding
+            self.fill_rect(self.margin, self.y, total_width, leading + padding)
+            draw_row_line([title for title, _, _ in columns], True)
+
+        self.ensure_space(2 * (leading + padding))
+        draw_header()
+        for row in rows:
+            cells = [self.wrap(value, width - 2 * padding, size) for value, width in zip(row, widths)]
+            for index in range(max(len(lines) for lines in cells)):
+                if self.ensure_space(leading + padding):
+                    draw_header()
+                self.y -= leading
+                draw_row_line([lines[index] if index < len(lines) else "" for lines in cells], False)
+            self.y -= padding
+            self.draw_line(self.margin, self.y, self.margin + total_width, self.y, 0.25)
+
+    def to_bytes(self):
+        objects = [
+            "<< /Type /Catalog /Pages 2 0 R >>",
+            None, # page tree, filled in once the page objects are numbered
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        ]
+        page_objects = []
+        for number, commands in enumerate(self.pages, start=1):
+            if len(self.pages) > 1:
+                footer = f"Page {number} of {len(self.pages)}"
+                commands = commands + [f"BT /F1 8 Tf {self.width - self.margin - self.text_width(footer, 8):.2f} {self.margin / 2:.2f} Td ({footer}) Tj ET"]
+            stream = "\n".join(commands)
+            objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+            objects.append(
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.width} {self.height}] "
+                f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {len(objects)} 0 R >>"
+            )
+            page_objects.append(len(objects))
+        objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{number} 0 R' for number in page_objects)}] /Count {len(page_objects)} >>"
+
+        pdf = "%PDF-1.4\n"
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(pdf.encode("latin-1")))
+            pdf += f"{number} 0 obj\n{body}\nendobj\n"
+        xref_offset = len(pdf.encode("latin-1"))
+        pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+        pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+        pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+        return pdf.encode("latin-1")
+
+def format_money(amount):
+    return f"£{float(amount or 0):.2f}"
+
+def layout_report_pdf(data):
+    pdf = PdfLayout()
+    pdf.heading("Student Report")
+    pdf.fields([
+        ("Student", data["StudentName"]),
+        ("Tutor", data["TutorName"]),
+        ("Date", data["CurrentDate"]),
+        ("Total hours", data["TotalHours"])
+    ])
+
+    pdf.section("Lessons")
+    pdf.table(
+        [("Date and time", 0.4, "left"), ("Attendance", 0.6, "left")],
+        [[lesson["DateTime"], lesson["AttendanceStatus"]] for lesson in data["Lessons"]]
+    )
+    pdf.section("Risk notification")
+    pdf.paragraph(data["RiskNotification"])
+    pdf.section("Absence notification")
+    pdf.paragraph(data["AbsenceNotification"] or "None")
+
+    for key, title in [
+        ("Curriculum", "Curriculum"),
+        ("Aims", "Aims"),
+        ("Overview", "Overview"),
+        ("Planning", "Planning"),
+        ("Feedback", "Feedback")
+    ]:
+        pdf.section(title)
+        pdf.table(
+            [("Date", 0.25, "left"), ("Details", 0.75, "left")],
+            [[item["Date"], item["Details"]] for item in data[key]]
+        )
+    return pdf.to_bytes()
+
+def layout_invoice_pdf(data):
+    pdf = PdfLayout()
+    pdf.heading(f"Invoice {data['InvoiceNumber']}")
+    pdf.fields([
+        ("Tutor", data["TutorName"]),
+        ("Date", data["CurrentDate"])
+    ])
+
+    pdf.section("Lessons")
+    pdf.table(
+        [
+            ("Student", 0.3, "left"),
+            ("Date", 0.15, "left"),
+            ("Time", 0.17, "left"),
+            ("Hours", 0.1, "right"),
+            ("Rate", 0.12, "right"),
+            ("Subtotal", 0.16, "right")
+        ],
+        [
+            [lesson["StudentName"], lesson["Date"], lesson["Time"], lesson["Hours"], format_money(lesson["Rate"]), format_money(lesson["Subtotal"])]
+            for lesson in data["Lessons"]
+        ]
+    )
+    pdf.y -= 6
+    pdf.fields([("Total", format_money(data["Total"]))], size=12)
+
+    pdf.section("Payment details")
+    pdf.fields([
+        ("Account name", data["TutorName"]),
+        ("Account number", data["AccountNumber"]),
+        ("Sort code", data["SortCode"])
+    ])
+    return pdf.to_bytes()
+
+def layout_timetable_pdf(data):
+    pdf = PdfLayout()
+    pdf.heading(f"{data['Name']}'s Timetable")
+    pdf.fields([("Week commencing", data["Week"])])
+
+    days = data["Lessons"][0] if data["Lessons"] else {}
+    for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']:
+        pdf.section(day)
+        pdf.table(
+            [("Time", 0.2, "left"), ("With", 0.4, "left"), ("Location", 0.4, "left")],
+            [[lesson["Time"], lesson["Name"], lesson["Location"]] for lesson in days.get(day, [])]
+        )
+    return pdf.to_bytes()
+
+def layout_attendance_report_pdf(data, attendance_codes):
+    pdf = PdfLayout()
+    pdf.heading("Attendance Report")
+    pdf.fields([
+        ("Student", data["Name"]),
+        ("Period", data["Dates"])
+    ])
+
+    code_keys = {
+        "L": "ArrivedLate",
+        "D": "LeftEarly",
+        "O": "UnauthorisedAbsence",
+        "I": "Illness",
+        "M": "MedicalAppointment",
+        "C": "AuthorisedAbsence",
+        "N": "NoKnownReason",
+        "T": "NotOnTimetable",
+    }
+    for title, items in [
+        ("Lessons", [
+            ("Lessons scheduled", data["LessonsScheduled"]),
+            ("Lessons attended", data["LessonsAttended"]),
+            ("Lessons absent", data["LessonsAbsent"]),
+            ("Attendance rate", f"{data['AttendanceRate']}%"),
+            ("Safeguarding concerns", data["SafeguardingConcerns"])
+        ]),
+        ("Hours", [
+            ("Hours scheduled", data["TotalHours"]),
+            ("Hours attended", data["TotalHoursAttended"]),
+            ("Hours absent or disrupted", data["TotalHoursAbsentDisrupted"]),
+            ("Lesson hours attended", f"{data['TotalLessonHoursAttendedPercent']}%"),
+            ("Average scheduled lesson length", f"{data['AverageScheduledLessonLength']} minutes"),
+            ("Average attended lesson length", f"{data['AverageAttendedLessonLength']} minutes")
+        ]),
+        ("Disruption", [
+            ("Disruption rate", f"{data['DisruptionRate']}%"),
+            ("Disrupted lessons (arrived late)", data["LessonsDisruptedArrivedLate"]),
+            ("Disrupted lessons (left early)", data["LessonsDisruptedLeftEarly"]),
+            ("Average disruption length", f"{data['AverageDisruptionLength']} minutes")
+        ]),
+        ("Attendance codes", [
+            (f"{text} ({code})", data[code_keys[code]]) for code, text in attendance_codes.items()
+        ])
+    ]:
+        pdf.section(title)
+        pdf.table([("", 0.7, "left"), ("", 0.3, "right")], [[label, value] for label, value in items])
+
+    if data.get("FooterMessage"):
+        pdf.y -= 10
+        pdf.paragraph(data["FooterMessage"], size=9)
+    return pdf.to_bytes()
@@ -0,0 +1,51 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# main.py reads its configuration when imported, so the tests give it the minimum it needs and keep it offline
+os.environ.setdefault("FRONTEND_URL", "http://localhost:5173")
+os.environ.setdefault("FLASK_SECRET_KEY", "test-secret")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret-that-is-long-enough")
+os.environ.setdefault("PDF_RENDERER", "stub")
+os.environ.setdefault("PDF_CACHE_MAX_BYTES", "0")
+os.environ.setdefault("MATERIALISE_INTERVAL", "0")
+os.environ.setdefault("DEMO_DB_PREWARM", "0")
+os.environ.setdefault("DEMO_DB_REAP_INTERVAL", "0")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR) # the demo seed is opened by its relative path
+
+@pytest.fixture
+def headers():
+    return {"Origin": os.environ["FRONTEND_URL"], "X-Timezone": "Europe/London"}
+
+@pytest.fixture
+def client():
+    """A test client whose session has its own in-memory copy of the demo seed, dropped afterwards"""
+    import main
+    client = main.app.test_client()
+    client.demo_db_id = uuid.uuid4().hex
+    with client.session_transaction() as client_session:
+        client_session["demo_db_id"] = client.demo_db_id
+    yield client
+    main.materialise_queue.join() # a background run may still be writing to the database
+    main.dispose_demo_db_pool(client.demo_db_id)
+
+@pytest.fixture
+def query(client):
+    """Run SQL directly against the client's demo database and return every row as a dict"""
+    import main
+    def run(sql, parameters=()):
+        connection = main.get_demo_db_pool(client.demo_db_id).acquire()
+        try:
+            cursor = main.get_cursor(connection)
+            cursor.execute(sql, parameters)
+            rows = cursor.fetchall()
+            connection.commit()
+            return [dict(row) for row in rows]
+        finally:
+            connection.close()
+    return run
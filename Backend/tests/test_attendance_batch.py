@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import main
+from main import format_virtual_occurrence_id
+
+def put_attendance(client, headers, entries):
+    return client.put("/demo/lesson_occurrences/attendance", headers=headers, json=entries)
+
+def stored_occurrences(query, count):
+    return [row["id"] for row in query("SELECT id FROM LessonOccurrences ORDER BY id LIMIT ?", (count,))]
+
+def test_each_entry_gets_a_result_and_only_valid_ones_are_written(client, headers, query):
+    first, second, third = stored_occurrences(query, 3)
+    response = put_attendance(client, headers, [
+        {"occurrence_id": first, "attendance_status": "absent", "attendance_code": "I"},
+        {"occurrence_id": second, "attendance_status": "asleep"},
+        {"occurrence_id": third, "attendance_code": "Z", "actual_start_time": "soon"},
+        {"occurrence_id": 99999999, "attendance_status": "present"},
+        {"attendance_status": "present"},
+        {"occurrence_id": first, "attendance_status": "present"},
+        "present",
+    ])
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == ["updated", "error", "error", "error", "error", "error", "error"]
+    assert results[0]["id"] == first
+    assert results[1]["errors"] == ["attendance_status must be one of present, absent, disrupted"]
+    assert results[2]["errors"] == ["attendance_code Z is not a known attendance code", "actual_start_time is not a recognised datetime"]
+    assert results[3]["errors"] == ["lesson occurrence 99999999 does not exist"]
+    assert results[4]["errors"] == ["occurrence_id is required"]
+    assert results[5]["errors"] == ["lesson occurrence appears more than once"]
+    assert results[6]["errors"] == ["entry must be an object"]
+
+    rows = {row["id"]: row for row in query(f"SELECT id, attendance_status, attendance_code FROM LessonOccurrences WHERE id IN ({first}, {second}, {third})")}
+    assert (rows[first]["attendance_status"], rows[first]["attendance_code"]) == ("absent", "I")
+
+def test_missing_keys_keep_their_columns(client, headers, query):
+    occurrence_id, = stored_occurrences(query, 1)
+    assert put_attendance(client, headers, [{"occurrence_id": occurrence_id, "attendance_status": "disrupted", "attendance_code": "L"}]).status_code == 200
+    assert put_attendance(client, headers, [{"occurrence_id": occurrence_id, "actual_start_time": "2025-01-06T10:15:00"}]).status_code == 200
+    row = query("SELECT attendance_status, attendance_code, actual_start_time FROM LessonOccurrences WHERE id = ?", (occurrence_id,))[0]
+    assert (row["attendance_status"], row["attendance_code"], row["actual_start_time"]) == ("disrupted", "L", datetime(2025, 1, 6, 10, 15))
+
+def test_a_batch_with_nothing_valid_writes_nothing(client, headers, query):
+    before = query("SELECT COUNT(*) AS count FROM LessonChanges")[0]["count"]
+    response = put_attendance(client, headers, [{"occurrence_id": 99999999, "attendance_status": "present"}])
+    assert response.status_code == 400
+    assert query("SELECT COUNT(*) AS count FROM LessonChanges")[0]["count"] == before
+
+def test_virtual_occurrences_are_stored_with_their_attendance_or_not_at_all(client, headers, query, monkeypatch):
+    lesson = query("SELECT tutor_id, student_id, subject_id, location_id FROM Lessons ORDER BY id LIMIT 1")[0]
+    first_start = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time()) + timedelta(hours=6)
+    response = client.post("/demo/lessons", headers=headers, json={
+        **lesson,
+        "title": "Weekly",
+        "description": "",
+        "start_time": first_start.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": (first_start + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"),
+        "recurrence_rule": "FREQ=weekly;INTERVAL=1"
+    })
+    assert response.status_code == 200
+    main.materialise_queue.join()
+    lesson_id = query("SELECT MAX(id) AS id FROM Lessons")[0]["id"]
+    virtual_ids = [format_virtual_occurrence_id(lesson_id, first_start + timedelta(weeks=weeks)) for weeks in (40, 41)]
+    count = lambda: query("SELECT COUNT(*) AS count FROM LessonOccurrences WHERE lesson_id = ?", (lesson_id,))[0]["count"]
+    before = count()
+
+    def fail(*args):
+        raise RuntimeError("change log unavailable")
+    with monkeypatch.context() as patch:
+        patch.setattr(main, "record_occurrence_changes", fail) # written after the occurrences are stored
+        response = put_attendance(client, headers, [{"occurrence_id": occurrence_id, "attendance_status": "present"} for occurrence_id in virtual_ids])
+    assert response.status_code == 500
+    assert count() == before
+
+    response = put_attendance(client, headers, [{"occurrence_id": occurrence_id, "attendance_status": "present"} for occurrence_id in virtual_ids])
+    assert response.status_code == 200
+    stored_ids = [result["id"] for result in response.get_json()["results"]]
+    assert count() > before
+    rows = query(f"SELECT start_time, attendance_status FROM LessonOccurrences WHERE id IN ({', '.join('?' * len(stored_ids))}) ORDER BY start_time", tuple(stored_ids))
+    assert [(row["start_time"], row["attendance_status"]) for row in rows] == [(first_start + timedelta(weeks=weeks), "present") for weeks in (40, 41)]
@@ -0,0 +1,62 @@
+import random
+from datetime import datetime, timedelta
+
+import main
+from main import IntervalIndex
+
+def test_overlapping_matches_a_full_scan():
+    generator = random.Random(9)
+    base = datetime(2025, 1, 6, 8)
+    occurrences = []
+    for occurrence_id in range(1, 400):
+        start = base + timedelta(minutes=15 * generator.randrange(2000))
+        occurrences.append((start, start + timedelta(minutes=generator.choice([30, 60, 90, 240])), occurrence_id, occurrence_id % 7))
+    index = IntervalIndex(occurrences, [])
+
+    for _ in range(200):
+        start = base + timedelta(minutes=15 * generator.randrange(2000))
+        end = start + timedelta(minutes=generator.choice([15, 60, 120]))
+        expected = {(occurrence_id, lesson_id) for occurrence_start, occurrence_end, occurrence_id, lesson_id in occurrences
+                    if occurrence_start < end and occurrence_end > start}
+        assert set(index.overlapping(start, end)) == expected
+
+def test_touching_lessons_do_not_overlap():
+    start = datetime(2025, 1, 6, 10)
+    index = IntervalIndex([(start, start + timedelta(hours=1), 1, 1)], [])
+    assert list(index.overlapping(start + timedelta(hours=1), start + timedelta(hours=2))) == []
+    assert list(index.overlapping(start - timedelta(hours=1), start)) == []
+    assert list(index.overlapping(start + timedelta(minutes=59), start + timedelta(hours=2))) == [(1, 1)]
+
+def test_series_past_their_stored_occurrences_clash_with_virtual_ids():
+    # lesson 5 is stored up to 2025-01-27 and carries on weekly after that
+    series_start = datetime(2025, 2, 3, 16)
+    index = IntervalIndex([], [(5, series_start, series_start + timedelta(hours=1), "FREQ=weekly;INTERVAL=1")])
+    clash_start = series_start + timedelta(weeks=10, minutes=30)
+    assert list(index.overlapping(clash_start, clash_start + timedelta(hours=1))) == [("5-202504141600", 5)]
+    assert list(index.overlapping(clash_start + timedelta(days=1), clash_start + timedelta(days=1, hours=1))) == []
+
+def check_clash(client, headers, tutor_id, start, end):
+    response = client.get("/demo/lessons/clash", headers=headers, query_string={
+        "tutor_id": tutor_id,
+        "start_time": start.strftime("%Y-%m-%dT%H:%M:%S"),
+        "end_time": end.strftime("%Y-%m-%dT%H:%M:%S")
+    })
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_cached_indexes_see_new_lessons(client, headers, query):
+    lesson = query("SELECT tutor_id, student_id, subject_id, location_id FROM Lessons ORDER BY id LIMIT 1")[0]
+    start = datetime.combine(datetime.now().date() + timedelta(days=3), datetime.min.time()) + timedelta(hours=7)
+    assert check_clash(client, headers, lesson["tutor_id"], start, start + timedelta(hours=1)) == {"clash": False}
+
+    response = client.post("/demo/lessons", headers=headers, json={
+        **lesson,
+        "title": "Early",
+        "description": "",
+        "start_time": start.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": (start + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"),
+        "recurrence_rule": f"FREQ=daily;INTERVAL=1;UNTIL={start.strftime('%Y-%m-%d')} 23:59:59" # a single occurrence
+    })
+    assert response.status_code == 200
+    main.materialise_queue.join()
+    assert check_clash(client, headers, lesson["tutor_id"], start + timedelta(minutes=30), start + timedelta(hours=2)) == {"clash": True, "clash_count": 1}
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+
+TABLES = ("Lessons", "LessonOccurrences", "Reports", "Invoices", "LessonChanges")
+
+@pytest.fixture
+def ids(query):
+    return {column: query(f"SELECT MIN(id) AS id FROM {table}")[0]["id"] for column, table in main.LESSON_IMPORT_ID_COLUMNS.items()}
+
+def make_row(ids, start, **fields):
+    return {
+        "title": "Imported",
+        "description": "",
+        **ids,
+        "start_time": start.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": (start + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"),
+        **fields
+    }
+
+def count_rows(query):
+    return {table: query(f"SELECT COUNT(*) AS count FROM {table}")[0]["count"] for table in TABLES}
+
+# early in the morning, a year out, so that the rows never clash with the demo lessons
+FIRST_START = datetime.combine(datetime.now().date() + timedelta(days=365), datetime.min.time()) + timedelta(hours=5)
+
+def test_invalid_rows_are_all_reported_and_nothing_is_saved(client, headers, query, ids):
+    before = count_rows(query)
+    response = client.post("/demo/lessons/import", headers=headers, json=[
+        make_row(ids, FIRST_START),
+        make_row(ids, FIRST_START + timedelta(days=1), tutor_id=999999),
+        make_row(ids, FIRST_START + timedelta(days=2), end_time=FIRST_START.strftime("%Y-%m-%d %H:%M:%S")),
+        make_row(ids, FIRST_START + timedelta(days=3), recurrence_rule="FREQ=hourly;INTERVAL=1", title=""),
+        make_row(ids, FIRST_START + timedelta(days=4), start_time="next tuesday"),
+    ])
+    assert response.status_code == 400
+    errors = {error["row"]: error["errors"] for error in response.get_json()["errors"]}
+    assert sorted(errors) == [2, 3, 4, 5]
+    assert errors[2] == ["tutor_id 999999 does not exist"]
+    assert errors[3] == ["end_time must be after start_time"]
+    assert errors[4] == ["title is required", "recurrence_rule is not a valid daily, weekly or monthly rule"]
+    assert errors[5] == ["start_time is missing or not a recognised datetime"]
+    assert count_rows(query) == before
+
+def test_rows_clashing_with_each_other_are_rejected_unless_allowed(client, headers, query, ids):
+    rows = [make_row(ids, FIRST_START), make_row(ids, FIRST_START + timedelta(minutes=30))]
+    before = count_rows(query)
+    response = client.post("/demo/lessons/import", headers=headers, json=rows)
+    assert response.status_code == 400
+    assert {error["row"] for error in response.get_json()["errors"]} == {1, 2}
+    assert count_rows(query) == before
+
+    response = client.post("/demo/lessons/import?allow_clashes=true", headers=headers, json=rows)
+    assert response.status_code == 200
+    assert count_rows(query)["Lessons"] == before["Lessons"] + 2
+
+def test_dry_run_validates_without_saving(client, headers, query, ids):
+    before = count_rows(query)
+    response = client.post("/demo/lessons/import", headers=headers, json={"lessons": [make_row(ids, FIRST_START)], "dry_run": True})
+    assert response.status_code == 200
+    assert count_rows(query) == before
+
+def test_csv_import_stores_series_with_reports(client, headers, query, ids):
+    row = make_row(ids, FIRST_START, recurrence_rule=f"FREQ=weekly;INTERVAL=1;UNTIL={(FIRST_START + timedelta(weeks=3)).strftime('%Y-%m-%d %H:%M:%S')}")
+    body = ",".join(row) + "\n" + ",".join(str(value) for value in row.values()) + "\n"
+    response = client.post("/demo/lessons/import", headers=headers, data=body, content_type="text/csv")
+    assert response.status_code == 200
+    lesson_id = response.get_json()["lesson_ids"][0]
+    occurrences = query("SELECT lo.id, r.id AS report_id FROM LessonOccurrences lo LEFT JOIN Reports r ON r.lesson_occurrence_id = lo.id WHERE lo.lesson_id = ?", (lesson_id,))
+    assert len(occurrences) == 4
+    assert all(occurrence["report_id"] for occurrence in occurrences)
+
+def test_a_failure_while_storing_rolls_back_every_row(client, headers, query, ids, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("change log unavailable")
+    monkeypatch.setattr(main, "record_lesson_changes", fail) # the last write of an import
+    before = count_rows(query)
+    response = client.post("/demo/lessons/import", headers=headers, json=[
+        make_row(ids, FIRST_START, recurrence_rule="FREQ=weekly;INTERVAL=1"),
+        make_row(ids, FIRST_START + timedelta(days=1)),
+    ])
+    assert response.status_code == 500
+    assert count_rows(query) == before
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import main
+from main import is_virtual_occurrence_id
+
+def get_window(client, headers, start, end, **params):
+    response = client.get("/demo/lessons/admin", headers=headers, query_string={
+        "start": start.strftime("%Y-%m-%dT%H:%M:%S"),
+        "end": end.strftime("%Y-%m-%dT%H:%M:%S"),
+        **params
+    })
+    assert response.status_code == 200
+    return response.get_json()
+
+def add_daily_lessons(client, headers, query, count):
+    lesson = query("SELECT tutor_id, student_id, subject_id, location_id FROM Lessons ORDER BY id LIMIT 1")[0]
+    first_start = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    for index in range(count):
+        start = first_start + timedelta(hours=9 + index % 3) # some lessons share a start time
+        response = client.post("/demo/lessons", headers=headers, json={
+            **lesson,
+            "title": f"Daily {index}",
+            "description": "",
+            "start_time": start.strftime("%Y-%m-%d %H:%M:%S"),
+            "end_time": (start + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"),
+            "recurrence_rule": "FREQ=daily;INTERVAL=1"
+        })
+        assert response.status_code == 200
+    main.materialise_queue.join()
+
+def test_pages_cover_the_window_once_in_order(client, headers, query):
+    add_daily_lessons(client, headers, query, 4)
+    # the window straddles the materialiser's horizon, so it holds both stored and virtual occurrences
+    horizon = datetime.now() + timedelta(days=main.MATERIALISE_HORIZON_DAYS)
+    start, end = horizon - timedelta(days=3), horizon + timedelta(days=3)
+    everything = get_window(client, headers, start, end)
+    assert everything["next_cursor"] is None
+    expected = [lesson["id"] for lesson in everything["lessons"]]
+    assert any(is_virtual_occurrence_id(occurrence_id) for occurrence_id in expected)
+    assert any(not is_virtual_occurrence_id(occurrence_id) for occurrence_id in expected)
+
+    paged = []
+    after = None
+    while True:
+        page = get_window(client, headers, start, end, limit=7, **({"after": after} if after else {}))
+        assert len(page["lessons"]) <= 7
+        paged += [lesson["id"] for lesson in page["lessons"]]
+        after = page["next_cursor"]
+        if after is None:
+            break
+    assert paged == expected
+
+def test_limit_without_more_rows_has_no_cursor(client, headers):
+    start = datetime(2025, 3, 3)
+    everything = get_window(client, headers, start, start + timedelta(days=7))
+    count = len(everything["lessons"])
+    assert count > 0
+    assert get_window(client, headers, start, start + timedelta(days=7), limit=count)["next_cursor"] is None
+    assert get_window(client, headers, start, start + timedelta(days=7), limit=count - 1)["next_cursor"] is not None
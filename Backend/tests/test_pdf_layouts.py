@@ -0,0 +1,83 @@
+import re
+
+import pytest
+
+from pdf_layouts import PdfLayout, layout_report_pdf, layout_invoice_pdf, layout_timetable_pdf, layout_attendance_report_pdf
+
+ATTENDANCE_CODES = {"L": "Arrived late", "D": "Left early", "O": "Unauthorised absence", "I": "Illness",
+                    "M": "Medical appointment", "C": "Authorised absence", "N": "No known reason", "T": "Not on timetable"}
+
+REPORT = {
+    "StudentName": "Ada Lovelace",
+    "TutorName": "Charles Babbage",
+    "CurrentDate": "02/06/2025",
+    "TotalHours": "1.5",
+    "Lessons": [{"DateTime": "Mon 02/06/2025 16:00 - 17:30", "AttendanceStatus": "Present"}],
+    "RiskNotification": "None",
+    "AbsenceNotification": None,
+    **{key: [{"Date": "02/06/2025", "Details": f"{key} (notes)"}] for key in ["Curriculum", "Aims", "Overview", "Planning", "Feedback"]},
+}
+
+INVOICE = {
+    "InvoiceNumber": "00042",
+    "TutorName": "Charles Babbage",
+    "CurrentDate": "02/06/2025",
+    "Lessons": [{"StudentName": "Ada Lovelace", "Date": "02/06/2025", "Time": "16:00 - 17:30", "Hours": "1.5", "Rate": 20, "Subtotal": 30}],
+    "Total": 30,
+    "AccountNumber": "12345678",
+    "SortCode": "12-34-56",
+}
+
+TIMETABLE = {
+    "Name": "Ada",
+    "Week": "02/06/2025",
+    "Lessons": [{"Monday": [{"Time": "16:00 - 17:30", "Name": "Charles Babbage", "Location": "Library"}]}],
+}
+
+ATTENDANCE_REPORT = {
+    "Name": "Ada Lovelace",
+    "Dates": "01/01/2025 - 30/06/2025",
+    "LessonsScheduled": 10, "LessonsAttended": 8, "LessonsAbsent": 2, "AttendanceRate": 80, "SafeguardingConcerns": 0,
+    "TotalHours": 15, "TotalHoursAttended": 12, "TotalHoursAbsentDisrupted": 3, "TotalLessonHoursAttendedPercent": 80,
+    "AverageScheduledLessonLength": 90, "AverageAttendedLessonLength": 85,
+    "DisruptionRate": 10, "LessonsDisruptedArrivedLate": 1, "LessonsDisruptedLeftEarly": 0, "AverageDisruptionLength": 15,
+    "ArrivedLate": 1, "LeftEarly": 0, "UnauthorisedAbsence": 1, "Illness": 1, "MedicalAppointment": 0,
+    "AuthorisedAbsence": 0, "NoKnownReason": 0, "NotOnTimetable": 0,
+    "FooterMessage": "Generated for testing",
+}
+
+def assert_valid_pdf(pdf):
+    assert pdf.startswith(b"%PDF-1.4\n")
+    assert pdf.endswith(b"%%EOF\n")
+    assert b"\ntrailer\n" in pdf
+    # startxref must point at the cross-reference table, whose entries point at each object
+    xref_offset = int(re.search(rb"startxref\n(\d+)\n%%EOF", pdf).group(1))
+    assert pdf[xref_offset:].startswith(b"xref\n")
+    entries = re.findall(rb"(\d{10}) 00000 n ", pdf[xref_offset:])
+    assert entries
+    for number, offset in enumerate(entries, start=1):
+        assert pdf[int(offset):].startswith(f"{number} 0 obj".encode())
+
+@pytest.mark.parametrize("layout, data", [
+    (layout_report_pdf, REPORT),
+    (layout_invoice_pdf, INVOICE),
+    (layout_timetable_pdf, TIMETABLE),
+    (lambda data: layout_attendance_report_pdf(data, ATTENDANCE_CODES), ATTENDANCE_REPORT),
+], ids=["report", "invoice", "timetable", "attendance-report"])
+def test_layouts_render_valid_pdfs(layout, data):
+    pdf = layout(data)
+    assert_valid_pdf(pdf)
+    assert b"/Type /Page " in pdf
+
+def test_long_tables_flow_onto_numbered_pages():
+    pdf = layout_invoice_pdf({**INVOICE, "Lessons": INVOICE["Lessons"] * 200})
+    assert_valid_pdf(pdf)
+    pages = pdf.count(b"/Type /Page ")
+    assert pages > 1
+    assert f"Page {pages} of {pages}".encode() in pdf
+
+def test_wrap_breaks_long_words_to_fit():
+    layout = PdfLayout()
+    lines = layout.wrap("x" * 500 + " end", 100, 10)
+    assert len(lines) > 1
+    assert all(PdfLayout.text_width(line, 10) <= 100 for line in lines)
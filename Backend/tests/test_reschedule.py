@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import main
+from main import format_virtual_occurrence_id
+
+def add_weekly_lesson(client, headers, query, first_start, weeks):
+    lesson = query("SELECT tutor_id, student_id, subject_id, location_id FROM Lessons ORDER BY id LIMIT 1")[0]
+    response = client.post("/demo/lessons", headers=headers, json={
+        **lesson,
+        "title": "Weekly",
+        "description": "",
+        "start_time": first_start.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": (first_start + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"),
+        "recurrence_rule": f"FREQ=weekly;INTERVAL=1;UNTIL={(first_start + timedelta(weeks=weeks - 1)).strftime('%Y-%m-%d %H:%M:%S')}"
+    })
+    assert response.status_code == 200
+    main.materialise_queue.join()
+    return query("SELECT MAX(id) AS id FROM Lessons")[0]["id"]
+
+def series_state(query, lesson_id):
+    occurrences = query("SELECT id, start_time, end_time, invoice_id FROM LessonOccurrences WHERE lesson_id = ? ORDER BY id", (lesson_id,))
+    lesson = query("SELECT start_time, end_time, extended_until FROM Lessons WHERE id = ?", (lesson_id,))[0]
+    return occurrences, lesson
+
+# a Monday in the past, so every occurrence of the series is stored
+FIRST_START = datetime(2025, 1, 6, 16)
+
+def test_shift_moves_every_occurrence_and_the_lesson(client, headers, query):
+    lesson_id = add_weekly_lesson(client, headers, query, FIRST_START, 8)
+    occurrences, _ = series_state(query, lesson_id)
+    response = client.put(f"/demo/lessons/{lesson_id}/reschedule", headers=headers, json={"shift_minutes": 30})
+    assert response.status_code == 200
+    assert response.get_json()["occurrences_moved"] == 8
+
+    moved, lesson = series_state(query, lesson_id)
+    assert [occurrence["start_time"] for occurrence in moved] == [occurrence["start_time"] + timedelta(minutes=30) for occurrence in occurrences]
+    assert [occurrence["end_time"] for occurrence in moved] == [occurrence["end_time"] + timedelta(minutes=30) for occurrence in occurrences]
+    assert lesson["start_time"] == FIRST_START + timedelta(minutes=30)
+
+def test_weekday_move_from_an_occurrence_onwards(client, headers, query):
+    lesson_id = add_weekly_lesson(client, headers, query, FIRST_START, 6)
+    occurrences, _ = series_state(query, lesson_id)
+    response = client.put(f"/demo/lessons/{lesson_id}/reschedule", headers=headers, json={"weekday": 3, "lesson_occurrence_id": occurrences[2]["id"]})
+    assert response.status_code == 200
+    moved, _ = series_state(query, lesson_id)
+    assert [occurrence["start_time"].weekday() for occurrence in moved] == [0, 0, 3, 3, 3, 3]
+
+def test_invalid_requests_are_rejected(client, headers, query):
+    lesson_id = add_weekly_lesson(client, headers, query, FIRST_START, 4)
+    for body in ({}, {"shift_minutes": 0}, {"shift_minutes": 30, "weekday": 1}, {"weekday": 7}, {"shift_minutes": True}):
+        assert client.put(f"/demo/lessons/{lesson_id}/reschedule", headers=headers, json=body).status_code == 400
+    missing = format_virtual_occurrence_id(lesson_id, FIRST_START + timedelta(hours=1)) # not a start time of the series
+    assert client.put(f"/demo/lessons/{lesson_id}/reschedule", headers=headers, json={"shift_minutes": 30, "lesson_occurrence_id": missing}).status_code == 404
+
+def test_a_failure_leaves_the_series_untouched(client, headers, query, monkeypatch):
+    lesson_id = add_weekly_lesson(client, headers, query, FIRST_START, 8)
+    before = series_state(query, lesson_id)
+    changes = query("SELECT COUNT(*) AS count FROM LessonChanges")[0]["count"]
+
+    def fail(*args):
+        raise RuntimeError("invoices unavailable")
+    monkeypatch.setattr(main, "reassign_occurrence_invoices", fail) # runs after both UPDATEs
+    response = client.put(f"/demo/lessons/{lesson_id}/reschedule", headers=headers, json={"shift_minutes": 24 * 60})
+    assert response.status_code == 500
+    assert series_state(query, lesson_id) == before
+    assert query("SELECT COUNT(*) AS count FROM LessonChanges")[0]["count"] == changes
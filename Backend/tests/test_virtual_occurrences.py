@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import main
+from main import expand_recurrence, format_virtual_occurrence_id, is_virtual_occurrence_id, parse_virtual_occurrence_id, occurrence_sort_key
+
+def test_weekly_series_jumps_to_the_window():
+    start = datetime(2025, 1, 6, 10)
+    occurrences = list(expand_recurrence(start, start + timedelta(hours=1), "FREQ=weekly;INTERVAL=1", datetime(2025, 2, 1), datetime(2025, 3, 1)))
+    assert [occurrence_start for occurrence_start, _ in occurrences] == [datetime(2025, 2, 3, 10), datetime(2025, 2, 10, 10), datetime(2025, 2, 17, 10), datetime(2025, 2, 24, 10)]
+    assert all(occurrence_end - occurrence_start == timedelta(hours=1) for occurrence_start, occurrence_end in occurrences)
+
+def test_until_date_is_inclusive():
+    start = datetime(2025, 1, 6, 10)
+    occurrences = list(expand_recurrence(start, start + timedelta(hours=1), "FREQ=daily;INTERVAL=2;UNTIL=2025-01-10 00:00:00", start, datetime(2025, 2, 1)))
+    assert [occurrence_start.day for occurrence_start, _ in occurrences] == [6, 8, 10]
+
+def test_monthly_series_steps_one_month_at_a_time():
+    start = datetime(2025, 1, 15, 9)
+    occurrences = list(expand_recurrence(start, start + timedelta(hours=1), "FREQ=monthly;INTERVAL=1", datetime(2025, 2, 1), datetime(2025, 4, 1)))
+    assert [occurrence_start for occurrence_start, _ in occurrences] == [datetime(2025, 2, 15, 9), datetime(2025, 3, 15, 9)]
+
+def test_unknown_frequency_has_no_occurrences():
+    start = datetime(2025, 1, 6, 10)
+    assert list(expand_recurrence(start, start + timedelta(hours=1), "FREQ=yearly;INTERVAL=1", start, datetime(2026, 1, 1))) == []
+
+def test_virtual_ids_round_trip():
+    occurrence_id = format_virtual_occurrence_id(42, datetime(2025, 3, 4, 16, 30))
+    assert occurrence_id == "42-202503041630"
+    assert is_virtual_occurrence_id(occurrence_id)
+    assert parse_virtual_occurrence_id(occurrence_id) == (42, datetime(2025, 3, 4, 16, 30))
+    assert not is_virtual_occurrence_id(42)
+    assert not is_virtual_occurrence_id("42")
+
+def test_stored_occurrences_sort_before_virtual_ones():
+    start = datetime(2025, 3, 4, 16, 30)
+    keys = [occurrence_sort_key(start, "7-202503041630"), occurrence_sort_key(start, 900), occurrence_sort_key(start - timedelta(minutes=1), "9-202503041629")]
+    assert sorted(keys) == [keys[2], keys[1], keys[0]]
+
+def add_weekly_lesson(client, headers, query, first_start):
+    lesson = query("SELECT tutor_id, student_id, subject_id, location_id FROM Lessons ORDER BY id LIMIT 1")[0]
+    response = client.post("/demo/lessons", headers=headers, json={
+        **lesson,
+        "title": "Weekly",
+        "description": "",
+        "start_time": first_start.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": (first_start + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"),
+        "recurrence_rule": "FREQ=weekly;INTERVAL=1"
+    })
+    assert response.status_code == 200
+    main.materialise_queue.join()
+    return query("SELECT MAX(id) AS id FROM Lessons")[0]["id"]
+
+def count_rows(query):
+    return [query(f"SELECT COUNT(*) AS count FROM {table}")[0]["count"] for table in ("LessonOccurrences", "Reports", "LessonChanges")]
+
+def test_virtual_report_is_read_without_writing(client, headers, query):
+    first_start = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time()) + timedelta(hours=10)
+    lesson_id = add_weekly_lesson(client, headers, query, first_start)
+    occurrence_id = format_virtual_occurrence_id(lesson_id, first_start + timedelta(weeks=52)) # past the stored horizon
+    before = count_rows(query)
+
+    response = client.get(f"/demo/lessons/{occurrence_id}/report", headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["id"] is None
+    assert response.get_json()["title"] == "New Report"
+    assert count_rows(query) == before
+
+    # a start time the series doesn't have
+    assert client.get(f"/demo/lessons/{lesson_id}-{(first_start + timedelta(weeks=52, hours=1)).strftime('%Y%m%d%H%M')}/report", headers=headers).status_code == 400
+
+def test_saving_a_virtual_report_stores_its_occurrence(client, headers, query):
+    first_start = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time()) + timedelta(hours=10)
+    lesson_id = add_weekly_lesson(client, headers, query, first_start)
+    occurrence_id = format_virtual_occurrence_id(lesson_id, first_start + timedelta(weeks=52))
+    report = client.get(f"/demo/lessons/{occurrence_id}/report", headers=headers).get_json()
+    before = count_rows(query)
+
+    # a failing save leaves neither the occurrence nor its report behind
+    response = client.put(f"/demo/lessons/{occurrence_id}/report", headers=headers, json={"status": "incomplete", "content": [{"id": 1}]})
+    assert response.status_code == 500
+    assert count_rows(query) == before
+
+    question = report["content"][0]
+    response = client.put(f"/demo/lessons/{occurrence_id}/report", headers=headers, json={"status": "incomplete", "content": [{**question, "answer_text": "Covered fractions"}]})
+    assert response.status_code == 200
+    report_id = response.get_json()["id"]
+    stored = query("SELECT lo.id, lo.start_time FROM Reports r JOIN LessonOccurrences lo ON lo.id = r.lesson_occurrence_id WHERE r.id = ?", (report_id,))
+    assert stored and stored[0]["start_time"] == first_start + timedelta(weeks=52)
+
+    # the virtual id keeps resolving to the stored occurrence
+    report = client.get(f"/demo/lessons/{occurrence_id}/report", headers=headers).get_json()
+    assert report["id"] == report_id
+    assert report["status"] == "incomplete"
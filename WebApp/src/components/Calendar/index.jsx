@@ -23,6 +23,15 @@ const verifyMatchesFilter = (lesson, selectedFilters) => {
   );
 };
 
+// occurrences beyond the stored schedule have ids like "<lesson_id>-<YYYYmmddHHMM>" (UTC) and are
+// given a numeric id once stored, so a link to one still finds it by its lesson and start time
+const matchesOccurrenceId = (lesson, lessonOccurrenceId) =>
+  String(lesson.id) === lessonOccurrenceId ||
+  `${lesson.lesson_id}-${lesson.start_time
+    .toISOString()
+    .slice(0, 16)
+    .replace(/[-T:]/g, "")}` === lessonOccurrenceId;
+
 const getTimeZoneAbbreviation = (date) => {
   const formatter = new Intl.DateTimeFormat("en-GB", {
     timeZone: "Europe/London",
@@ -279,8 +288,8 @@ export default function Calendar({
 
       if (lessonOccurrenceId) {
         // if lessonOccurrenceId param is set
-        const currentLesson = lessonsData.find(
-          (lesson) => lesson.id === parseInt(lessonOccurrenceId)
+        const currentLesson = lessonsData.find((lesson) =>
+          matchesOccurrenceId(lesson, lessonOccurrenceId)
         );
         if (currentLesson)
           setSelectedLesson((prevData) => ({ ...prevData, ...currentLesson }));
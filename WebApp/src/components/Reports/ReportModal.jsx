@@ -435,7 +435,7 @@ export default function ReportModal({
 ReportModal.propTypes = {
   onClose: PropTypes.func,
   open: PropTypes.bool,
-  lessonOccurrenceId: PropTypes.number,
+  lessonOccurrenceId: PropTypes.oneOfType([PropTypes.number, PropTypes.string]),
   role: PropTypes.string,
   studentId: PropTypes.number,
   data: PropTypes.object,
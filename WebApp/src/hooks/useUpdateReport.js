@@ -24,6 +24,9 @@ const updateReport = async ({
     let response;
     if (data.report_ids?.length > 0) {
       response = await api.put("/reports", data);
+    } else if (reportId == null && lessonOccurrenceId) {
+      // a lesson that isn't stored yet has no report id, its report is created when first saved
+      response = await api.put(`/lessons/${lessonOccurrenceId}/report`, data);
     } else {
       response = await api.put(`/reports/${reportId}`, data);
     }
@@ -43,7 +46,7 @@ const useUpdateReport = () => {
 
   return useMutation(updateReport, {
     onSuccess: (success, data) => {
-      if (data.updateStatus) {
+      if (data.updateStatus || data.reportId == null) {
         // Invalidate related queries after successful update
         queryClient.invalidateQueries([
           "lesson--report",